@@ -0,0 +1,86 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from benchmarks.operations import OPERATIONS
+from benchmarks.runner import BenchmarkError, compare, load_baseline, measure, save_baseline
+from benchmarks.seed import SCALES, seed
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic social graph in a throwaway test database, run the GraphQL "
+        "operations against it and fail when they regress against the stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Preset size of the seeded graph')
+        for field in SCALES['small']._fields:
+            parser.add_argument(f"--{field.replace('_', '-')}", type=int, dest=field, help='Override the preset')
+        parser.add_argument('--operation', action='append', dest='operations', help='Only run this operation (repeatable)')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed runs per operation')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs per operation before measuring')
+        parser.add_argument('--tolerance', type=float, default=1.0, help='Allowed latency and memory growth, 1.0 = 100%%; timings are noisy')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline')
+
+    def handle(self, *args, **options):
+        scale = SCALES[options['scale']]
+        overrides = {field: options[field] for field in scale._fields if options[field] is not None}
+        scale = scale._replace(**overrides)
+        # Custom sizes get their own baseline entry
+        scale_name = options['scale'] if not overrides else '-'.join(str(value) for value in scale)
+
+        operations = OPERATIONS
+        if options['operations']:
+            unknown = set(options['operations']) - {operation.name for operation in OPERATIONS}
+            if unknown:
+                raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+            operations = [operation for operation in OPERATIONS if operation.name in options['operations']]
+
+        # Keep seeded suggestions and rankings out of the real caches as well as the real database
+        local_caches = {
+            alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'benchmark-{alias}'}
+            for alias in settings.CACHES
+        }
+        with override_settings(CACHES=local_caches):
+            results = self.run_operations(scale, scale_name, operations, options)
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], scale_name, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline for {scale_name} written to {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'], scale_name)
+        if not baseline:
+            self.stdout.write(self.style.WARNING(f"No baseline for {scale_name}, run with --update-baseline to store one"))
+            return
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Benchmark regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run_operations(self, scale, scale_name, operations, options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write(f"Seeding {scale_name}: {scale}")
+            seeded = seed(scale)
+            results = {}
+            for operation in operations:
+                try:
+                    results[operation.name] = measure(operation, seeded, options['iterations'], options['warmup'])
+                except BenchmarkError as e:
+                    raise CommandError(str(e))
+                metrics = results[operation.name]
+                self.stdout.write(
+                    f"{operation.name:<24} {metrics['queries']:>4} queries  p50 {metrics['p50_ms']:>9.2f} ms  "
+                    f"p99 {metrics['p99_ms']:>9.2f} ms  async p50 {metrics['async_p50_ms']:>9.2f} ms  "
+                    f"p99 {metrics['async_p99_ms']:>9.2f} ms  peak {metrics['peak_kib']:>9.1f} KiB"
+                )
+            return results
+        finally:
+            teardown_databases(old_config, verbosity=0)
@@ -0,0 +1,74 @@
+"""
+The GraphQL operations the benchmark runs, as clients send them.
+
+variables maps the Seeded objects to the operation's variables.
+"""
+from collections import namedtuple
+
+Operation = namedtuple('Operation', ['name', 'query', 'variables'])
+
+POST_FIELDS = 'id content likesCount commentsCount isLiked createdAt user { id username }'
+
+OPERATIONS = [
+    Operation(
+        'feed',
+        f'{{ feed {{ {POST_FIELDS} }} }}',
+        lambda seeded: {},
+    ),
+    Operation(
+        'feedConnection',
+        f'query {{ feedConnection(first: 20) {{ edges {{ node {{ {POST_FIELDS} }} }} pageInfo {{ hasNextPage endCursor }} }} }}',
+        lambda seeded: {},
+    ),
+    Operation(
+        'feedRanked',
+        f'query {{ feedConnection(order: RANKED, first: 20) {{ edges {{ node {{ {POST_FIELDS} }} }} }} }}',
+        lambda seeded: {},
+    ),
+    Operation(
+        'userProfile',
+        '''query($username: String) {
+            userProfile(username: $username) {
+                bio followersCount followingCount isFollowing followsYou
+                user { username firstName lastName }
+                followers(first: 20) { edges { node { username isFollowing followsYou } } }
+                following(first: 20) { edges { node { username isFollowing followsYou } } }
+            }
+        }''',
+        lambda seeded: {'username': seeded.author.username},
+    ),
+    Operation(
+        'userPostsConnection',
+        f'''query($username: String!) {{
+            userPostsConnection(username: $username, first: 20) {{ edges {{ node {{ {POST_FIELDS} }} }} }}
+        }}''',
+        lambda seeded: {'username': seeded.author.username},
+    ),
+    Operation(
+        'postCommentsConnection',
+        '''query($postId: ID!) {
+            postCommentsConnection(postId: $postId, first: 20) { edges { node { content createdAt user { username } } } }
+        }''',
+        lambda seeded: {'postId': seeded.post.id},
+    ),
+    Operation(
+        'users',
+        'query { users(first: 20) { edges { node { username isFollowing followsYou } } } }',
+        lambda seeded: {},
+    ),
+    Operation(
+        'suggestedUsers',
+        'query { suggestedUsers(first: 10) { username isFollowing followsYou } }',
+        lambda seeded: {},
+    ),
+    Operation(
+        'searchUsers',
+        'query { searchUsers(query: "bench1", first: 20) { edges { node { username isFollowing } } } }',
+        lambda seeded: {},
+    ),
+    Operation(
+        'searchPosts',
+        f'query {{ searchPosts(query: "coffee sunset", first: 20) {{ edges {{ node {{ {POST_FIELDS} }} }} }} }}',
+        lambda seeded: {},
+    ),
+]
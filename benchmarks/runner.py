@@ -0,0 +1,158 @@
+"""
+Measure the benchmark operations and compare them with a stored baseline.
+
+Each operation is executed against social_media_project.schema.schema with
+a fresh request per run, as the GraphQL view would, and reports:
+- queries: SQL queries of one run
+- p50_ms / p99_ms: latency percentiles over the timed runs
+- async_p50_ms / async_p99_ms: the same under async execution, as
+  AsyncSocialGraphQLView runs queries, timed inside one event loop
+- peak_kib: peak memory allocated during one run, traced with tracemalloc
+"""
+import gc
+import json
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from social_media_project.schema import schema
+from utils.async_execution import SyncResolverMiddleware
+
+# Latency and memory vary between runs and machines, so they may grow by the
+# tolerance or by this absolute slack, whichever is larger. Query counts must not grow at all.
+SLACK = {'p50_ms': 2.0, 'p99_ms': 10.0, 'async_p50_ms': 2.0, 'async_p99_ms': 10.0, 'peak_kib': 64.0}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _request(seeded):
+    request = RequestFactory().post('/graphql/')
+    request.user = seeded.viewer
+    return request
+
+
+def _check(operation, result):
+    if result.errors:
+        raise BenchmarkError(f"{operation.name} failed: {result.errors[0]}")
+    return result
+
+
+def execute(operation, seeded):
+    result = schema.execute(operation.query, variable_values=operation.variables(seeded), context_value=_request(seeded))
+    return _check(operation, result)
+
+
+async def execute_async(operation, seeded):
+    result = await schema.execute_async(
+        operation.query,
+        variable_values=operation.variables(seeded),
+        context_value=_request(seeded),
+        middleware=[SyncResolverMiddleware()],
+    )
+    return _check(operation, result)
+
+
+async def _time_async(operation, seeded, iterations, warmup):
+    for _ in range(warmup):
+        await execute_async(operation, seeded)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await execute_async(operation, seeded)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def measure(operation, seeded, iterations=50, warmup=2):
+    """Run operation and return its metrics"""
+    for _ in range(warmup):
+        execute(operation, seeded)
+
+    with CaptureQueriesContext(connection) as queries:
+        execute(operation, seeded)
+
+    # As timeit does, keep garbage collection pauses out of the timings
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            execute(operation, seeded)
+            timings.append((time.perf_counter() - started) * 1000)
+        async_timings = async_to_sync(_time_async)(operation, seeded, iterations, warmup)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        execute(operation, seeded)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'queries': len(queries.captured_queries),
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'async_p50_ms': round(_percentile(async_timings, 50), 3),
+        'async_p99_ms': round(_percentile(async_timings, 99), 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a message for every metric that regressed: any increase in
+    queries, or timings and memory more than tolerance (1.0 = 100%) over baseline.
+    Async execution must also stay within tolerance of the sync run's p50.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        limit = max(metrics['p50_ms'] * (1 + tolerance), metrics['p50_ms'] + SLACK['p50_ms'])
+        if metrics['async_p50_ms'] > limit:
+            regressions.append(f"{name}: async_p50_ms {metrics['async_p50_ms']}, sync p50 {metrics['p50_ms']} (up to {limit:.1f} allowed)")
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if metrics['queries'] > expected['queries']:
+            regressions.append(f"{name}: {metrics['queries']} queries, baseline {expected['queries']}")
+        for metric, slack in SLACK.items():
+            if metric not in expected:
+                continue
+            limit = max(expected[metric] * (1 + tolerance), expected[metric] + slack)
+            if metrics[metric] > limit:
+                regressions.append(f"{name}: {metric} {metrics[metric]}, baseline {expected[metric]} (up to {limit:.1f} allowed)")
+    return regressions
+
+
+def load_baseline(path, scale_name):
+    try:
+        with open(path) as f:
+            return json.load(f).get(scale_name, {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, scale_name, results):
+    try:
+        with open(path) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    baselines[scale_name] = results
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
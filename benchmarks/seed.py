@@ -0,0 +1,107 @@
+"""
+Synthetic social graphs for benchmarking.
+
+Everything is written with bulk_create, so seeding skips the signals and
+denormalized counters the mutations maintain; counters are recomputed with
+reconcile_counters and suggestions with the follow graph afterwards. The
+viewer's feed ranking is built up front, as the background refresh would.
+"""
+import io
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+
+from posts.models import Comment, Like, Post
+from posts.ranking import refresh_ranking
+from users.models import Follow, User, UserProfile
+from users.suggestions import FollowGraph, store_suggestions
+
+Scale = namedtuple('Scale', ['users', 'follows_per_user', 'posts_per_user', 'likes_per_post', 'comments_per_post'])
+
+SCALES = {
+    'small': Scale(users=200, follows_per_user=20, posts_per_user=5, likes_per_post=3, comments_per_post=2),
+    'medium': Scale(users=2000, follows_per_user=50, posts_per_user=10, likes_per_post=5, comments_per_post=3),
+    'large': Scale(users=20000, follows_per_user=100, posts_per_user=20, likes_per_post=10, comments_per_post=5),
+}
+
+# Words post content is drawn from, so searches have matches at every scale
+WORDS = [
+    'coffee', 'travel', 'music', 'garden', 'python', 'sunset', 'football', 'recipe',
+    'photo', 'weekend', 'mountain', 'concert', 'library', 'bicycle', 'ocean', 'market',
+]
+
+# Objects the benchmark operations refer to
+Seeded = namedtuple('Seeded', ['viewer', 'author', 'post'])
+
+BATCH_SIZE = 1000
+
+
+def seed(scale, random_seed=0):
+    """Fill the database with a graph of the given Scale; returns the Seeded objects"""
+    rng = random.Random(random_seed)
+    password = make_password(None)
+
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'bench{i}',
+                email=f'bench{i}@example.com',
+                first_name='Bench',
+                last_name=f'User {i}',
+                password=password,
+            )
+            for i in range(scale.users)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True))
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id, bio=' '.join(rng.sample(WORDS, 3))) for user_id in user_ids],
+        batch_size=BATCH_SIZE,
+    )
+
+    follows = []
+    follows_per_user = min(scale.follows_per_user, len(user_ids) - 1)
+    for user_id in user_ids:
+        others = rng.sample(user_ids, follows_per_user + 1)
+        follows.extend(Follow(follower_id=user_id, following_id=other) for other in others if other != user_id)
+    Follow.objects.bulk_create(follows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    Post.objects.bulk_create(
+        [
+            Post(user_id=user_id, content=' '.join(rng.choices(WORDS, k=8)))
+            for user_id in user_ids
+            for _ in range(scale.posts_per_user)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    post_ids = list(Post.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
+
+    likes_per_post = min(scale.likes_per_post, len(user_ids))
+    Like.objects.bulk_create(
+        [
+            Like(post_id=post_id, user_id=user_id)
+            for post_id in post_ids
+            for user_id in rng.sample(user_ids, likes_per_post)
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    Comment.objects.bulk_create(
+        [
+            Comment(post_id=post_id, user_id=rng.choice(user_ids), content=' '.join(rng.choices(WORDS, k=5)))
+            for post_id in post_ids
+            for _ in range(scale.comments_per_post)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    call_command('reconcile_counters', stdout=io.StringIO())
+    store_suggestions(FollowGraph.load())
+
+    viewer = User.objects.get(id=user_ids[0])
+    refresh_ranking(viewer)
+    author = User.objects.get(id=viewer.following.values_list('following_id', flat=True).first())
+    return Seeded(viewer=viewer, author=author, post=author.posts.first())
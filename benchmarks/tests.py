@@ -0,0 +1,41 @@
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .management.commands.benchmark import DEFAULT_BASELINE
+from .operations import OPERATIONS
+from .runner import execute, execute_async, load_baseline
+from .seed import Scale, seed
+
+
+class QueryCountTests(TestCase):
+    """No benchmark operation may use more queries than the stored small baseline, sync or async"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rankings and suggestions cached by other tests would point at their rows
+        for cache in caches.all():
+            cache.clear()
+        cls.seeded = seed(Scale(users=30, follows_per_user=5, posts_per_user=3, likes_per_post=2, comments_per_post=1))
+
+    def test_query_counts_within_baseline(self):
+        baseline = load_baseline(DEFAULT_BASELINE, 'small')
+        for operation in OPERATIONS:
+            with self.subTest(operation.name):
+                execute(operation, self.seeded)
+                with CaptureQueriesContext(connection) as queries:
+                    execute(operation, self.seeded)
+                self.assertLessEqual(len(queries), baseline[operation.name]['queries'])
+
+    def test_async_execution_matches_sync(self):
+        for operation in OPERATIONS:
+            with self.subTest(operation.name):
+                expected = execute(operation, self.seeded)
+                with CaptureQueriesContext(connection) as sync_queries:
+                    execute(operation, self.seeded)
+                with CaptureQueriesContext(connection) as async_queries:
+                    result = async_to_sync(execute_async)(operation, self.seeded)
+                self.assertEqual(result.data, expected.data)
+                self.assertEqual(len(async_queries), len(sync_queries))
@@ -0,0 +1,204 @@
+"""
+Asynchronous notification delivery.
+
+Mutations call ``notify`` which only appends an event to an in-process queue
+once the surrounding transaction commits. A background worker drains the
+queue in batches, folds events for the same recipient, verb and post into a
+single notification (counting each actor once) and writes them with bulk
+queries.
+"""
+import atexit
+import logging
+import queue
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from posts.models import Post
+from users.models import User
+from .models import Notification, NotificationActor, NotificationCounter
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', ['verb', 'actor_id', 'recipient_id', 'post_id'])
+
+_events = queue.SimpleQueue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def notify(verb, actor_id, recipient_id, post_id=None):
+    """Queue a notification event; does nothing for actions on your own content"""
+    if actor_id == recipient_id:
+        return
+
+    event = Event(verb, actor_id, recipient_id, post_id)
+    transaction.on_commit(lambda: _enqueue(event))
+
+
+def _enqueue(event):
+    if not settings.NOTIFICATIONS_ASYNC:
+        deliver([event])
+        return
+
+    _events.put(event)
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='notification-delivery', daemon=True)
+            _worker.start()
+
+
+def _drain(timeout=None):
+    """Collect up to one batch of queued events, waiting up to timeout for the first one"""
+    batch = []
+    try:
+        batch.append(_events.get(timeout=timeout))
+        while len(batch) < settings.NOTIFICATIONS_BATCH_SIZE:
+            batch.append(_events.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _run():
+    interval = settings.NOTIFICATIONS_FLUSH_INTERVAL
+    while True:
+        batch = _drain(timeout=interval)
+        if not batch:
+            continue
+        close_old_connections()
+        try:
+            deliver(batch)
+        except Exception:
+            logger.exception("Failed to deliver %d notification events", len(batch))
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Deliver everything still queued in the calling thread"""
+    while True:
+        batch = _drain(timeout=0)
+        if not batch:
+            return
+        deliver(batch)
+
+
+atexit.register(flush)
+
+
+def deliver(events):
+    """
+    Fold events into notifications with bulk queries.
+
+    Events are grouped per (recipient, verb, post). A group that matches an
+    unread notification adds its new actors to it; any other group becomes a
+    new notification and increments the recipient's unread counter. Events
+    whose post or users were deleted after they were queued are dropped.
+    """
+    try:
+        _deliver(events)
+    except IntegrityError:
+        # Something was deleted during the flush; retry per recipient so only their events are lost
+        by_recipient = {}
+        for event in events:
+            by_recipient.setdefault(event.recipient_id, []).append(event)
+        for recipient_id, recipient_events in by_recipient.items():
+            try:
+                _deliver(recipient_events)
+            except IntegrityError:
+                logger.warning("Dropped %d notification events for user %s", len(recipient_events), recipient_id)
+
+
+def _live_events(events):
+    """The events whose actor, recipient and post still exist"""
+    user_ids = {event.actor_id for event in events} | {event.recipient_id for event in events}
+    post_ids = {event.post_id for event in events if event.post_id is not None}
+    users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    posts = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True)) if post_ids else set()
+    return [
+        event for event in events
+        if event.actor_id in users and event.recipient_id in users and (event.post_id is None or event.post_id in posts)
+    ]
+
+
+def _deliver(events):
+    now = timezone.now()
+
+    with transaction.atomic():
+        groups = {}
+        for event in _live_events(events):
+            key = (event.recipient_id, event.verb, event.post_id)
+            actors = groups.setdefault(key, [])
+            if event.actor_id in actors:
+                actors.remove(event.actor_id)
+            actors.append(event.actor_id)
+        if not groups:
+            return
+
+        # Only the unread notifications these events fold into
+        matching = Q()
+        for recipient_id, verb, post_id in groups:
+            matching |= Q(recipient_id=recipient_id, verb=verb, post_id=post_id)
+        existing = {
+            (n.recipient_id, n.verb, n.post_id): n
+            for n in Notification.objects.select_for_update().filter(matching, is_read=False)
+        }
+        known_actors = set(
+            NotificationActor.objects.filter(
+                notification_id__in=[n.id for n in existing.values()],
+                actor_id__in={actor_id for actor_ids in groups.values() for actor_id in actor_ids},
+            ).values_list('notification_id', 'actor_id')
+        )
+
+        updated, created, new_actors = [], [], []
+        for key, actor_ids in groups.items():
+            recipient_id, verb, post_id = key
+            notification = existing.get(key)
+            if notification:
+                # Someone who liked, unliked and liked again is still one actor
+                fresh = [actor_id for actor_id in actor_ids if (notification.id, actor_id) not in known_actors]
+                if not fresh:
+                    continue
+                notification.actor_count += len(fresh)
+                notification.last_actor_id = fresh[-1]
+                notification.updated_at = now
+                updated.append(notification)
+                new_actors.extend((notification, actor_id) for actor_id in fresh)
+            else:
+                notification = Notification(
+                    recipient_id=recipient_id, verb=verb, post_id=post_id,
+                    last_actor_id=actor_ids[-1], actor_count=len(actor_ids), updated_at=now,
+                )
+                created.append(notification)
+                new_actors.extend((notification, actor_id) for actor_id in actor_ids)
+
+        Notification.objects.bulk_update(updated, ['actor_count', 'last_actor', 'updated_at'])
+        Notification.objects.bulk_create(created)
+        NotificationActor.objects.bulk_create([
+            NotificationActor(notification_id=notification.id, actor_id=actor_id) for notification, actor_id in new_actors
+        ])
+
+        new_unread = {}
+        for notification in created:
+            new_unread[notification.recipient_id] = new_unread.get(notification.recipient_id, 0) + 1
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in new_unread], ignore_conflicts=True
+        )
+        # One UPDATE per distinct increment rather than per recipient
+        by_increment = {}
+        for user_id, count in new_unread.items():
+            by_increment.setdefault(count, []).append(user_id)
+        for count, user_ids in by_increment.items():
+            NotificationCounter.objects.filter(user_id__in=user_ids).update(unread_count=F('unread_count') + count)
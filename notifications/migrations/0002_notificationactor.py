@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_actors(apps, schema_editor):
+    # Earlier actors were not recorded; the last one at least counts once from now on
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationActor = apps.get_model('notifications', 'NotificationActor')
+    rows = Notification.objects.values_list('id', 'last_actor_id').iterator(chunk_size=2000)
+    batch = []
+    for notification_id, actor_id in rows:
+        batch.append(NotificationActor(notification_id=notification_id, actor_id=actor_id))
+        if len(batch) == 2000:
+            NotificationActor.objects.bulk_create(batch)
+            batch = []
+    NotificationActor.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='notifications.notification')),
+            ],
+            options={
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(populate_actors, migrations.RunPython.noop),
+    ]
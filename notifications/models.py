@@ -1,3 +1,68 @@
 from django.db import models
+from django.utils import timezone
+from posts.models import Post
+from users.models import User
 
-# Create your models here.
+
+class Notification(models.Model):
+    """
+    A coalesced notification, e.g. "alice and 12 others liked your post".
+    Events for the same recipient, verb and post fold into one unread row.
+    """
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    VERB_CHOICES = [
+        (LIKE, 'liked your post'),
+        (COMMENT, 'commented on your post'),
+        (FOLLOW, 'followed you'),
+    ]
+
+    recipient = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES)
+    post = models.ForeignKey(Post, related_name='notifications', on_delete=models.CASCADE, null=True, blank=True)
+    last_actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever new events are folded in, so the notification moves to the top
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipient", "-updated_at", "-id"], name="notif_recipient_updated_idx"),
+        ]
+
+    @property
+    def message(self):
+        others = self.actor_count - 1
+        actors = self.last_actor.username
+        if others == 1:
+            actors = f"{actors} and 1 other"
+        elif others > 1:
+            actors = f"{actors} and {others} others"
+        return f"{actors} {self.get_verb_display()}"
+
+    def __str__(self):
+        return f"{self.message} (to {self.recipient_id})"
+
+
+class NotificationActor(models.Model):
+    """A user folded into a notification, so repeated events by one actor count once"""
+    notification = models.ForeignKey(Notification, related_name='actors', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("notification", "actor")
+
+    def __str__(self):
+        return f"user {self.actor_id} in notification {self.notification_id}"
+
+
+class NotificationCounter(models.Model):
+    """Unread notification count per user, so badges never need a COUNT(*)"""
+    user = models.OneToOneField(User, related_name='notification_counter', on_delete=models.CASCADE, primary_key=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread_count} unread for user {self.user_id}"
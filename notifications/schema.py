@@ -0,0 +1,83 @@
+import graphene
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from graphene_django import DjangoObjectType
+from graphql import GraphQLError
+
+from utils.pagination import paginate_queryset
+from .models import Notification, NotificationCounter
+
+
+class NotificationType(DjangoObjectType):
+    """A coalesced like, comment or follow notification"""
+    message = graphene.String(description='Human readable summary, e.g. "alice and 12 others liked your post"')
+
+    class Meta:
+        model = Notification
+        fields = ("id", "verb", "post", "last_actor", "actor_count", "is_read", "created_at", "updated_at")
+
+    def resolve_message(self, info):
+        return self.message
+
+class NotificationConnection(graphene.relay.Connection):
+    """Cursor paginated list of notifications, most recently updated first"""
+    class Meta:
+        node = NotificationType
+
+class MarkNotificationsRead(graphene.Mutation):
+    """Mutation for marking notifications as read"""
+    class Arguments:
+        notification_ids = graphene.List(graphene.ID, description='IDs to mark as read, all unread notifications if omitted')
+
+    success = graphene.Boolean(description='Whether the notifications were marked as read')
+    unread_count = graphene.Int(description='Unread notifications left')
+
+    def mutate(self, info, notification_ids=None):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('You must be logged in to read notifications')
+
+        with transaction.atomic():
+            unread = Notification.objects.filter(recipient=user, is_read=False)
+            if notification_ids is not None:
+                unread = unread.filter(id__in=notification_ids)
+            marked = unread.update(is_read=True)
+
+            counter, _ = NotificationCounter.objects.select_for_update().get_or_create(user=user)
+            if marked:
+                NotificationCounter.objects.filter(user=user).update(unread_count=Greatest(F('unread_count') - marked, 0))
+                counter.refresh_from_db()
+
+        return MarkNotificationsRead(success=True, unread_count=counter.unread_count)
+
+class Query(graphene.ObjectType):
+    notifications = graphene.Field(
+        NotificationConnection,
+        first=graphene.Int(description='Number of notifications to return (max 50)'),
+        after=graphene.String(description='Cursor of the last notification of the previous page'),
+        unread_only=graphene.Boolean(description='Only return unread notifications'),
+        description='Get a page of notifications for the current user'
+    )
+    unread_notifications_count = graphene.Int(description='Number of unread notifications for the current user')
+
+    def resolve_notifications(self, info, first=None, after=None, unread_only=False):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('Authentication required')
+
+        notifications = Notification.objects.filter(recipient=user).select_related('last_actor', 'post')
+        if unread_only:
+            notifications = notifications.filter(is_read=False)
+        return paginate_queryset(NotificationConnection, notifications, first=first, after=after, ordering=('updated_at', 'id'))
+
+    def resolve_unread_notifications_count(self, info):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('Authentication required')
+
+        counter = NotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).first()
+        return counter or 0
+
+class Mutation(graphene.ObjectType):
+    mark_notifications_read = MarkNotificationsRead.Field(description='Mark notifications as read')
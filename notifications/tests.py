@@ -1,3 +1,38 @@
 from django.test import TestCase
 
-# Create your tests here.
+from posts.models import Post
+from users.models import User
+from .delivery import Event, deliver
+from .models import Notification, NotificationCounter
+
+
+class DeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='secret')
+            for name in ('author', 'alice', 'bob')
+        ]
+        cls.post = Post.objects.create(user=cls.author, content='post')
+
+    def like(self, actor, post=None):
+        return Event(Notification.LIKE, actor.id, self.author.id, (post or self.post).id)
+
+    def test_repeated_actor_counts_once_across_batches(self):
+        deliver([self.like(self.alice)])
+        deliver([self.like(self.alice), self.like(self.bob)])
+        deliver([self.like(self.alice)])
+
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.last_actor, self.bob)
+        self.assertEqual(NotificationCounter.objects.get(user=self.author).unread_count, 1)
+
+    def test_events_for_deleted_posts_do_not_drop_the_batch(self):
+        deleted = Post.objects.create(user=self.author, content='deleted')
+        events = [self.like(self.alice, deleted), self.like(self.bob)]
+        deleted.delete()
+
+        deliver(events)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual((notification.post_id, notification.last_actor), (self.post.id, self.bob))
@@ -0,0 +1,49 @@
+import logging
+
+from django.db import transaction
+
+from utils.direct_uploads import load_image_bytes
+from utils.storage import StorageManager
+from utils.background import get_pool
+from .models import Post
+from .signals import post_changed
+
+logger = logging.getLogger(__name__)
+
+
+def _mark_failed(post_id, author_username=None):
+    Post.objects.filter(id=post_id).update(image_status=Post.IMAGE_FAILED)
+    # Cached results would otherwise keep showing the image as pending
+    post_changed(post_id, author_username)
+
+
+def upload_post_image(post_id, user_id, image_source):
+    """
+    Process and upload a post image in the background and record the outcome on the post.
+    image_source is a base64 string or a direct upload ticket
+    """
+    try:
+        image_data = load_image_bytes(image_source)
+        stored = StorageManager.upload_post_image(image_data, str(user_id))
+    except Exception:
+        logger.exception("Image upload for post %s failed", post_id)
+        _mark_failed(post_id)
+        return
+
+    Post.objects.filter(id=post_id).update(
+        image=stored.url,
+        image_variants=stored.variants,
+        image_placeholder=stored.placeholder,
+        image_status=Post.IMAGE_READY,
+    )
+    post_changed(post_id)
+
+
+def schedule_post_image(post, image_source):
+    """Start the upload once the post is committed so the worker can see it"""
+    def submit():
+        if not get_pool('uploads').submit(upload_post_image, post.id, post.user_id, image_source):
+            logger.warning("Upload pool full, dropping image for post %s", post.id)
+            _mark_failed(post.id, post.user.username)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,23 @@
+from utils.dataloader import get_loader, selects
+from .models import Like
+
+
+def is_liked_loader(info):
+    """Loader mapping post id -> whether the current user liked it"""
+    user = info.context.user
+
+    def batch_load(post_ids):
+        liked = Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+        return {post_id: True for post_id in liked}
+
+    return get_loader(info, 'posts.is_liked', batch_load, default=False)
+
+
+def prime_posts(info, posts):
+    """
+    Queue every post in a list result on the post loaders so each field
+    is resolved with one grouped query for the whole page.
+    """
+    if not info.context.user.is_anonymous and selects(info, 'isLiked'):
+        is_liked_loader(info).prime([post.id for post in posts])
+    return posts
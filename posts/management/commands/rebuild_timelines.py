@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post, TimelineEntry
+from posts.timeline import pull_author_ids
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's precomputed feed timeline from the follow graph"
+
+    def handle(self, *args, **options):
+        limit = settings.FEED_TIMELINE_BACKFILL
+        rebuilt = 0
+
+        for user in User.objects.only('id').iterator():
+            following_ids = list(user.following.values_list('following_id', flat=True))
+            pulled_ids = set(pull_author_ids(following_ids))
+            pushed_ids = [user_id for user_id in following_ids if user_id not in pulled_ids]
+
+            recent = (
+                Post.objects.filter(user_id__in=pushed_ids)
+                .order_by('-created_at')
+                .values_list('id', 'created_at')[:limit]
+            )
+            entries = [
+                TimelineEntry(owner_id=user.id, post_id=post_id, created_at=created_at)
+                for post_id, created_at in recent
+            ]
+
+            with transaction.atomic():
+                TimelineEntry.objects.filter(owner=user).delete()
+                TimelineEntry.objects.bulk_create(entries)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines"))
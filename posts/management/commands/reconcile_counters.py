@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Like, Post
+from users.models import Follow, UserProfile
+
+
+def _count(model, field, ref):
+    """Correlated COUNT(*) of model rows whose field matches the outer ref"""
+    rows = model.objects.filter(**{field: OuterRef(ref)}).order_by().values(field).annotate(total=Count('id'))
+    return Coalesce(Subquery(rows.values('total')), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized like, comment and follower counters that have drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows have drifted')
+
+    def reconcile(self, model, counters, dry_run):
+        """Rewrite the counters of every drifted row of model with bulk statements"""
+        drifted = Q()
+        for name in counters:
+            drifted |= ~Q(**{name: F(f'actual_{name}')})
+
+        rows = model.objects.annotate(**{f'actual_{name}': expr for name, expr in counters.items()}).filter(drifted)
+        drifted_ids = list(rows.values_list('pk', flat=True))
+        if drifted_ids and not dry_run:
+            model.objects.filter(pk__in=drifted_ids).update(**counters)
+
+        label = "would be fixed" if dry_run else "fixed"
+        self.stdout.write(f"{model.__name__}: {len(drifted_ids)} drifted rows {label}")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        self.reconcile(Post, {
+            'likes_count': _count(Like, 'post_id', 'pk'),
+            'comments_count': _count(Comment, 'post_id', 'pk'),
+        }, dry_run)
+
+        self.reconcile(UserProfile, {
+            'followers_count': _count(Follow, 'following_id', 'user_id'),
+            'following_count': _count(Follow, 'follower_id', 'user_id'),
+        }, dry_run)
+
+        self.stdout.write(self.style.SUCCESS("Counters reconciled"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    Comment = apps.get_model('posts', 'Comment')
+
+    def count(model):
+        rows = model.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id').annotate(total=Count('id'))
+        return Coalesce(Subquery(rows.values('total')), 0)
+
+    Post.objects.update(likes_count=count(Like), comments_count=count(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_post_comments_count_post_likes_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='posts_comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='posts_post_user_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.post'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
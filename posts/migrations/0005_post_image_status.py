@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image__isnull=True).exclude(image='').update(image_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_comment_posts_comment_post_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Uploading'), ('ready', 'Ready'), ('failed', 'Upload failed')], default='none', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_images_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# Full-text index serving posts.search. The expression must match
+# posts.search.search_vector() for the planner to use it.
+INDEX = GinIndex(SearchVector('content', config='simple'), name='posts_post_content_search_idx')
+
+
+def add_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.add_index(apps.get_model('posts', 'Post'), INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('posts', 'Post'), INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_image_placeholder_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
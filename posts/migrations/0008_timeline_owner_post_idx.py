@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='posts_timeline_owner_idx',
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['owner', '-created_at', '-post'], name='posts_timeline_owner_idx'),
+        ),
+    ]
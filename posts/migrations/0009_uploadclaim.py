@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_timeline_owner_post_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('claimed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_uploadclaim'),
+        ('uploads', '0001_initial'),
+    ]
+
+    operations = [
+        # The table now belongs to uploads.UploadClaim, see uploads/0001_initial
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(name='UploadClaim'),
+            ],
+        ),
+    ]
@@ -4,10 +4,35 @@ from users.models import User
 
 
 class Post(models.Model):
-    user = models.ForeignKey(User, related_name='posts', on_delete=models.CASCADE)
+    IMAGE_NONE = 'none'
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_NONE, 'No image'),
+        (IMAGE_PENDING, 'Uploading'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Upload failed'),
+    ]
+
+    # Indexed by posts_post_user_created_idx, which leads with user_id
+    user = models.ForeignKey(User, related_name='posts', on_delete=models.CASCADE, db_index=False)
     image = models.ImageField(upload_to="posts/", null=True, blank=True)
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default=IMAGE_NONE)
+    # Resized WebP/JPEG renditions as [{"width", "height", "format", "url"}]
+    image_variants = models.JSONField(default=list, blank=True)
+    image_placeholder = models.TextField(blank=True)
     content = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized counters, kept current by the like and comment mutations
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Per-user post listings and feed pulls, newest first
+            models.Index(fields=["user", "-created_at", "-id"], name="posts_post_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.post,id} by {self.user.username}"
@@ -25,10 +50,34 @@ class Like(models.Model):
         return f"{self.user.username} liked post {self.post.id}"
 
 class Comment(models.Model):
-    post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
+    # Indexed by posts_comment_post_created_idx, which leads with post_id
+    post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE, db_index=False)
     user = models.ForeignKey(User, related_name='comments', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Comment listings of a post, newest first
+            models.Index(fields=["post", "-created_at", "-id"], name="posts_comment_post_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} comented on post {{self.post.id}}"
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's precomputed feed when fan-out is enabled"""
+    owner = models.ForeignKey(User, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    # Copy of post.created_at so a timeline can be read from the index alone
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("owner", "post")
+        indexes = [
+            # Feed pages, newest first, in the same (created_at, id) order as posts
+            models.Index(fields=["owner", "-created_at", "-post"], name="posts_timeline_owner_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.user.username} comented on post {{self.post.id}}"
\ No newline at end of file
+        return f"post {self.post_id} in timeline of user {self.owner_id}"
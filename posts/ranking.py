@@ -0,0 +1,117 @@
+"""
+Ranked feed ordering.
+
+Each candidate post (the newest FEED_RANKING_CANDIDATES posts of the viewer's
+feed from the last FEED_RANKING_WINDOW hours) is scored as
+
+    decay * (1 + velocity) * (1 + AFFINITY_WEIGHT * affinity)
+
+where decay halves every FEED_RANKING_HALF_LIFE hours, velocity is likes
+plus weighted comments per hour since posting, and affinity is the share of
+the viewer's recent likes that went to the post's author.
+
+Rankings are cached per viewer as (score, post id) pairs and rebuilt on the
+"ranking" background pool. A ranking older than FEED_RANKING_REFRESH seconds
+is still served while it is rebuilt; a viewer without one is served a
+provisional ranking that skips affinity (the expensive part) until theirs is
+ready.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.utils import timezone
+
+from utils.background import get_pool
+from .models import Like
+from .timeline import feed_queryset
+
+logger = logging.getLogger(__name__)
+
+COMMENT_WEIGHT = 2.0
+AFFINITY_WEIGHT = 1.0
+# Hours added to a post's age in velocity, so brand new posts with one like do not dominate
+VELOCITY_GRACE_HOURS = 2.0
+# How far back the viewer's likes count towards author affinity
+AFFINITY_WINDOW = timedelta(days=30)
+
+CACHE_PREFIX = 'feed:ranked:'
+
+def _cache():
+    return caches[settings.FEED_RANKING_CACHE]
+
+
+def score_posts(user, now=None, affinity=True):
+    """
+    Score the user's feed candidates; returns (score, post id) pairs, best
+    first. Without affinity every author counts the same.
+    """
+    now = now or timezone.now()
+    candidates = list(
+        feed_queryset(user)
+        .filter(created_at__gte=now - timedelta(hours=settings.FEED_RANKING_WINDOW))
+        .order_by('-created_at', '-id')
+        .values_list('id', 'user_id', 'created_at', 'likes_count', 'comments_count')[:settings.FEED_RANKING_CANDIDATES]
+    )
+    if not candidates:
+        return []
+
+    author_likes = {}
+    if affinity:
+        author_likes = dict(
+            Like.objects.filter(user=user, created_at__gte=now - AFFINITY_WINDOW)
+            .values_list('post__user_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+    total_likes = sum(author_likes.values()) or 1
+    half_life = settings.FEED_RANKING_HALF_LIFE
+
+    scored = []
+    for post_id, author_id, created_at, likes, comments in candidates:
+        age = max((now - created_at).total_seconds() / 3600, 0.0)
+        decay = 0.5 ** (age / half_life)
+        velocity = (likes + COMMENT_WEIGHT * comments) / (age + VELOCITY_GRACE_HOURS)
+        author_share = author_likes.get(author_id, 0) / total_likes
+        scored.append((decay * (1 + velocity) * (1 + AFFINITY_WEIGHT * author_share), post_id))
+    scored.sort(reverse=True)
+    return scored
+
+
+def refresh_ranking(user):
+    """Recompute and cache the user's ranking"""
+    ranked = score_posts(user)
+    _cache().set(f'{CACHE_PREFIX}{user.id}', (time.time(), ranked), settings.FEED_RANKING_TTL)
+    return ranked
+
+
+def _refresh_in_background(user):
+    # One refresh per user at a time, across processes sharing the cache
+    lock = f'{CACHE_PREFIX}refreshing:{user.id}'
+    if not _cache().add(lock, True, 60):
+        return
+
+    def run():
+        try:
+            refresh_ranking(user)
+        finally:
+            _cache().delete(lock)
+
+    if not get_pool('ranking').submit(run):
+        _cache().delete(lock)
+
+
+def ranked_feed(user):
+    """The user's feed as (score, post id) pairs, best first"""
+    entry = _cache().get(f'{CACHE_PREFIX}{user.id}')
+    if entry is None:
+        _refresh_in_background(user)
+        return score_posts(user, affinity=False)
+
+    computed_at, ranked = entry
+    if time.time() - computed_at > settings.FEED_RANKING_REFRESH:
+        _refresh_in_background(user)
+    return ranked
@@ -1,57 +1,104 @@
 import graphene
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from graphene_django import DjangoObjectType
 from graphql import GraphQLError
-from utils.storage import StorageManager
-from users.schema import UserType
+from notifications.delivery import notify
+from notifications.models import Notification
+from utils.async_execution import inline_resolver
+from utils.direct_uploads import POST_IMAGE, PROFILE_IMAGE, UploadError, claim_upload, issue_upload
+from utils.pagination import paginate_keyset, paginate_queryset, paginate_ranked
+from utils.pubsub import get_pubsub, publish_on_commit
+from users.schema import BulkResultType, ImageVariantType, UserType, lock_user_writes, unique_targets
+from .images import schedule_post_image
+from .loaders import is_liked_loader, prime_posts
+from .ranking import ranked_feed
 from .models import Comment, Like, Post
+from .search import search_posts
+from .signals import post_changed
+from .timeline import fan_out_post, feed_posts, feed_queryset
 
 class PostType(DjangoObjectType):
     likes_count = graphene.Int(description='Total number of likes for this post')
     comments_count = graphene.Int(description='Total number of comments for this post')
     is_liked = graphene.Boolean(description='Whether the current user has liked this post')
     author = graphene.Field(UserType, description='post author details')
+    image_variants = graphene.List(
+        ImageVariantType,
+        max_width=graphene.Int(description='Only renditions at most this wide'),
+        format=graphene.String(description='Only renditions in this format (webp or jpeg)'),
+        description='Resized renditions of the post image'
+    )
     class Meta:
         model = Post
-        fields = ["id", "user", "image", "content", "created_at"]
-
-    def resolve_likes_count(self, info):
-        self.likes.count()
-
-    def resolve_likes_count(self, info):
-        self.comments.count()
+        fields = ["id", "user", "image", "image_status", "image_placeholder", "content", "created_at"]
 
+    @inline_resolver
     def resolve_is_liked(self, info):
         user = info.context.user
         if user.is_anonymous:
             return False
-        return Like.objects.filter(user=user, post=self).exists()
+        return is_liked_loader(info).load(self.id)
+
+    @inline_resolver
+    def resolve_author(self, info):
+        return self.user
+
+    @inline_resolver
+    def resolve_image_variants(self, info, max_width=None, format=None):
+        return ImageVariantType.from_variants(self.image_variants, max_width, format)
+
+class FeedOrder(graphene.Enum):
+    """How feed posts are ordered"""
+    LATEST = 'latest'
+    RANKED = 'ranked'
+
+    @property
+    def description(self):
+        if self == FeedOrder.RANKED:
+            return 'Best first, by recency, likes and comments per hour and how often you like the author'
+        return 'Newest first'
+
+class PostConnection(graphene.relay.Connection):
+    """Cursor paginated list of posts, newest first"""
+    class Meta:
+        node = PostType
+
 class CreatePost(graphene.Mutation):
         """Mutation for creating a new post"""
         class Arguments:
             image = graphene.String(description='Base64 encoded image')
             content = graphene.String(description='Content of the post')
+            upload_id = graphene.String(description='Direct upload id from requestUploadUrl, instead of image')
 
         post = graphene.Field(PostType, description='The created post')
         success = graphene.Boolean(description='Whether the post was created successfully')
         message = graphene.String(description='Success/Error message')
 
-        def mutate(self, info, content=None, image=None):
+        def mutate(self, info, content=None, image=None, upload_id=None):
             user = info.context.user
             if user.is_anonymous:
                 raise GraphQLError('You must be logged in to create a post')
             
-            if not image and not content:
+            if not image and not upload_id and not content:
                 raise GraphQLError('Post must have atleast an image or text')
 
             try:
-                # Handle image upload if provided
-                image_url = None
-                if image:
-                    image_url = StorageManager.upload_post_image(image, str(user.id))
-                
-                # Create post with image URL
-                post = Post.objects.create(user=user, content=content, image=image_url)
+                # The image is uploaded in the background; clients follow imageStatus
+                image_status = Post.IMAGE_PENDING if image or upload_id else Post.IMAGE_NONE
+                with transaction.atomic():
+                    if upload_id:
+                        image = claim_upload(upload_id, user, POST_IMAGE)
+                    post = Post.objects.create(user=user, content=content, image_status=image_status)
+                    if image:
+                        schedule_post_image(post, image)
+                    fan_out_post(post)
+                    publish_on_commit('posts', {'post_id': post.id, 'author_id': user.id})
                 return CreatePost(success=True, post=post, message='Post created successfully')
+            except UploadError as e:
+                raise GraphQLError(str(e))
             except Exception as e:
                 return CreatePost(success=False, Post=None, message=f'Failed to create post: {str(e)}')
 class DeletePost(graphene.Mutation):
@@ -122,14 +169,19 @@ class LikePost(graphene.Mutation):
             raise GraphQLError('You must be logged in to like a post')
          
         try:
-            post= Post.objects.get(id=post_id)
-
-            #   check if user already liked the post
-            if Like.objects.filter(user=user, post=post).exists():
-                return LikePost(success=False, message='You have already liiked this post')
-
-            # otherwise create the like
-            Like.objects.create(post=post, user=user)
+            # The author comes along for the cache invalidation in posts.signals
+            post = Post.objects.select_related('user').get(id=post_id)
+
+            with transaction.atomic():
+                lock_user_writes(user)
+                #   check if user already liked the post
+                if Like.objects.filter(user=user, post=post).exists():
+                    return LikePost(success=False, message='You have already liiked this post')
+
+                # otherwise create the like
+                Like.objects.create(post=post, user=user)
+                Post.objects.filter(id=post.id).update(likes_count=F('likes_count') + 1)
+                notify(Notification.LIKE, user.id, post.user_id, post.id)
             return LikePost(success=True, message='Post liked successfully')
 
         except Post.DoesNotExist:
@@ -138,6 +190,61 @@ class LikePost(graphene.Mutation):
         except Exception as e:
             return LikePost(success=False, message=f'Failed to like post: {str(e)}')
 
+class LikePosts(graphene.Mutation):
+    """Mutation for liking several posts at once"""
+    class Arguments:
+        post_ids = graphene.List(graphene.NonNull(graphene.ID), required=True, description='IDs of the posts to be liked (max 100)')
+
+    results = graphene.List(BulkResultType, description='One result per requested post, in order')
+    success = graphene.Boolean(description='Whether every post was liked successfully')
+    message = graphene.String(description='Success/Error message')
+
+    def mutate(self, info, post_ids):
+        user = info.context.user
+
+        if user.is_anonymous:
+            raise GraphQLError('You must be logged in to like a post')
+
+        # Ids are reported back as the posts' own ids, so "007" and "7" are one target
+        post_ids = unique_targets([str(int(post_id)) if post_id.isdecimal() else post_id for post_id in post_ids])
+        ids = [int(post_id) for post_id in post_ids if post_id.isdecimal()]
+        posts = {
+            str(post.id): post
+            for post in Post.objects.filter(id__in=ids).select_related('user').only('id', 'user_id', 'user__username')
+        }
+
+        try:
+            with transaction.atomic():
+                lock_user_writes(user)
+                already_liked = set(Like.objects.filter(user=user, post_id__in=ids).values_list('post_id', flat=True))
+                to_like = [post for post in posts.values() if post.id not in already_liked]
+                if to_like:
+                    # No ignore_conflicts: a row inserted despite the lock fails the whole request instead of being counted
+                    Like.objects.bulk_create([Like(post=post, user=user) for post in to_like])
+                    Post.objects.filter(id__in=[post.id for post in to_like]).update(likes_count=F('likes_count') + 1)
+                    # bulk_create sends no post_save, so invalidate the cached posts here
+                    for post in to_like:
+                        post_changed(post.id, post.user.username)
+                        notify(Notification.LIKE, user.id, post.user_id, post.id)
+        except Exception as e:
+            return LikePosts(success=False, message=f'Failed to like posts: {str(e)}')
+
+        results = []
+        for post_id in post_ids:
+            post = posts.get(str(post_id))
+            if post is None:
+                results.append(BulkResultType(target=post_id, success=False, message='Post not found'))
+            elif post.id in already_liked:
+                results.append(BulkResultType(target=post_id, success=False, message='You have already liked this post'))
+            else:
+                results.append(BulkResultType(target=post_id, success=True, message='Post liked successfully'))
+
+        return LikePosts(
+            results=results,
+            success=len(to_like) == len(post_ids),
+            message=f'Liked {len(to_like)} of {len(post_ids)} posts',
+        )
+
 class UnlikePost(graphene.Mutation):
     """Mutation for unliking a post"""
     class Arguments:
@@ -153,19 +260,33 @@ class UnlikePost(graphene.Mutation):
             raise GraphQLError('You must be logged in to unlike post')
         
         try:
-            post = Post.objects.get(id=post_id)
-            Like.objects.filter(user=user, post=post).delete()
+            post = Post.objects.select_related('user').get(id=post_id)
+            with transaction.atomic():
+                like = Like.objects.filter(user=user, post=post).first()
+                deleted = 0
+                if like:
+                    # With its author loaded, for the cache invalidation in posts.signals
+                    like.post = post
+                    # A concurrent unlike may have deleted the row since it was read; only count what this one removed
+                    deleted, _ = like.delete()
+                if deleted:
+                    Post.objects.filter(id=post.id).update(likes_count=Greatest(F('likes_count') - deleted, 0))
             return UnlikePost(success=True, message='unliked post successfully')
         except Post.DoesNotExist:
             return UnlikePost(success=False, message='Post not found')
         except Exception as e:
-            return LikePost(success=False, message=f'Failed to like post: {str(e)}')
+            return UnlikePost(success=False, message=f'Failed to unlike post: {str(e)}')
 
 class CommentType(DjangoObjectType):
     class Meta:
         model = Comment
         fields = ["post", "user", "content", "created_at"]
-        
+
+class CommentConnection(graphene.relay.Connection):
+    """Cursor paginated list of comments, newest first"""
+    class Meta:
+        node = CommentType
+
 class CreateComment(graphene.Mutation):
     """Mutation for commenting on a post"""
     class Arguments:
@@ -189,8 +310,12 @@ class CreateComment(graphene.Mutation):
             raise GraphQLError('Comment too long(max 1000 characters)')
 
         try:
-            post = Post.objects.get(id=post_id)
-            comment = Comment.objects.create(user=user, post=post, content=content.strip())
+            post = Post.objects.select_related('user').get(id=post_id)
+            with transaction.atomic():
+                comment = Comment.objects.create(user=user, post=post, content=content.strip())
+                Post.objects.filter(id=post.id).update(comments_count=F('comments_count') + 1)
+                notify(Notification.COMMENT, user.id, post.user_id, post.id)
+                publish_on_commit(f'comments:{post.user_id}', {'comment_id': comment.id})
             return CreateComment(success=True, comment=comment, message='comment made successfully')
         except Post.DoesNotExist:
             return CreateComment(success=False, comment=None, message='Post not found')
@@ -212,7 +337,12 @@ class DeleteComment(graphene.Mutation):
             raise GraphQLError('You must be logged in to delete on a comment')
         
         try:
-            Comment.objects.filter(user=user, id=comment_id ).delete()
+            with transaction.atomic():
+                comment = Comment.objects.select_for_update(of=('self',)).select_related('post__user') \
+                    .filter(user=user, id=comment_id).first()
+                if comment:
+                    comment.delete()
+                    Post.objects.filter(id=comment.post_id).update(comments_count=Greatest(F('comments_count') - 1, 0))
             return CreateComment(success=True, message='Comment deleted successfully')
         except Post.DoesNotExist:
             return CreateComment(success=False, comment=None, message='Post not found')
@@ -239,7 +369,7 @@ class EditComment(graphene.Mutation):
             raise GraphQLError('Comment content cannot be empty')
 
         try:
-            comment = Comment.objects.get(user=user, id=comment_id)
+            comment = Comment.objects.select_related('post__user').get(user=user, id=comment_id)
             comment.content = content
             comment.save()
             return EditComment(success=True, comment=comment, message='comment made successfully')
@@ -250,28 +380,164 @@ class EditComment(graphene.Mutation):
 
 class Query():
     user_posts = graphene.List(PostType, username=graphene.String(required=True), description='Get posts for this specific user')
+    user_posts_connection = graphene.Field(
+        PostConnection,
+        username=graphene.String(required=True),
+        first=graphene.Int(description='Number of posts to return (max 50)'),
+        after=graphene.String(description='Cursor of the last post of the previous page'),
+        description='Get a page of posts for this specific user'
+    )
 
     def resolve_user_posts(self, info, username):
         # Get posts for specific user
-        return Post.objects.filter(user__username=username).order_by('-created_at')
+        posts = Post.objects.filter(user__username=username).select_related('user').order_by('-created_at', '-id')
+        return prime_posts(info, list(posts))
+
+    def resolve_user_posts_connection(self, info, username, first=None, after=None):
+        posts = Post.objects.filter(user__username=username).select_related('user')
+        connection = paginate_queryset(PostConnection, posts, first=first, after=after)
+        prime_posts(info, [edge.node for edge in connection.edges])
+        return connection
 
     post_comments =  graphene.List(CommentType, post_id=graphene.ID(required=True), description='Get comments for a specific post')
+    post_comments_connection = graphene.Field(
+        CommentConnection,
+        post_id=graphene.ID(required=True),
+        first=graphene.Int(description='Number of comments to return (max 50)'),
+        after=graphene.String(description='Cursor of the last comment of the previous page'),
+        description='Get a page of comments for a specific post'
+    )
+
     def resolve_post_comments(self, info, post_id):
         # Get comments
-        return Comment.objects.filter(post_id=post_id).select_related('user').order_by('-created_at')
+        return Comment.objects.filter(post_id=post_id).select_related('user').order_by('-created_at', '-id')
+
+    def resolve_post_comments_connection(self, info, post_id, first=None, after=None):
+        comments = Comment.objects.filter(post_id=post_id).select_related('user')
+        return paginate_queryset(CommentConnection, comments, first=first, after=after)
      
-    feed = graphene.List(PostType, description='Get feed of posts from followed users')
+    feed = graphene.List(
+        PostType,
+        order=FeedOrder(default_value=FeedOrder.LATEST.value, description='How to order the feed'),
+        description='Get feed of posts from followed users'
+    )
+    feed_connection = graphene.Field(
+        PostConnection,
+        order=FeedOrder(default_value=FeedOrder.LATEST.value, description='How to order the feed'),
+        first=graphene.Int(description='Number of posts to return (max 50)'),
+        after=graphene.String(description='Cursor of the last post of the previous page'),
+        description='Get a page of the feed of posts from followed users'
+    )
     
-    def resolve_feed(self, info, **kwargs):
+    def resolve_feed(self, info, order=FeedOrder.LATEST.value, **kwargs):
         user = info.context.user
         if user.is_anonymous:
             raise GraphQLError("Authentication required")
-        
-        # Get IDs of user being followed
-        following_ids = user.following.values_list('following_id', flat=True)
+
+        if order == FeedOrder.RANKED.value:
+            post_ids = [post_id for _, post_id in ranked_feed(user)]
+            posts = feed_queryset(user).select_related('user').in_bulk(post_ids)
+            return prime_posts(info, [posts[post_id] for post_id in post_ids if post_id in posts])
 
         # Get posts from followed users
-        return Post.objects.filter(user_id__in=following_ids).order_by('-created_at')
+        return prime_posts(info, feed_posts(user))
+
+    def resolve_feed_connection(self, info, order=FeedOrder.LATEST.value, first=None, after=None):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError("Authentication required")
+
+        if order == FeedOrder.RANKED.value:
+            # Rankings are precomputed, so only show posts that are still in the feed
+            load = feed_queryset(user).select_related('user').in_bulk
+            connection = paginate_ranked(PostConnection, ranked_feed(user), first=first, after=after, load=load)
+            prime_posts(info, [edge.node for edge in connection.edges])
+            return connection
+
+        fetch = lambda limit, values: feed_posts(user, limit, values)
+        connection = paginate_keyset(PostConnection, fetch, first=first, after=after)
+        prime_posts(info, [edge.node for edge in connection.edges])
+        return connection
+
+    search_posts = graphene.Field(
+        PostConnection,
+        query=graphene.String(required=True, description='Words to look for in post content'),
+        first=graphene.Int(description='Number of posts to return (max 50)'),
+        after=graphene.String(description='Cursor of the last post of the previous page'),
+        description='Search posts, best matches first'
+    )
+
+    def resolve_search_posts(self, info, query, first=None, after=None):
+        connection = paginate_queryset(PostConnection, search_posts(query), first=first, after=after, ordering=('rank', 'id'))
+        prime_posts(info, [edge.node for edge in connection.edges])
+        return connection
+class UploadPurpose(graphene.Enum):
+    """What a direct upload will be used for"""
+    POST_IMAGE = POST_IMAGE
+    PROFILE_IMAGE = PROFILE_IMAGE
+
+class RequestUploadUrl(graphene.Mutation):
+    """Mutation for getting a signed URL to upload an image directly to storage"""
+    class Arguments:
+        purpose = UploadPurpose(required=True, description='What the image will be used for')
+        content_type = graphene.String(required=True, description='MIME type of the file, e.g. image/jpeg')
+        size = graphene.Int(required=True, description='Size of the file in bytes')
+
+    upload_id = graphene.String(description='Pass this to finalizeUpload, finalizeProfileUpload or createPost once the file is uploaded')
+    upload_url = graphene.String(description='URL to send the raw file bytes to')
+    method = graphene.String(description='HTTP method to use for the upload')
+    max_bytes = graphene.Int(description='Largest accepted file size in bytes')
+    expires_at = graphene.DateTime(description='When the upload URL stops accepting uploads')
+    success = graphene.Boolean(description='Whether an upload URL was issued')
+    message = graphene.String(description='Success/Error message')
+
+    def mutate(self, info, purpose, content_type, size):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('You must be logged in to upload images')
+
+        try:
+            upload_id, target, expires_at = issue_upload(user, purpose.value, content_type, size)
+        except UploadError as e:
+            return RequestUploadUrl(success=False, message=str(e))
+        return RequestUploadUrl(
+            upload_id=upload_id,
+            upload_url=info.context.build_absolute_uri(target['url']),
+            method=target['method'],
+            max_bytes=size,
+            expires_at=expires_at,
+            success=True,
+            message='Upload URL created',
+        )
+
+class FinalizeUpload(graphene.Mutation):
+    """Mutation for attaching a directly uploaded image to a post"""
+    class Arguments:
+        upload_id = graphene.String(required=True, description='POST_IMAGE upload id from requestUploadUrl')
+        post_id = graphene.ID(required=True, description='Post to attach the image to')
+
+    post = graphene.Field(PostType, description='The updated post')
+    success = graphene.Boolean(description='Whether the upload was attached successfully')
+    message = graphene.String(description='Success/Error message')
+
+    def mutate(self, info, upload_id, post_id):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('You must be logged in to upload images')
+
+        post = Post.objects.filter(id=post_id, user=user).first()
+        if post is None:
+            return FinalizeUpload(success=False, message='Post not found')
+        try:
+            with transaction.atomic():
+                ticket = claim_upload(upload_id, user, POST_IMAGE)
+                post.image_status = Post.IMAGE_PENDING
+                post.save(update_fields=['image_status'])
+                schedule_post_image(post, ticket)
+        except UploadError as e:
+            return FinalizeUpload(success=False, message=str(e))
+        return FinalizeUpload(success=True, post=post, message='Image is being processed')
+
 class Mutation(graphene.ObjectType):
     create_comment = CreateComment.Field(description='Comment on a post')
     delete_comment = DeleteComment.Field(description='Delete a comment on a post')
@@ -280,4 +546,46 @@ class Mutation(graphene.ObjectType):
     delete_post = DeletePost.Field(description='Delete a post')
     edit_post = EditPost.Field(description='Edit a text post')
     like_post = LikePost.Field(description='Like a post')
-    unlike_post = UnlikePost.Field(description='Unlike a post')
\ No newline at end of file
+    like_posts = LikePosts.Field(description='Like several posts at once')
+    unlike_post = UnlikePost.Field(description='Unlike a post')
+    request_upload_url = RequestUploadUrl.Field(description='Get a signed URL to upload an image directly to storage')
+    finalize_upload = FinalizeUpload.Field(description='Attach a directly uploaded image to a post')
+
+class Subscription(graphene.ObjectType):
+    post_created = graphene.Field(PostType, description='New posts from users the current user follows')
+    comment_added = graphene.Field(CommentType, description="New comments on the current user's posts")
+
+    async def subscribe_post_created(root, info):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('Authentication required')
+
+        following = user.following.values_list('following_id', flat=True)
+        following_ids = {user_id async for user_id in following}
+
+        async for channel, message in get_pubsub().subscribe('posts', f'following:{user.id}'):
+            if channel != 'posts':
+                # The user followed or unfollowed someone
+                following_ids = {user_id async for user_id in following}
+                continue
+            if message['author_id'] not in following_ids:
+                continue
+
+            post = await Post.objects.select_related('user').filter(id=message['post_id']).afirst()
+            if post is not None:
+                # Resolvers run synchronously, so load what they need up front
+                info.context.dataloaders = {}
+                await sync_to_async(is_liked_loader(info).load)(post.id)
+                yield post
+
+    async def subscribe_comment_added(root, info):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError('Authentication required')
+
+        async for _, message in get_pubsub().subscribe(f'comments:{user.id}'):
+            comment = await Comment.objects.select_related('user', 'post__user').filter(id=message['comment_id']).afirst()
+            if comment is not None:
+                info.context.dataloaders = {}
+                await sync_to_async(is_liked_loader(info).load)(comment.post_id)
+                yield comment
@@ -0,0 +1,35 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast
+
+from utils.search import MAX_CANDIDATES, SEARCH_CONFIG, clean_query, uses_postgres
+from .models import Post
+
+
+def search_vector():
+    """Must stay identical to the expression of posts_post_content_search_idx"""
+    return SearchVector('content', config=SEARCH_CONFIG)
+
+
+def search_posts(query):
+    """
+    Posts matching query, annotated with a relevance rank for
+    paginate_queryset(ordering=('rank', 'id'))
+    """
+    query = clean_query(query)
+
+    if uses_postgres(Post):
+        search = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        rank = SearchRank(search_vector(), search)
+        matches = Post.objects.alias(search=search_vector()).filter(search=search)
+    else:
+        # Every word has to appear somewhere in the content
+        words = Q()
+        for word in query.split():
+            words &= Q(content__icontains=word)
+        matches = Post.objects.filter(words)
+        rank = Value(1.0)
+    # Rank only the newest matches, picked by the index
+    candidates = matches.order_by('-id').values('id')[:MAX_CANDIDATES]
+    posts = Post.objects.select_related('user').filter(id__in=candidates)
+    return posts.annotate(rank=Cast(rank, FloatField()))
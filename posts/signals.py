@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from utils.response_cache import invalidate
+from .models import Comment, Like, Post
+
+
+def post_changed(post_id, author_username=None):
+    """Drop cached results that include this post; pass the author's username when at hand to spare a query"""
+    if author_username is None:
+        author_username = Post.objects.filter(id=post_id).values_list('user__username', flat=True).first()
+    invalidate(f'posts:{author_username}', f'comments:{post_id}')
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_saved(sender, instance, **kwargs):
+    post_changed(instance.id, instance.user.username)
+
+
+def _author_username(instance):
+    """The post author's username when the like or comment was saved with its post and author loaded"""
+    if type(instance).post.is_cached(instance) and Post.user.is_cached(instance.post):
+        return instance.post.user.username
+    return None
+
+
+@receiver([post_save, post_delete], sender=Like)
+def like_saved(sender, instance, **kwargs):
+    post_changed(instance.post_id, _author_username(instance))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_saved(sender, instance, **kwargs):
+    post_changed(instance.post_id, _author_username(instance))
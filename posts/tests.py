@@ -1,3 +1,307 @@
-from django.test import TestCase
+import io
+import json
+import re
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+
+from users.models import Follow, User, UserProfile
+from utils.storage_backends import LocalStorageBackend
+from .images import upload_post_image
+from .models import Comment, Like, Post, TimelineEntry
+from .timeline import backfill, fan_out_post, feed_posts, feed_queryset, followers_removed, push_post, push_recent_posts
+
+
+class HotQueryIndexTests(TestCase):
+    """The feed, post and comment listings must be served from the composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='secret')
+            for i in range(10)
+        ]
+        cls.viewer = users[0]
+        for user in users[1:]:
+            Follow.objects.create(follower=cls.viewer, following=user)
+
+        for user in users:
+            for i in range(10):
+                post = Post.objects.create(user=user, content=f'post {i}')
+                Comment.objects.create(post=post, user=cls.viewer, content='comment')
+        cls.post = post
+
+    # How each backend's EXPLAIN output shows a table being read through an index
+    INDEX_SCANS = {
+        'postgresql': r'(Index (Only )?Scan (Backward )?using|Bitmap Index Scan on) {name}\b',
+        'sqlite': r'USING (COVERING )?INDEX {name}\b',
+    }
+
+    def assertUsesIndex(self, queryset, name):
+        pattern = self.INDEX_SCANS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'No EXPLAIN format known for {connection.vendor}')
+        # Tiny tables make a sequential scan look cheapest to Postgres
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertRegex(queryset.explain(), pattern.format(name=re.escape(name)))
+
+    def test_feed_uses_post_user_created_index(self):
+        posts = feed_queryset(self.viewer).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(posts, 'posts_post_user_created_idx')
+
+    def test_user_posts_use_post_user_created_index(self):
+        posts = Post.objects.filter(user=self.viewer).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(posts, 'posts_post_user_created_idx')
+
+    def test_post_comments_use_comment_post_created_index(self):
+        comments = Comment.objects.filter(post=self.post).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(comments, 'posts_comment_post_created_idx')
+
+    def test_timeline_uses_timeline_owner_index(self):
+        entries = TimelineEntry.objects.filter(owner=self.viewer).order_by('-created_at', '-post_id')[:20]
+        self.assertUsesIndex(entries, 'posts_timeline_owner_idx')
+
+    def test_followers_use_following_index(self):
+        follows = Follow.objects.filter(following=self.post.user).values('follower_id')
+        self.assertUsesIndex(follows, 'users_follow_following_idx')
+
+
+@override_settings(FEED_FANOUT_ENABLED=True, FEED_FANOUT_MAX_FOLLOWERS=1, FEED_TIMELINE_MAX_ENTRIES=4)
+class TimelineTests(TestCase):
+    """Fan-out feeds: timeline reads merged with pulled authors, trimming and mode changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer, cls.pushed, cls.pulled, cls.other = [
+            User.objects.create_user(username=f'tl{i}', email=f'tl{i}@example.com', password='secret')
+            for i in range(4)
+        ]
+        for follower, following in [(cls.viewer, cls.pushed), (cls.viewer, cls.pulled), (cls.other, cls.pulled)]:
+            Follow.objects.create(follower=follower, following=following)
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in User.objects.filter(username__startswith='tl')])
+        call_command('reconcile_counters', stdout=io.StringIO())
+
+    def post(self, author, content):
+        post = Post.objects.create(user=author, content=content)
+        push_post(post.id, author.id, post.created_at)
+        return post
+
+    def test_pages_merge_timeline_and_pulled_authors(self):
+        posts = [self.post(author, f'post {i}') for i in range(3) for author in (self.pushed, self.pulled)]
+        # An entry from before the pulled author grew past the limit is not shown twice
+        TimelineEntry.objects.create(owner=self.viewer, post=posts[1], created_at=posts[1].created_at)
+
+        seen, after = [], None
+        while True:
+            page = feed_posts(self.viewer, limit=2, after=after)
+            seen.extend(page)
+            if len(page) < 2:
+                break
+            after = (page[-1].created_at, page[-1].id)
+        self.assertEqual([post.id for post in seen], [post.id for post in reversed(posts)])
+
+    def test_timelines_are_trimmed_to_max_entries(self):
+        posts = [Post.objects.create(user=self.pushed, content=f'post {i}') for i in range(6)]
+        backfill(self.viewer, self.pushed)
+        kept = TimelineEntry.objects.filter(owner=self.viewer).order_by('-created_at', '-post_id')
+        self.assertEqual([entry.post_id for entry in kept], [post.id for post in reversed(posts)][:4])
+
+    def test_author_leaving_pull_mode_is_pushed_to_followers(self):
+        post = self.post(self.pulled, 'written in pull mode')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+        Follow.objects.filter(follower=self.other, following=self.pulled).delete()
+        UserProfile.objects.filter(user=self.pulled).update(followers_count=F('followers_count') - 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            followers_removed(self.pulled)
+        self.assertEqual(len(callbacks), 1)
+
+        push_recent_posts(self.pulled.id)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, post=post).exists())
+
+    def test_full_pool_pushes_on_the_request_thread(self):
+        post = Post.objects.create(user=self.pushed, content='pool is full')
+        with mock.patch('posts.timeline.get_pool') as get_pool, self.assertLogs('posts.timeline', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            get_pool.return_value.submit.return_value = False
+            fan_out_post(post)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, post=post).exists())
+
+
+
+class ImageFailureTests(TestCase):
+    def test_failed_upload_invalidates_cached_posts(self):
+        author = User.objects.create_user(username='uploader', email='uploader@example.com', password='secret')
+        post = Post.objects.create(user=author, content='with image', image_status=Post.IMAGE_PENDING)
+        with mock.patch('posts.images.load_image_bytes', side_effect=ValueError), \
+                mock.patch('posts.signals.invalidate') as invalidate, self.assertLogs('posts.images'):
+            upload_post_image(post.id, author.id, 'not an image')
+
+        self.assertEqual(Post.objects.get(id=post.id).image_status, Post.IMAGE_FAILED)
+        invalidate.assert_called_once_with('posts:uploader', f'comments:{post.id}')
+
+class DirectUploadTests(TestCase):
+    """requestUploadUrl -> PUT -> finalizeUpload/finalizeProfileUpload against LocalStorageBackend"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader', email='uploader@example.com', password='secret')
+        UserProfile.objects.create(user=cls.user)
+        cls.post = Post.objects.create(user=cls.user, content='post')
+
+    def setUp(self):
+        storage_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(LOCAL_STORAGE_ROOT=storage_root))
+        self.enterContext(mock.patch('utils.storage_backends._backend', LocalStorageBackend()))
+
+    def graphql(self, query, **variables):
+        response = self.client.post(
+            '/graphql/', json.dumps({'query': query, 'variables': variables}), content_type='application/json',
+            HTTP_AUTHORIZATION=f'JWT {get_token(self.user)}',
+        )
+        return response.json()['data']
+
+    def upload(self, purpose, data=b'image bytes'):
+        issued = self.graphql(
+            'mutation($purpose: UploadPurpose!, $size: Int!) {'
+            ' requestUploadUrl(purpose: $purpose, contentType: "image/png", size: $size) { uploadId uploadUrl method } }',
+            purpose=purpose, size=len(data),
+        )['requestUploadUrl']
+        self.assertEqual(issued['method'], 'PUT')
+        response = self.client.put(issued['uploadUrl'], data, content_type='image/png')
+        self.assertEqual(response.status_code, 201)
+        return issued['uploadId']
+
+    def finalize(self, upload_id, post_id):
+        return self.graphql(
+            'mutation($uploadId: String!, $postId: ID!) {'
+            ' finalizeUpload(uploadId: $uploadId, postId: $postId) { success message } }',
+            uploadId=upload_id, postId=post_id,
+        )['finalizeUpload']
+
+    def finalize_profile(self, upload_id):
+        return self.graphql(
+            'mutation($uploadId: String!) { finalizeProfileUpload(uploadId: $uploadId) { success message } }',
+            uploadId=upload_id,
+        )['finalizeProfileUpload']
+
+    def test_post_image_upload_is_attached_once(self):
+        upload_id = self.upload('POST_IMAGE')
+        self.assertTrue(self.finalize(upload_id, self.post.id)['success'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_status, Post.IMAGE_PENDING)
+
+        replay = self.finalize(upload_id, self.post.id)
+        self.assertEqual(replay, {'success': False, 'message': 'Upload id has already been used'})
+
+    def test_upload_must_match_the_mutation_purpose(self):
+        post_image = self.upload('POST_IMAGE')
+        self.assertFalse(self.finalize_profile(post_image)['success'])
+
+        profile_image = self.upload('PROFILE_IMAGE')
+        self.assertFalse(self.finalize(profile_image, self.post.id)['success'])
+        self.assertTrue(self.finalize_profile(profile_image)['success'])
+        self.assertEqual(UserProfile.objects.get(user=self.user).profile_image_status, UserProfile.IMAGE_PENDING)
+
+
+class LikeInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.fan = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='secret')
+            for name in ('liked', 'fan')
+        ]
+        cls.post = Post.objects.create(user=cls.author, content='post')
+
+    def test_like_mutations_invalidate_the_author_without_looking_it_up(self):
+        for mutation in ('likePost', 'unlikePost'):
+            with self.subTest(mutation), mock.patch('posts.signals.invalidate') as invalidate, \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    '/graphql/', json.dumps({'query': f'mutation {{ {mutation}(postId: {self.post.id}) {{ success }} }}'}),
+                    content_type='application/json', HTTP_AUTHORIZATION=f'JWT {get_token(self.fan)}',
+                )
+                self.assertTrue(response.json()['data'][mutation]['success'])
+                invalidate.assert_called_once_with(f'posts:{self.author.username}', f'comments:{self.post.id}')
+                self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "users_user"."username" AS')])
+
+    def unlike(self):
+        response = self.client.post(
+            '/graphql/', json.dumps({'query': f'mutation {{ unlikePost(postId: {self.post.id}) {{ success }} }}'}),
+            content_type='application/json', HTTP_AUTHORIZATION=f'JWT {get_token(self.fan)}',
+        )
+        self.assertTrue(response.json()['data']['unlikePost']['success'])
+        return Post.objects.get(id=self.post.id).likes_count
+
+    def test_unlike_does_not_take_a_drifted_count_below_zero(self):
+        Like.objects.create(user=self.fan, post=self.post)
+        Post.objects.filter(id=self.post.id).update(likes_count=0)
+        self.assertEqual(self.unlike(), 0)
+
+    def test_unlike_losing_a_race_does_not_decrement(self):
+        Like.objects.create(user=self.fan, post=self.post)
+        Post.objects.filter(id=self.post.id).update(likes_count=2)
+
+        def concurrent_unlike(sender, instance, **kwargs):
+            # Another request deletes the like between this one reading and deleting it
+            Like.objects.filter(pk=instance.pk)._raw_delete(connection.alias)
+        pre_delete.connect(concurrent_unlike, sender=Like)
+        self.addCleanup(pre_delete.disconnect, concurrent_unlike, sender=Like)
+
+        self.assertEqual(self.unlike(), 2)
+
+
+class BulkLikeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.fan = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='secret')
+            for name in ('bulkauthor', 'bulkfan')
+        ]
+        cls.first, cls.second, cls.liked = [Post.objects.create(user=cls.author, content=f'post {i}') for i in range(3)]
+        Like.objects.create(user=cls.fan, post=cls.liked)
+        Post.objects.filter(id=cls.liked.id).update(likes_count=1)
+
+    def like_posts(self, post_ids):
+        response = self.client.post(
+            '/graphql/', json.dumps({
+                'query': 'mutation($ids: [ID!]!) { likePosts(postIds: $ids) { success results { target success message } } }',
+                'variables': {'ids': post_ids},
+            }),
+            content_type='application/json', HTTP_AUTHORIZATION=f'JWT {get_token(self.fan)}',
+        )
+        return response.json()
+
+    def test_results_per_post_and_counters(self):
+        padded = f'00{self.first.id}'
+        data = self.like_posts([padded, str(self.second.id), str(self.liked.id), '999999', 'abc', str(self.first.id)])
+        result = data['data']['likePosts']
+
+        self.assertFalse(result['success'])
+        self.assertEqual(
+            [(r['target'], r['success'], r['message']) for r in result['results']],
+            [
+                (str(self.first.id), True, 'Post liked successfully'),
+                (str(self.second.id), True, 'Post liked successfully'),
+                (str(self.liked.id), False, 'You have already liked this post'),
+                ('999999', False, 'Post not found'),
+                ('abc', False, 'Post not found'),
+            ],
+        )
+        counts = dict(Post.objects.filter(user=self.author).values_list('id', 'likes_count'))
+        self.assertEqual(counts, {self.first.id: 1, self.second.id: 1, self.liked.id: 1})
+        self.assertEqual(Like.objects.filter(user=self.fan).count(), 3)
+
+    def test_at_most_100_posts(self):
+        data = self.like_posts([str(i) for i in range(1, 102)])
+        self.assertEqual(data['errors'][0]['message'], 'At most 100 targets can be given at once')
+        self.assertFalse(Like.objects.filter(user=self.fan).exclude(post=self.liked).exists())
@@ -0,0 +1,205 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Follow, UserProfile
+from utils.background import get_pool
+from utils.pagination import after_filter
+from .models import Post, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+# Followers written (and trimmed) per statement when pushing a post
+FAN_OUT_BATCH_SIZE = 1000
+
+
+def fanout_enabled():
+    return settings.FEED_FANOUT_ENABLED
+
+
+def pull_author_ids(author_ids):
+    """
+    Return the authors among author_ids that have too many followers to fan
+    out to; their posts are merged into feeds at read time instead.
+    """
+    return list(
+        UserProfile.objects.filter(user_id__in=author_ids, followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values_list('user_id', flat=True)
+    )
+
+
+def trim(owner_ids):
+    """Drop the entries past FEED_TIMELINE_MAX_ENTRIES from the owners' timelines"""
+    overflow = (
+        TimelineEntry.objects.filter(owner_id__in=owner_ids)
+        .annotate(position=Window(
+            RowNumber(), partition_by=F('owner_id'), order_by=[F('created_at').desc(), F('post_id').desc()],
+        ))
+        .filter(position__gt=settings.FEED_TIMELINE_MAX_ENTRIES)
+        .values_list('id', flat=True)
+    )
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        TimelineEntry.objects.filter(id__in=overflow_ids).delete()
+
+
+def _push(author_id, posts, trimming):
+    """Write (post id, created_at) pairs of one author into each follower's timeline"""
+    follower_ids = Follow.objects.filter(following_id=author_id).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) == FAN_OUT_BATCH_SIZE:
+            _write(batch, posts, trimming)
+            batch = []
+    if batch:
+        _write(batch, posts, trimming)
+
+
+def _write(owner_ids, posts, trimming):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner_id=owner_id, post_id=post_id, created_at=created_at)
+            for owner_id in owner_ids
+            for post_id, created_at in posts
+        ],
+        batch_size=FAN_OUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    if trimming:
+        trim(owner_ids)
+
+
+def push_post(post_id, author_id, created_at):
+    """Push a post into the timeline of every follower of its author"""
+    if pull_author_ids([author_id]):
+        return
+    # Trimming scans the whole timelines, so only every FEED_TIMELINE_TRIM_EVERY-th post pays for it
+    _push(author_id, [(post_id, created_at)], trimming=post_id % settings.FEED_TIMELINE_TRIM_EVERY == 0)
+
+
+def push_recent_posts(author_id):
+    """Push an author's latest FEED_TIMELINE_BACKFILL posts into their followers' timelines"""
+    if pull_author_ids([author_id]):
+        return
+    recent = list(
+        Post.objects.filter(user_id=author_id)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:settings.FEED_TIMELINE_BACKFILL]
+    )
+    if recent:
+        _push(author_id, recent, trimming=True)
+
+
+def _submit_on_commit(fn, *args):
+    def submit():
+        if get_pool('fanout').submit(fn, *args):
+            return
+        # Dropping the push would leave the post out of the timelines until rebuild_timelines runs
+        logger.warning("Fan-out pool full, running %s%r on the request thread", fn.__name__, args)
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("Fan-out %s%r failed", fn.__name__, args)
+
+    transaction.on_commit(submit)
+
+
+def fan_out_post(post):
+    """Push a new post into its author's followers' timelines in the background once it is committed"""
+    if not fanout_enabled():
+        return
+    _submit_on_commit(push_post, post.id, post.user_id, post.created_at)
+
+
+def followers_removed(*authors):
+    """
+    Call after lowering the authors' followers_count. Authors that just
+    dropped back to FEED_FANOUT_MAX_FOLLOWERS leave pull mode, so their recent
+    posts, which were only merged in at read time, are pushed to their
+    followers' timelines.
+    """
+    if not fanout_enabled():
+        return
+    rejoined = UserProfile.objects.filter(
+        user__in=authors, followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('user_id', flat=True)
+    for author_id in rejoined:
+        _submit_on_commit(push_recent_posts, author_id)
+
+
+def backfill(follower, *followees):
+    """Copy the most recent posts of newly followed users into the follower's timeline"""
+    if not fanout_enabled():
+        return
+    pulled = set(pull_author_ids([followee.id for followee in followees]))
+    author_ids = [followee.id for followee in followees if followee.id not in pulled]
+    if not author_ids:
+        return
+
+    # The latest FEED_TIMELINE_BACKFILL posts of each author, in one query
+    recent = (
+        Post.objects.filter(user_id__in=author_ids)
+        .annotate(position=Window(RowNumber(), partition_by=F('user_id'), order_by=F('created_at').desc()))
+        .filter(position__lte=settings.FEED_TIMELINE_BACKFILL)
+        .values_list('id', 'created_at')
+    )
+    entries = [
+        TimelineEntry(owner_id=follower.id, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+    trim([follower.id])
+
+
+def prune(follower, *followees):
+    """Remove unfollowed users' posts from the follower's timeline"""
+    TimelineEntry.objects.filter(owner=follower, post__user__in=followees).delete()
+
+
+def feed_queryset(user):
+    """
+    Posts from every user that user follows, for filtering and scoring. Pages
+    of the feed are read with feed_posts.
+    """
+    # Get IDs of user being followed
+    following_ids = user.following.values_list('following_id', flat=True)
+    return Post.objects.filter(user_id__in=following_ids)
+
+
+def feed_posts(user, limit=None, after=None):
+    """
+    The user's feed, newest first, as a list of posts with their authors.
+
+    after holds the (created_at, id) of the last post already shown. With
+    fan-out enabled the page is one range scan of the user's timeline, merged
+    with the posts of followed authors too large to fan out (whose timeline
+    entries, from before they grew, are skipped). Otherwise it is pulled from
+    the posts of everyone the user follows.
+    """
+    ordering = ('created_at', 'id')
+    if not fanout_enabled():
+        posts = feed_queryset(user).select_related('user').order_by('-created_at', '-id')
+        if after:
+            posts = posts.filter(after_filter(ordering, after))
+        return list(posts[:limit])
+
+    pulled_ids = pull_author_ids(user.following.values_list('following_id', flat=True))
+    entries = TimelineEntry.objects.filter(owner=user).select_related('post__user').order_by('-created_at', '-post_id')
+    if after:
+        entries = entries.filter(after_filter(('created_at', 'post_id'), after))
+    if pulled_ids:
+        entries = entries.exclude(post__user_id__in=pulled_ids)
+    posts = [entry.post for entry in entries[:limit]]
+    if not pulled_ids:
+        return posts
+
+    pulled = Post.objects.filter(user_id__in=pulled_ids).select_related('user').order_by('-created_at', '-id')
+    if after:
+        pulled = pulled.filter(after_filter(ordering, after))
+    posts.extend(pulled[:limit])
+    posts.sort(key=lambda post: (post.created_at, post.id), reverse=True)
+    return posts[:limit]
@@ -2,6 +2,9 @@
 ASGI config for social_media_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django (with /graphql/ on the async view when
+GRAPHQL_ASYNC is set), and websocket connections to /graphql/ carry GraphQL
+subscriptions.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +16,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_media_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up since the schema loads the models
+from social_media_project.schema import schema  # noqa: E402
+from social_media_project.websocket import GraphQLWebSocketApp  # noqa: E402
+
+graphql_websocket_application = GraphQLWebSocketApp(schema)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'].rstrip('/') == '/graphql':
+            await graphql_websocket_application(scope, receive, send)
+        else:
+            await send({'type': 'websocket.close'})
+        return
+    await django_application(scope, receive, send)
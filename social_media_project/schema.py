@@ -1,11 +1,15 @@
 import graphene
-from users.schema import Mutation as UsersMutation, Query as usersQuery
-from posts.schema import Mutation as postsMutation, Query as postsQuery
+from users.schema import Mutation as UsersMutation, Query as usersQuery, Subscription as usersSubscription
+from posts.schema import Mutation as postsMutation, Query as postsQuery, Subscription as postsSubscription
+from notifications.schema import Mutation as notificationsMutation, Query as notificationsQuery
 
-class Query(usersQuery, postsQuery):
+class Query(usersQuery, postsQuery, notificationsQuery):
     pass
 
-class Mutation(UsersMutation, postsMutation):
+class Mutation(UsersMutation, postsMutation, notificationsMutation):
     pass
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Subscription(usersSubscription, postsSubscription):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
\ No newline at end of file
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
     'users',
     'posts',
     'notifications',
+    'uploads',
+    'benchmarks',
     'graphene_django',
     'rest_framework',
     'corsheaders',
@@ -93,6 +95,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'social_media_project.wsgi.application'
+ASGI_APPLICATION = 'social_media_project.asgi.application'
 
 
 # Database
@@ -101,10 +104,48 @@ WSGI_APPLICATION = 'social_media_project.wsgi.application'
 DATABASES = {
      'default': dj_database_url.config(
         default=env("DATABASE_URL"),
-        conn_max_age=600
+        conn_max_age=600,
+        conn_health_checks=env.bool('DATABASE_HEALTH_CHECKS', default=True),
     )
 }
 
+# Read replicas for GraphQL queries, see utils/db_routing.py. Tests read
+# the primary's test database through them.
+DATABASE_REPLICA_URLS = env.list('DATABASE_REPLICA_URLS', default=[])
+for i, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica_{i}'] = {
+        **dj_database_url.parse(url, conn_max_age=600, conn_health_checks=DATABASES['default']['CONN_HEALTH_CHECKS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Connection pools for PostgreSQL databases (psycopg 3), one per database and
+# process, replacing persistent connections. Each process keeps
+# DATABASE_POOL_SIZE connections open and opens up to DATABASE_POOL_MAX_OVERFLOW
+# more under load; a request waits up to DATABASE_POOL_TIMEOUT seconds for one.
+# With health checks on, connections are checked when taken from the pool.
+DATABASE_POOL = env.bool('DATABASE_POOL', default=True)
+if DATABASE_POOL:
+    for database in DATABASES.values():
+        if database['ENGINE'] != 'django.db.backends.postgresql':
+            continue
+        database['CONN_MAX_AGE'] = 0
+        pool_size = env.int('DATABASE_POOL_SIZE', default=4)
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': pool_size,
+            'max_size': pool_size + env.int('DATABASE_POOL_MAX_OVERFLOW', default=6),
+            'timeout': env.float('DATABASE_POOL_TIMEOUT', default=10.0),
+            'max_idle': env.float('DATABASE_POOL_MAX_IDLE', default=300.0),
+            'max_lifetime': env.float('DATABASE_POOL_MAX_LIFETIME', default=1800.0),
+        }
+
+DATABASE_ROUTERS = ['utils.db_routing.ReplicaRouter']
+
+# After a mutation its user reads from the primary for this many seconds. The
+# pins are kept in DATABASE_STICKY_CACHE, which must be shared by all web
+# processes (not locmem) when there are replicas; `manage.py check` fails otherwise.
+DATABASE_STICKY_SECONDS = env.int('DATABASE_STICKY_SECONDS', default=5)
+DATABASE_STICKY_CACHE = env('DATABASE_STICKY_CACHE', default='default')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -155,12 +196,129 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
     "SCHEMA": "social_media_project.schema.schema",
     "MIDDLEWARE": [
-        "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        "utils.auth.JSONWebTokenMiddleware",
+        # Last, so it wraps the other middleware
+        "utils.tracing.TracingMiddleware",
     ],
 }
 
+# Serve /graphql/ with the async view under ASGI. Opt-in: the resolvers stay
+# synchronous, so a request's queries still run one after another
+GRAPHQL_ASYNC = env.bool('GRAPHQL_ASYNC', default=False)
+
+# Tracing: requests sending GRAPHQL_TRACING_HEADER get per-field timings and SQL in
+# extensions.tracing when GRAPHQL_TRACING_ALLOWED is on (staff users always may).
+# GRAPHQL_TRACING_SAMPLE_RATE of other requests are traced for /metrics only.
+GRAPHQL_TRACING_HEADER = 'X-GraphQL-Trace'
+GRAPHQL_TRACING_ALLOWED = env.bool('GRAPHQL_TRACING_ALLOWED', default=DEBUG)
+GRAPHQL_TRACING_SAMPLE_RATE = env.float('GRAPHQL_TRACING_SAMPLE_RATE', default=0.0)
+# A field running the same SQL statement this many times in one request is reported as an N+1
+GRAPHQL_N_PLUS_ONE_THRESHOLD = env.int('GRAPHQL_N_PLUS_ONE_THRESHOLD', default=5)
+
+# Bearer token Prometheus must send to read /metrics; without one /metrics is only served with DEBUG on
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Token -> user cache used by utils.auth, entries live for at most JWT_USER_CACHE_TTL seconds
+JWT_USER_CACHE_TTL = env.int('JWT_USER_CACHE_TTL', default=60)
+JWT_USER_CACHE_SIZE = env.int('JWT_USER_CACHE_SIZE', default=1000)
+
+# Query cost limits, see utils/query_cost.py
+GRAPHQL_MAX_QUERY_COST = env.int('GRAPHQL_MAX_QUERY_COST', default=5000)
+GRAPHQL_MAX_QUERY_DEPTH = env.int('GRAPHQL_MAX_QUERY_DEPTH', default=10)
+# Items assumed for lists that are neither paginated nor bounded by the schema
+GRAPHQL_COST_UNBOUNDED_LIST_SIZE = env.int('GRAPHQL_COST_UNBOUNDED_LIST_SIZE', default=500)
+GRAPHQL_FIELD_COSTS = {}
+
+# Persisted queries: a JSON file of sha256 -> query shipped with the clients,
+# plus automatic persisted queries registered at runtime in the APQ cache
+GRAPHQL_PERSISTED_QUERIES_FILE = env('GRAPHQL_PERSISTED_QUERIES_FILE', default=None)
+GRAPHQL_APQ_ENABLED = env.bool('GRAPHQL_APQ_ENABLED', default=True)
+GRAPHQL_APQ_CACHE = 'default'
+GRAPHQL_APQ_TTL = env.int('GRAPHQL_APQ_TTL', default=24 * 60 * 60)
+# Number of parsed and validated documents kept in memory
+GRAPHQL_DOCUMENT_CACHE_SIZE = env.int('GRAPHQL_DOCUMENT_CACHE_SIZE', default=500)
+
+# Response cache for public read queries, see utils/response_cache.py. Off by
+# default: a write only invalidates the cache it can reach, so every process
+# has to share it (CACHE_URL pointing at Redis or Memcached). LocalMemoryBackend
+# only suits a single process, and the checks refuse it otherwise.
+GRAPHQL_RESPONSE_CACHE_ENABLED = env.bool('GRAPHQL_RESPONSE_CACHE_ENABLED', default=False)
+GRAPHQL_RESPONSE_CACHE_BACKEND = env('GRAPHQL_RESPONSE_CACHE_BACKEND', default='utils.response_cache.DjangoCacheBackend')
+GRAPHQL_RESPONSE_CACHE_ALIAS = 'default'
+GRAPHQL_RESPONSE_CACHE_TTL = env.int('GRAPHQL_RESPONSE_CACHE_TTL', default=300)
+GRAPHQL_RESPONSE_CACHE_MAX_ENTRIES = env.int('GRAPHQL_RESPONSE_CACHE_MAX_ENTRIES', default=10000)
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Feed timelines: when fan-out is enabled new posts are pushed into each
+# follower's timeline on write. Authors with more followers than
+# FEED_FANOUT_MAX_FOLLOWERS are skipped and merged into feeds on read instead.
+FEED_FANOUT_ENABLED = env.bool('FEED_FANOUT_ENABLED', default=False)
+FEED_FANOUT_MAX_FOLLOWERS = env.int('FEED_FANOUT_MAX_FOLLOWERS', default=5000)
+FEED_TIMELINE_BACKFILL = env.int('FEED_TIMELINE_BACKFILL', default=200)
+# Timelines keep their newest FEED_TIMELINE_MAX_ENTRIES posts. Fan-out trims
+# them on every FEED_TIMELINE_TRIM_EVERY-th post, so they can briefly hold more.
+FEED_TIMELINE_MAX_ENTRIES = env.int('FEED_TIMELINE_MAX_ENTRIES', default=800)
+FEED_TIMELINE_TRIM_EVERY = env.int('FEED_TIMELINE_TRIM_EVERY', default=20)
+# Posts are pushed to followers on the "fanout" background pool, or on the
+# request thread when it already holds FEED_FANOUT_MAX_PENDING jobs
+FEED_FANOUT_WORKERS = env.int('FEED_FANOUT_WORKERS', default=2)
+FEED_FANOUT_MAX_PENDING = env.int('FEED_FANOUT_MAX_PENDING', default=1000)
+
+# "Who to follow" suggestions are computed by the build_suggestions command
+# (run it periodically) and stored in this cache alias, which must be shared
+# with the web processes for them to see the results; the command refuses to
+# run against a locmem or dummy cache.
+SUGGESTIONS_CACHE = env('SUGGESTIONS_CACHE', default='default')
+SUGGESTIONS_TTL = env.int('SUGGESTIONS_TTL', default=2 * 24 * 60 * 60)
+SUGGESTIONS_PER_USER = env.int('SUGGESTIONS_PER_USER', default=50)
+
+# Ranked feed: candidates are the newest FEED_RANKING_CANDIDATES feed posts from
+# the last FEED_RANKING_WINDOW hours, with recency halving every
+# FEED_RANKING_HALF_LIFE hours. Rankings are cached per viewer and rebuilt in
+# the background once older than FEED_RANKING_REFRESH seconds.
+FEED_RANKING_CACHE = env('FEED_RANKING_CACHE', default='default')
+FEED_RANKING_WINDOW = env.int('FEED_RANKING_WINDOW', default=72)
+FEED_RANKING_CANDIDATES = env.int('FEED_RANKING_CANDIDATES', default=500)
+FEED_RANKING_HALF_LIFE = env.float('FEED_RANKING_HALF_LIFE', default=12.0)
+FEED_RANKING_REFRESH = env.int('FEED_RANKING_REFRESH', default=60)
+FEED_RANKING_TTL = env.int('FEED_RANKING_TTL', default=60 * 60)
+FEED_RANKING_MAX_PENDING = env.int('FEED_RANKING_MAX_PENDING', default=100)
+
+# Notifications are queued by mutations and written in batches by a
+# background thread every NOTIFICATIONS_FLUSH_INTERVAL seconds.
+NOTIFICATIONS_ASYNC = env.bool('NOTIFICATIONS_ASYNC', default=True)
+NOTIFICATIONS_FLUSH_INTERVAL = env.float('NOTIFICATIONS_FLUSH_INTERVAL', default=2.0)
+NOTIFICATIONS_BATCH_SIZE = env.int('NOTIFICATIONS_BATCH_SIZE', default=500)
+
+# Backend delivering GraphQL subscription events. The in-process default only
+# reaches subscribers connected to the same server process.
+GRAPHQL_PUBSUB_BACKEND = env('GRAPHQL_PUBSUB_BACKEND', default='utils.pubsub.InProcessPubSub')
+
+# Image uploads run on a bounded background thread pool
+UPLOAD_WORKERS = env.int('UPLOAD_WORKERS', default=4)
+UPLOAD_MAX_PENDING = env.int('UPLOAD_MAX_PENDING', default=32)
+
+# Background thread pools (utils/background.py), one per kind of work
+BACKGROUND_POOLS = {
+    'uploads': {'workers': UPLOAD_WORKERS, 'max_pending': UPLOAD_MAX_PENDING},
+    'ranking': {'workers': 1, 'max_pending': FEED_RANKING_MAX_PENDING},
+    'fanout': {'workers': FEED_FANOUT_WORKERS, 'max_pending': FEED_FANOUT_MAX_PENDING},
+}
+
+# Object storage. LocalStorageBackend keeps files under LOCAL_STORAGE_ROOT for offline development
+STORAGE_BACKEND = env('STORAGE_BACKEND', default='utils.storage_backends.SupabaseStorageBackend')
+LOCAL_STORAGE_ROOT = env('LOCAL_STORAGE_ROOT', default=str(BASE_DIR / 'media'))
+LOCAL_STORAGE_URL = env('LOCAL_STORAGE_URL', default='/media/')
+
+# Direct uploads: largest accepted file and how long an upload URL stays valid, in seconds
+DIRECT_UPLOAD_MAX_BYTES = env.int('DIRECT_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024)
+DIRECT_UPLOAD_URL_TTL = env.int('DIRECT_UPLOAD_URL_TTL', default=900)
+
 SUPABASE_URL= env('SUPABASE_URL')
 SUPABASE_KEY = env('SUPABASE_KEY')
 SUPABASE_BUCKET_PROFILE = env('SUPABASE_BUCKET_PROFILE')
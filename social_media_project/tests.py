@@ -0,0 +1,257 @@
+import asyncio
+import io
+import json
+import struct
+import warnings
+import zlib
+from contextlib import asynccontextmanager
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql import parse, validate
+from graphql_jwt.shortcuts import get_token
+from PIL import Image
+
+from social_media_project.schema import schema
+from social_media_project.views import AsyncSocialGraphQLView
+from social_media_project.websocket import PROTOCOL, UNAUTHORIZED, GraphQLWebSocketApp
+from users.models import User, UserProfile
+from utils.auth import get_token_cache
+from utils.images import ImageProcessingError, decode_base64_image, process_image
+from utils.persisted_queries import query_hash
+from utils.pubsub import get_pubsub
+from utils.query_cost import query_cost_rule
+
+REPLICA = 'replica_1'
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # The runner only sets up the primary; the replica is added in setUpClass
+    databases = {DEFAULT_DB_ALIAS}
+
+    @classmethod
+    def setUpClass(cls):
+        # A replica that mirrors the primary's test database, for this class only
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': DEFAULT_DB_ALIAS}}
+        cls.addClassCleanup(cls.drop_replica)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', 'Overriding setting DATABASES')
+            cls.enterClassContext(override_settings(DATABASES={**settings.DATABASES, REPLICA: replica}))
+        # connections keeps the DATABASES it was first configured with
+        connections.settings = connections.configure_settings(settings.DATABASES)
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def drop_replica(cls):
+        # Runs after the DATABASES override is undone
+        if REPLICA in connections.settings:
+            connections[REPLICA].close()
+            del connections[REPLICA]
+        connections.settings = connections.configure_settings(settings.DATABASES)
+
+    def setUp(self):
+        caches[settings.DATABASE_STICKY_CACHE].clear()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        UserProfile.objects.create(user=self.user)
+        # The flush between tests does not send delete signals, so the cached token would outlive the user
+        self.addCleanup(get_token_cache().forget_user, self.user.pk)
+
+    def graphql(self, query):
+        return self.client.post(
+            '/graphql/', json.dumps({'query': query}), content_type='application/json',
+            HTTP_AUTHORIZATION=f'JWT {get_token(self.user)}',
+        )
+
+    def run_captured(self, query):
+        """Run query, returning the SQL sent to the primary and to the replica"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.graphql(query)
+        self.assertNotIn('errors', response.json())
+        return [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_query_reads_replica(self):
+        primary, replica = self.run_captured('{ feed { id } }')
+        self.assertTrue(any('posts_post' in sql for sql in replica))
+        self.assertFalse(any('posts_post' in sql for sql in primary))
+
+    def test_mutation_writes_primary_and_pins_user(self):
+        primary, replica = self.run_captured('mutation { createPost(content: "hello") { success } }')
+        self.assertTrue(any(sql.startswith('INSERT INTO "posts_post"') for sql in primary))
+        self.assertEqual(replica, [])
+
+        primary, replica = self.run_captured('{ feed { id } }')
+        self.assertTrue(any('posts_post' in sql for sql in primary))
+        self.assertEqual(replica, [])
+
+    @override_settings(GRAPHQL_RESPONSE_CACHE_ENABLED=True)
+    def test_cacheable_query_reads_primary(self):
+        primary, replica = self.run_captured('{ userProfile(username: "reader") { bio } }')
+        self.assertTrue(any('users_userprofile' in sql for sql in primary))
+        self.assertEqual(replica, [])
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async', email='async@example.com', password='secret')
+        UserProfile.objects.create(user=cls.user)
+
+    async def test_query_sql_is_recorded_in_the_metrics(self):
+        request = AsyncRequestFactory().post(
+            '/graphql/', json.dumps({'query': '{ feed { id } }'}), content_type='application/json',
+            headers={'Authorization': f'JWT {await sync_to_async(get_token)(self.user)}'},
+        )
+        with mock.patch('social_media_project.views.metrics.observe') as observe:
+            response = await AsyncSocialGraphQLView.as_view(schema=schema)(request)
+
+        self.assertNotIn('errors', json.loads(response.content))
+        tracer = observe.call_args.args[0]
+        self.assertGreater(tracer.sql_count, 0)
+
+
+class QueryCostTests(SimpleTestCase):
+    def check(self, query):
+        costs = []
+        errors = validate(schema.graphql_schema, parse(query), [query_cost_rule(on_cost=costs.append)])
+        return costs[0].cost, [error.message for error in errors]
+
+    def test_paginated_query_is_accepted(self):
+        cost, errors = self.check(
+            '{ feedConnection(first: 20) { edges { node { id imageVariants { url } user { id } } } } }'
+        )
+        # feedConnection, then 20 x (edge + node + 6 image variants + user)
+        self.assertEqual((cost, errors), (5 + 20 * (1 + 1 + 6 + 1), []))
+
+    def test_unpaginated_list_is_costed_as_unbounded(self):
+        cost, errors = self.check('{ feed { id imageVariants { url } user { id } } }')
+        self.assertEqual(cost, settings.GRAPHQL_COST_UNBOUNDED_LIST_SIZE * (5 + 6 + 1))
+        maximum = settings.GRAPHQL_MAX_QUERY_COST
+        self.assertEqual(errors, [f'Query cost {cost} exceeds the maximum allowed cost of {maximum}'])
+
+
+class ImageValidationTests(SimpleTestCase):
+    def encode(self, image_format, size=(4, 4)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    def assertRejected(self, data, message):
+        with self.assertRaisesMessage(ImageProcessingError, message):
+            process_image(data)
+
+    def test_valid_image_is_accepted(self):
+        processed = process_image(self.encode('PNG'))
+        self.assertEqual([(v.width, v.format) for v in processed.variants], [(4, 'WEBP'), (4, 'JPEG')])
+
+    def test_non_image_is_rejected(self):
+        self.assertRejected(b'<svg onload="alert(1)"></svg>', "File is not a supported image")
+
+    def test_unsupported_format_is_rejected(self):
+        self.assertRejected(self.encode('BMP'), "Unsupported image format BMP")
+
+    def test_oversized_dimensions_are_rejected_before_decoding(self):
+        # Rewrite the PNG header to claim 8000x8000 pixels; only the header
+        # is read before the size check, so nothing that large is allocated
+        data = bytearray(self.encode('PNG'))
+        data[16:24] = struct.pack('>II', 8_000, 8_000)
+        data[29:33] = struct.pack('>I', zlib.crc32(data[12:29]))
+        self.assertRejected(bytes(data), "Image dimensions are too large")
+
+    def test_invalid_base64_is_rejected(self):
+        with self.assertRaisesMessage(ImageProcessingError, "Image is not valid base64"):
+            decode_base64_image('data:image/png;base64,not base64!')
+
+
+class PersistedQueryTests(SimpleTestCase):
+    query = '{ __typename }'
+
+    def setUp(self):
+        caches[settings.GRAPHQL_APQ_CACHE].clear()
+
+    def post(self, sha256, query=None):
+        data = {'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256}}}
+        if query is not None:
+            data['query'] = query
+        return self.client.post('/graphql/', json.dumps(data), content_type='application/json').json()
+
+    def test_unknown_hash_is_registered_with_its_query(self):
+        sha256 = query_hash(self.query)
+        self.assertEqual(self.post(sha256)['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+        self.assertEqual(self.post(sha256, self.query)['data'], {'__typename': 'Query'})
+        self.assertEqual(self.post(sha256)['data'], {'__typename': 'Query'})
+
+    def test_hash_must_match_the_query(self):
+        wrong = query_hash('{ feed { id } }')
+        response = self.post(wrong, self.query)
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_HASH_MISMATCH')
+        self.assertEqual(self.post(wrong)['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+
+class WebSocketTests(TestCase):
+    """The graphql-transport-ws protocol, driven through the ASGI app"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.fan = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='secret')
+            for name in ('subscriber', 'fan')
+        ]
+
+    @asynccontextmanager
+    async def connect(self):
+        self.incoming, self.outgoing = asyncio.Queue(), asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/graphql/', 'subprotocols': [PROTOCOL]}
+        app = asyncio.create_task(GraphQLWebSocketApp(schema)(scope, self.incoming.get, self.outgoing.put))
+        await self.incoming.put({'type': 'websocket.connect'})
+        try:
+            self.assertEqual(await self.next_event(), {'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+            yield
+        finally:
+            await self.incoming.put({'type': 'websocket.disconnect'})
+            await asyncio.wait_for(app, 3)
+
+    async def next_event(self):
+        return await asyncio.wait_for(self.outgoing.get(), 3)
+
+    async def send(self, message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        return json.loads((await self.next_event())['text'])
+
+    async def wait_for_subscribers(self, channel, present):
+        for _ in range(300):
+            if (channel in get_pubsub()._subscribers) == present:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{channel} subscribers present: {not present}')
+
+    async def test_subscription_runs_from_init_to_complete(self):
+        async with self.connect():
+            token = await sync_to_async(get_token)(self.user)
+            await self.send({'type': 'connection_init', 'payload': {'Authorization': f'JWT {token}'}})
+            self.assertEqual(await self.receive(), {'type': 'connection_ack'})
+
+            channel = f'followers:{self.user.id}'
+            await self.send({'id': '1', 'type': 'subscribe', 'payload': {'query': 'subscription { newFollower { username } }'}})
+            await self.wait_for_subscribers(channel, present=True)
+            get_pubsub().publish(channel, {'follower_id': self.fan.id})
+            self.assertEqual(await self.receive(), {'id': '1', 'type': 'next', 'payload': {'data': {'newFollower': {'username': 'fan'}}}})
+
+            await self.send({'id': '1', 'type': 'complete'})
+            await self.wait_for_subscribers(channel, present=False)
+            await self.send({'type': 'ping'})
+            self.assertEqual(await self.receive(), {'type': 'pong'})
+
+    async def test_subscribe_before_init_closes_the_connection(self):
+        async with self.connect():
+            await self.send({'id': '1', 'type': 'subscribe', 'payload': {'query': 'subscription { newFollower { username } }'}})
+            self.assertEqual(await self.next_event(), {'type': 'websocket.close', 'code': UNAUTHORIZED, 'reason': 'Unauthorized'})
@@ -14,17 +14,29 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from users.views import index
-from django.urls import path
+from django.urls import path, re_path
+from django.views.static import serve
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
-
 from social_media_project.schema import schema
+from social_media_project.views import AsyncSocialGraphQLView, SocialGraphQLView
+from utils.direct_uploads import local_upload
+from utils.metrics import metrics_view
+
+GraphQLViewClass = AsyncSocialGraphQLView if settings.GRAPHQL_ASYNC else SocialGraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', index),
-    path('graphql/', csrf_exempt( GraphQLView.as_view(graphiql=True, schema=schema))),
+    path('graphql/', csrf_exempt(GraphQLViewClass.as_view(graphiql=True, schema=schema))),
+    path('uploads/<str:upload_id>/', local_upload, name='local-upload'),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+if settings.STORAGE_BACKEND == 'utils.storage_backends.LocalStorageBackend':
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.LOCAL_STORAGE_URL.lstrip('/'), serve, {'document_root': settings.LOCAL_STORAGE_ROOT}),
+    ]
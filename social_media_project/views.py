@@ -0,0 +1,293 @@
+from collections import namedtuple
+from contextlib import nullcontext
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, FieldNode, GraphQLError, OperationType, execute, get_operation_ast, validate
+
+from utils.async_execution import SyncResolverMiddleware
+from utils.auth import authenticate_request
+from utils.db_routing import reading_from, replica_for, stick_to_primary
+from utils.metrics import metrics
+from utils.persisted_queries import get_document_cache, resolve_query
+from utils.query_cost import query_cost_rule
+from utils.response_cache import get_response_cache
+from utils.tracing import Tracer
+
+
+PreparedOperation = namedtuple('PreparedOperation', ['schema', 'document', 'operation_ast', 'variables', 'operation_name'])
+
+
+class SocialGraphQLView(GraphQLView):
+    """
+    GraphQLView that accepts persisted queries, reuses parsed and validated
+    documents, rejects operations over the query cost budget, serves public
+    read queries from the response cache and reports the estimated cost and
+    cache status in the response extensions. Queries read from a replica
+    when there are any (see utils/db_routing.py). Every operation is traced
+    (see utils/tracing.py) and recorded in the aggregate metrics.
+    """
+
+    def get_response(self, request, data, show_graphiql=False):
+        tracer = request.graphql_tracer = Tracer()
+        with tracer.capture_sql():
+            result, status_code = super().get_response(request, data, show_graphiql)
+        if result is not None:
+            metrics.observe(tracer, failed=tracer.failed)
+        return result, status_code
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        prepared = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+
+        operation_ast = prepared.operation_ast
+        with request.graphql_tracer.phase('execution'), reading_from(replica_for(request, operation_ast)):
+            result = self.execute_document(request, *prepared)
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            stick_to_primary(request.user)
+        return result
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql=False, trace=True):
+        """
+        Authenticate, parse and validate a request. Returns a PreparedOperation,
+        or the ExecutionResult (None for GraphiQL) to answer with instead.
+        """
+        request.graphql_extensions = {}
+        tracer = getattr(request, 'graphql_tracer', None)
+        if tracer is None:
+            tracer = request.graphql_tracer = Tracer()
+        with tracer.phase('authentication'):
+            authenticate_request(request)
+        if trace:
+            tracer.configure(request)
+
+        with tracer.phase('parsing'):
+            try:
+                query = resolve_query(request, data, query)
+            except GraphQLError as e:
+                return ExecutionResult(errors=[e])
+
+            if not query:
+                if show_graphiql:
+                    return None
+                raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+            schema = self.schema.graphql_schema
+            document, validation_errors = get_document_cache(schema).get(schema, query)
+            if validation_errors:
+                return ExecutionResult(data=None, errors=validation_errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is not None:
+            tracer.root_fields = sorted({
+                selection.name.value for selection in operation_ast.selection_set.selections
+                if isinstance(selection, FieldNode)
+            })
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseNotAllowed(
+                ["POST"],
+                f"Can only perform a {operation_ast.operation.value} operation from a POST request.",
+            ))
+
+        # The cost depends on the variables, so it is checked on every request
+        def record_cost(cost):
+            request.graphql_extensions['cost'] = cost.as_dict()
+
+        with tracer.phase('validation'):
+            cost_errors = validate(schema, document, [query_cost_rule(variables, operation_name, on_cost=record_cost)])
+        if cost_errors:
+            return ExecutionResult(data=None, errors=cost_errors)
+        return PreparedOperation(schema, document, operation_ast, variables, operation_name)
+
+    def execute_document(self, request, schema, document, operation_ast, variables, operation_name):
+        """Execute a validated document, or answer it from the response cache"""
+        response_cache = get_response_cache()
+        cache_key = None
+        if response_cache is not None:
+            cache_key = response_cache.key_for(request, schema, document, operation_ast, variables)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            request.graphql_extensions['responseCache'] = 'HIT' if cached is not None else 'MISS'
+            if cached is not None:
+                return ExecutionResult(data=cached)
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            with self.cacheable_reads(cache_key):
+                result = execute(schema, document, **execute_options)
+            if cache_key and not result.errors:
+                response_cache.set(cache_key, result.data)
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    @staticmethod
+    def cacheable_reads(cache_key):
+        """
+        Read from the primary while computing a result for the response cache.
+        A lagging replica could otherwise return data that an invalidation
+        has just dropped, and the cache would keep serving it.
+        """
+        return reading_from(None) if cache_key else nullcontext()
+
+    def json_encode(self, request, d, pretty=False):
+        extensions = getattr(request, 'graphql_extensions', None)
+        if extensions:
+            d = {**d, 'extensions': extensions}
+        tracer = getattr(request, 'graphql_tracer', None)
+        if tracer is None:
+            return super().json_encode(request, d, pretty)
+
+        tracer.failed = bool(d.get('errors'))
+        with tracer.phase('serialization'):
+            content = super().json_encode(request, d, pretty)
+        if not tracer.report:
+            return content
+        # Encoded again so the trace includes the serialization it reports
+        d = {**d, 'extensions': {**d.get('extensions', {}), 'tracing': tracer.as_dict()}}
+        return super().json_encode(request, d, pretty)
+
+
+class AsyncSocialGraphQLView(SocialGraphQLView):
+    """
+    SocialGraphQLView served as an async view. Queries run with async
+    execution so a worker is not blocked while one request waits on the
+    database; a request's own database work still runs in one thread, one
+    resolver after another (see utils/async_execution.py), and the benchmark
+    compares its latency with the sync view's. Mutations run as in
+    the sync view, in one thread and transaction. Batched requests, GraphiQL
+    and detailed tracing fall back to the sync view. Enabled with
+    GRAPHQL_ASYNC.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        if (
+            request.method.lower() not in ("get", "post")
+            or self.batch
+            or settings.GRAPHQL_TRACING_HEADER in request.headers
+        ):
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            tracer = request.graphql_tracer = Tracer()
+            # The request's queries all run in one thread (thread sensitive sync_to_async), so count them there
+            capture = tracer.capture_sql()
+            await sync_to_async(capture.__enter__)()
+            try:
+                result, status_code = await self.get_response_async(request, data)
+            finally:
+                await sync_to_async(capture.__exit__)(None, None, None)
+            metrics.observe(tracer, failed=tracer.failed)
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        execution_result = await self.execute_graphql_request_async(request, data, query, variables, operation_name)
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(not getattr(e, "path", None) for e in execution_result.errors):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        return self.json_encode(request, response), status_code
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        # Authentication and persisted query lookups may query the database or cache
+        prepared = await sync_to_async(self.prepare_operation)(request, data, query, variables, operation_name, trace=False)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+
+        tracer = request.graphql_tracer
+        operation_ast = prepared.operation_ast
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            with tracer.phase('execution'):
+                result = await sync_to_async(self.execute_document)(request, *prepared)
+            if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                await sync_to_async(stick_to_primary)(request.user)
+            return result
+
+        replica = await sync_to_async(replica_for)(request, operation_ast)
+        with tracer.phase('execution'), reading_from(replica):
+            return await self.execute_query_async(request, *prepared)
+
+    async def execute_query_async(self, request, schema, document, operation_ast, variables, operation_name):
+        response_cache = get_response_cache()
+        cache_key = None
+        if response_cache is not None:
+            cache_key = await sync_to_async(response_cache.key_for)(request, schema, document, operation_ast, variables)
+        if cache_key:
+            cached = await sync_to_async(response_cache.get)(cache_key)
+            request.graphql_extensions['responseCache'] = 'HIT' if cached is not None else 'MISS'
+            if cached is not None:
+                return ExecutionResult(data=cached)
+
+        try:
+            with self.cacheable_reads(cache_key):
+                result = execute(
+                    schema,
+                    document,
+                    root_value=self.get_root_value(request),
+                    context_value=self.get_context(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    middleware=[SyncResolverMiddleware(), *self.get_middleware(request)],
+                )
+                if isawaitable(result):
+                    result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        if cache_key and not result.errors:
+            await sync_to_async(response_cache.set)(cache_key, result.data)
+        return result
@@ -0,0 +1,176 @@
+"""
+GraphQL subscriptions over WebSockets for the ASGI application.
+
+Implements the server side of the ``graphql-transport-ws`` protocol used by
+the graphql-ws client library: the client authenticates in
+``connection_init``, then starts subscriptions with ``subscribe`` messages and
+receives results as ``next`` messages until it sends ``complete``.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from graphql import ExecutionResult, GraphQLError
+from graphql_jwt.exceptions import JSONWebTokenError
+
+from utils.auth import get_user_for_token
+
+PROTOCOL = 'graphql-transport-ws'
+
+# Close codes defined by the protocol
+BAD_REQUEST = 4400
+UNAUTHORIZED = 4401
+FORBIDDEN = 4403
+INIT_TIMEOUT = 4408
+SUBSCRIBER_EXISTS = 4409
+TOO_MANY_INIT_REQUESTS = 4429
+
+CONNECTION_INIT_TIMEOUT = 10
+
+
+class SubscriptionContext:
+    """Stands in for the HTTP request as info.context while a subscription runs"""
+
+    def __init__(self, user):
+        self.user = user
+
+
+class GraphQLWebSocketConnection:
+    """State of one websocket connection and the subscriptions it is running"""
+
+    def __init__(self, schema, send):
+        self.schema = schema
+        self._send = send
+        self.user = AnonymousUser()
+        self.acknowledged = False
+        self.init_received = False
+        self.subscriptions = {}
+        self.closed = False
+
+    async def send_json(self, message):
+        if not self.closed:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def close(self, code, reason=''):
+        if not self.closed:
+            self.closed = True
+            await self._send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def authenticate(self, payload):
+        """Resolve the user from an "Authorization: JWT <token>" entry of the init payload"""
+        authorization = payload.get('Authorization') or payload.get('authorization') or ''
+        parts = authorization.split()
+        if not parts:
+            return AnonymousUser()
+        return await sync_to_async(get_user_for_token)(parts[-1]) or AnonymousUser()
+
+    async def handle(self, raw):
+        try:
+            message = json.loads(raw)
+            message_type = message['type']
+        except (ValueError, TypeError, KeyError):
+            await self.close(BAD_REQUEST, 'Invalid message received')
+            return
+
+        if message_type == 'connection_init':
+            if self.init_received:
+                await self.close(TOO_MANY_INIT_REQUESTS, 'Too many initialisation requests')
+                return
+            self.init_received = True
+            try:
+                self.user = await self.authenticate(message.get('payload') or {})
+            except JSONWebTokenError:
+                await self.close(FORBIDDEN, 'Forbidden')
+                return
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+
+        elif message_type == 'ping':
+            await self.send_json({'type': 'pong'})
+
+        elif message_type == 'pong':
+            pass
+
+        elif message_type == 'subscribe':
+            if not self.acknowledged:
+                await self.close(UNAUTHORIZED, 'Unauthorized')
+                return
+            operation_id = message.get('id')
+            if operation_id in self.subscriptions:
+                await self.close(SUBSCRIBER_EXISTS, f'Subscriber for {operation_id} already exists')
+                return
+            task = asyncio.create_task(self.run_subscription(operation_id, message.get('payload') or {}))
+            self.subscriptions[operation_id] = task
+
+        elif message_type == 'complete':
+            task = self.subscriptions.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+
+        else:
+            await self.close(BAD_REQUEST, f'Unexpected message type {message_type}')
+
+    async def run_subscription(self, operation_id, payload):
+        result = await self.schema.subscribe(
+            payload.get('query', ''),
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+            context_value=SubscriptionContext(self.user),
+        )
+        try:
+            if isinstance(result, ExecutionResult):
+                errors = [error.formatted for error in result.errors or []]
+                await self.send_json({'id': operation_id, 'type': 'error', 'payload': errors})
+                return
+
+            async for item in result:
+                await self.send_json({'id': operation_id, 'type': 'next', 'payload': item.formatted})
+            await self.send_json({'id': operation_id, 'type': 'complete'})
+        except GraphQLError as error:
+            # Raised by a subscribe_ resolver before its first event, e.g. for anonymous users
+            await self.send_json({'id': operation_id, 'type': 'error', 'payload': [error.formatted]})
+        finally:
+            if not isinstance(result, ExecutionResult):
+                await result.aclose()
+            self.subscriptions.pop(operation_id, None)
+
+    def stop(self):
+        self.closed = True
+        for task in self.subscriptions.values():
+            task.cancel()
+        self.subscriptions.clear()
+
+
+class GraphQLWebSocketApp:
+    """ASGI application serving GraphQL subscriptions over the graphql-transport-ws protocol"""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    async def __call__(self, scope, receive, send):
+        event = await receive()
+        if event['type'] != 'websocket.connect':
+            return
+        if PROTOCOL not in scope.get('subprotocols', []):
+            await send({'type': 'websocket.close', 'code': BAD_REQUEST})
+            return
+        await send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+
+        connection = GraphQLWebSocketConnection(self.schema, send)
+        init_timeout = asyncio.get_running_loop().call_later(
+            CONNECTION_INIT_TIMEOUT,
+            lambda: connection.init_received or asyncio.ensure_future(
+                connection.close(INIT_TIMEOUT, 'Connection initialisation timeout')
+            ),
+        )
+        try:
+            while not connection.closed:
+                event = await receive()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive':
+                    await connection.handle(event.get('text') or event.get('bytes'))
+        finally:
+            init_timeout.cancel()
+            connection.stop()
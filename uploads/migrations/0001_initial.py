@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+# Keep the existing claims, so upload ids that were already used cannot be replayed after the move
+def move_table(apps, schema_editor):
+    schema_editor.alter_db_table(None, 'posts_uploadclaim', 'uploads_uploadclaim')
+
+
+def move_table_back(apps, schema_editor):
+    schema_editor.alter_db_table(None, 'uploads_uploadclaim', 'posts_uploadclaim')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('posts', '0009_uploadclaim'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(move_table, move_table_back),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='UploadClaim',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('path', models.CharField(max_length=255, unique=True)),
+                        ('claimed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                    ],
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class UploadClaim(models.Model):
+    """A direct upload that was attached to a post or profile, so its upload id cannot be used again"""
+    path = models.CharField(max_length=255, unique=True)
+    claimed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"upload {self.path} claimed at {self.claimed_at}"
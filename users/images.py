@@ -0,0 +1,49 @@
+import logging
+
+from django.db import transaction
+
+from utils.direct_uploads import load_image_bytes
+from utils.storage import StorageManager
+from utils.background import get_pool
+from .models import UserProfile
+from .signals import profile_changed
+
+logger = logging.getLogger(__name__)
+
+
+def _mark_failed(profile_id, username):
+    UserProfile.objects.filter(id=profile_id).update(profile_image_status=UserProfile.IMAGE_FAILED)
+    # Cached results would otherwise keep showing the image as pending
+    profile_changed(username)
+
+
+def upload_profile_image(profile_id, username, image_source):
+    """
+    Process and upload a profile image in the background and record the outcome on the profile.
+    image_source is a base64 string or a direct upload ticket
+    """
+    try:
+        image_data = load_image_bytes(image_source)
+        stored = StorageManager.upload_profile_image(image_data, username)
+    except Exception:
+        logger.exception("Image upload for profile %s failed", profile_id)
+        _mark_failed(profile_id, username)
+        return
+
+    UserProfile.objects.filter(id=profile_id).update(
+        profile_image=stored.url,
+        profile_image_variants=stored.variants,
+        profile_image_placeholder=stored.placeholder,
+        profile_image_status=UserProfile.IMAGE_READY,
+    )
+    profile_changed(username)
+
+
+def schedule_profile_image(profile, image_source):
+    """Start the upload once the profile is committed so the worker can see it"""
+    def submit():
+        if not get_pool('uploads').submit(upload_profile_image, profile.id, profile.user.username, image_source):
+            logger.warning("Upload pool full, dropping image for profile %s", profile.id)
+            _mark_failed(profile.id, profile.user.username)
+
+    transaction.on_commit(submit)
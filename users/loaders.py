@@ -0,0 +1,31 @@
+from django.db.models import Q
+
+from utils.dataloader import get_loader, selects
+from .models import Follow
+
+
+def follow_state_loader(info):
+    """Loader mapping user id -> (current user follows them, they follow the current user)"""
+    user = info.context.user
+
+    def batch_load(user_ids):
+        state = {}
+        follows = Follow.objects.filter(
+            Q(follower=user, following_id__in=user_ids) | Q(following=user, follower_id__in=user_ids)
+        ).values_list('follower_id', 'following_id')
+        for follower_id, following_id in follows:
+            if follower_id == user.id:
+                is_following, follows_you = state.get(following_id, (False, False))
+                state[following_id] = (True, follows_you)
+            if following_id == user.id:
+                is_following, follows_you = state.get(follower_id, (False, False))
+                state[follower_id] = (is_following, True)
+        return state
+
+    return get_loader(info, 'users.follow_state', batch_load, default=(False, False))
+
+
+def prime_users(info, user_ids):
+    """Queue the users of a page so follow state is resolved with one query"""
+    if not info.context.user.is_anonymous and selects(info, 'isFollowing', 'followsYou'):
+        follow_state_loader(info).prime(user_ids)
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.suggestions import FollowGraph, store_suggestions
+from utils.checks import is_shared_cache
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's cached follow suggestions from the follow graph"
+
+    def handle(self, *args, **options):
+        if not is_shared_cache(settings.SUGGESTIONS_CACHE):
+            # The suggestions would only live in this process and never reach the web processes
+            raise CommandError(
+                f"SUGGESTIONS_CACHE ({settings.SUGGESTIONS_CACHE!r}) is local to this process; "
+                "point it at a cache shared with the web processes (e.g. set CACHE_URL)"
+            )
+        started = time.monotonic()
+        graph = FollowGraph.load()
+        loaded = time.monotonic()
+        stored = store_suggestions(graph)
+
+        self.stdout.write(
+            f"Loaded {len(graph.following)} follows between {len(graph)} users in {loaded - started:.2f}s, "
+            f"scored in {time.monotonic() - loaded:.2f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored suggestions for {stored} users"))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Follow = apps.get_model('users', 'Follow')
+
+    def count(field):
+        rows = Follow.objects.filter(**{field: OuterRef('user_id')}).order_by().values(field).annotate(total=Count('id'))
+        return Coalesce(Subquery(rows.values('total')), 0)
+
+    UserProfile.objects.update(followers_count=count('following_id'), following_count=count('follower_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_remove_user_bio_remove_user_profile_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_userprofile_followers_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'follower'], name='users_follow_following_idx'),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='follower',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='following', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='following',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='followers', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
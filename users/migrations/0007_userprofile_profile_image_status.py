@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    UserProfile.objects.exclude(profile_image__isnull=True).exclude(profile_image='').update(profile_image_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_follow_users_follow_following_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Uploading'), ('ready', 'Ready'), ('failed', 'Upload failed')], default='none', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_images_ready, migrations.RunPython.noop),
+    ]
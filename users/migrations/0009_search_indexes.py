@@ -0,0 +1,44 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# Trigram indexes on UPPER(column) serve the icontains filters of users.search.
+# They are PostgreSQL only, other databases search without an index.
+TRIGRAM_INDEXES = [
+    ('User', 'username', 'users_user_username_trgm'),
+    ('User', 'first_name', 'users_user_first_name_trgm'),
+    ('User', 'last_name', 'users_user_last_name_trgm'),
+    ('UserProfile', 'bio', 'users_profile_bio_trgm'),
+]
+
+
+def _indexes(apps):
+    for model_name, field, name in TRIGRAM_INDEXES:
+        index = GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=name)
+        yield apps.get_model('users', model_name), index
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for model, index in _indexes(apps):
+        schema_editor.add_index(model, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in _indexes(apps):
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_userprofile_profile_image_placeholder_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
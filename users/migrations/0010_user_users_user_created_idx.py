@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0009_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-created_at', '-id'], name='users_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_user_users_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', '-created_at', '-id'], name='users_follow_followers_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='users_follow_followed_idx'),
+        ),
+    ]
@@ -7,21 +7,54 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=30, blank=False)
     last_name = models.CharField(max_length=30, blank=False)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the users directory, newest first
+            models.Index(fields=['-created_at', '-id'], name='users_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
 class UserProfile(models.Model):
+    IMAGE_NONE = 'none'
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_NONE, 'No image'),
+        (IMAGE_PENDING, 'Uploading'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Upload failed'),
+    ]
+
     user = models.OneToOneField(User,on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     profile_image = models.ImageField(upload_to="profiles/", blank=True, null=True)
+    profile_image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default=IMAGE_NONE)
+    # Resized WebP/JPEG renditions as [{"width", "height", "format", "url"}]
+    profile_image_variants = models.JSONField(default=list, blank=True)
+    profile_image_placeholder = models.TextField(blank=True)
+    # Denormalized counters, kept current by the follow mutations
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
 class Follow(models.Model):
-    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
-    following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    # Indexed by the (follower, following) unique constraint
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following', db_index=False)
+    # Indexed by users_follow_following_idx, which leads with following_id
+    following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers', db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            # Follower listings; the unique constraint already covers follower -> following
+            models.Index(fields=['following', 'follower'], name='users_follow_following_idx'),
+            # Follower and following connections, newest first
+            models.Index(fields=['following', '-created_at', '-id'], name='users_follow_followers_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='users_follow_followed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} follows {self.followed.username}"
\ No newline at end of file
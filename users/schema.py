@@ -4,46 +4,132 @@ from graphene_django import DjangoObjectType
 from users.models import User, Follow, UserProfile
 from graphql_jwt.shortcuts import get_token
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Greatest
 from graphql import GraphQLError
 
-from utils.storage import StorageManager
+from notifications.delivery import notify
+from notifications.models import Notification
+from posts.models import Post
+from posts.timeline import backfill, followers_removed, prune
+from users.images import schedule_profile_image
+from users.loaders import follow_state_loader, prime_users
+from users.search import search_users
+from users.signals import profile_changed
+from users.suggestions import get_suggestions
+from utils.async_execution import inline_resolver
+from utils.direct_uploads import PROFILE_IMAGE, UploadError, claim_upload
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate_queryset
+from utils.pubsub import get_pubsub, publish_on_commit
+
+# Columns UserType reads, for querysets that only load what the API exposes
+USER_FIELDS = ("id", "username", "first_name", "last_name", "email", "created_at")
 
 class UserType(DjangoObjectType):
     """Represents a user and their profile information."""
+    is_following = graphene.Boolean(description="Whether the current authenticated user follows this user.")
+    follows_you = graphene.Boolean(description="Whether this user follows the current authenticated user.")
+
     class Meta:
         model = User
-        fields = ("id", "username","first_name", "last_name", "email", "created_at")
+        fields = USER_FIELDS
         description = "User profile data including social connections."
 
+    @inline_resolver
+    def resolve_is_following(self, info):
+        if info.context.user.is_anonymous:
+            return False
+        return follow_state_loader(info).load(self.id)[0]
+
+    @inline_resolver
+    def resolve_follows_you(self, info):
+        if info.context.user.is_anonymous:
+            return False
+        return follow_state_loader(info).load(self.id)[1]
+
+class UserConnection(graphene.relay.Connection):
+    """Cursor paginated list of users"""
+    class Meta:
+        node = UserType
+
+class ImageVariantType(graphene.ObjectType):
+    """A resized rendition of an uploaded image"""
+    width = graphene.Int(description="Width in pixels")
+    height = graphene.Int(description="Height in pixels")
+    format = graphene.String(description="Image format, webp or jpeg")
+    url = graphene.String(description="Public URL of this rendition")
+
+    @staticmethod
+    def from_variants(variants, max_width=None, image_format=None):
+        """Filter stored variant dicts by width and format, smallest first"""
+        return [
+            ImageVariantType(**variant)
+            for variant in sorted(variants or [], key=lambda v: (v["width"], v["format"]))
+            if (max_width is None or variant["width"] <= max_width)
+            and (image_format is None or variant["format"] == image_format.lower())
+        ]
+
 class UserProfileType(DjangoObjectType):
     """Represents a user profile information."""
 
-    followers = graphene.List(lambda: UserType, description="List of users who follow this user.")
-    following = graphene.List(lambda: UserType,  description="List of users this user is following.")
+    followers = graphene.Field(
+        UserConnection,
+        first=graphene.Int(description="Number of users to return (max 50)"),
+        after=graphene.String(description="Cursor of the last user of the previous page"),
+        description="Users who follow this user, most recent first."
+    )
+    following = graphene.Field(
+        UserConnection,
+        first=graphene.Int(description="Number of users to return (max 50)"),
+        after=graphene.String(description="Cursor of the last user of the previous page"),
+        description="Users this user is following, most recent first."
+    )
     is_following =  graphene.Boolean( description="Returns true if the current authenticated user is following this user.")
+    follows_you = graphene.Boolean(description="Returns true if this user follows the current authenticated user.")
 
     followers_count = graphene.Int(description="Total number of users following this user.")
     following_count = graphene.Int( description="Total number of users this user is following.")
+    profile_image_variants = graphene.List(
+        ImageVariantType,
+        max_width=graphene.Int(description="Only renditions at most this wide"),
+        format=graphene.String(description="Only renditions in this format (webp or jpeg)"),
+        description="Resized renditions of the profile image."
+    )
     class Meta:
         model = UserProfile
-        fields = ("user", "bio", "profile_image")
+        fields = ("user", "bio", "profile_image", "profile_image_status", "profile_image_placeholder")
         description = "User profile data including social connections."
 
-    def resolve_followers(self, info):
-        return [follow.follower for follow in self.followers.all()]
-
-    def resolve_following(self, info):
-        return [follow.following for follow in self.following.all()]
-
+    def resolve_followers(self, info, first=None, after=None):
+        follows = Follow.objects.filter(following_id=self.user_id).select_related('follower') \
+            .only("id", "created_at", *[f"follower__{field}" for field in USER_FIELDS])
+        connection = paginate_queryset(UserConnection, follows, first=first, after=after, node=lambda follow: follow.follower)
+        prime_users(info, [edge.node.id for edge in connection.edges])
+        return connection
+
+    def resolve_following(self, info, first=None, after=None):
+        follows = Follow.objects.filter(follower_id=self.user_id).select_related('following') \
+            .only("id", "created_at", *[f"following__{field}" for field in USER_FIELDS])
+        connection = paginate_queryset(UserConnection, follows, first=first, after=after, node=lambda follow: follow.following)
+        prime_users(info, [edge.node.id for edge in connection.edges])
+        return connection
+
+    @inline_resolver
     def resolve_is_following(self, info):
-        current_user = info.context.user
-        return Follow.objects.filter(follower=current_user, following=self).exists()
+        if info.context.user.is_anonymous:
+            return False
+        return follow_state_loader(info).load(self.user_id)[0]
 
-    def resolve_followers_count(self, info):
-        return self.followers.count()
+    @inline_resolver
+    def resolve_follows_you(self, info):
+        if info.context.user.is_anonymous:
+            return False
+        return follow_state_loader(info).load(self.user_id)[1]
 
-    def resolve_following_count(self, info):
-        return self.following.count()
+    @inline_resolver
+    def resolve_profile_image_variants(self, info, max_width=None, format=None):
+        return ImageVariantType.from_variants(self.profile_image_variants, max_width, format)
 
 class FollowType(DjangoObjectType):
     """Represents a follow relationship between users."""
@@ -113,7 +199,7 @@ class UpdateProfile(graphene.Mutation):
         firstName = graphene.String(description="New firstname (optional)")
         lastName = graphene.String(description="New lastname (optional)")
         bio = graphene.String(description="New bio (optional)")
-        profile_image = graphene.String(description="New profile image URL (optional)")
+        profile_image = graphene.String(description="New base64 encoded profile image (optional)")
         
     user = graphene.Field(UserType, description="Updated user information")
     profile = graphene.Field(UserProfileType, description="The updated user profile information")
@@ -126,14 +212,11 @@ class UpdateProfile(graphene.Mutation):
             raise Exception("Authentication required to update profile.")
         
         try:
-            # Handle profile image upload if provided
-            if 'profile_image' in kwargs:
-                base64_image = kwargs['profile_image']
-                image_url = StorageManager.upload_profile_image(base64_image, user.username)
-                kwargs['profile_image'] = image_url
+            # The profile image is uploaded in the background; clients follow profileImageStatus
+            base64_image = kwargs.pop('profile_image', None)
 
             user_fields = ['username', 'email', 'first_name', 'last_name']
-            profile_fields = ['bio', 'profile_image']
+            profile_fields = ['bio']
 
             # Update user fields
             for key, value in kwargs.items():
@@ -146,13 +229,44 @@ class UpdateProfile(graphene.Mutation):
             for key, value in kwargs.items():
                 if key in profile_fields and value is not None:
                     setattr(profile, key, value)
+            if base64_image:
+                profile.profile_image_status = UserProfile.IMAGE_PENDING
             profile.save()
+            if base64_image:
+                schedule_profile_image(profile, base64_image)
 
             return UpdateProfile(user=user, profile=profile, success=True)
 
         except Exception as e:
             return UpdateProfile(success=False,message=f"Failed to update profile: {str(e)}")
 
+class FinalizeProfileUpload(graphene.Mutation):
+    """
+    Mutation to set a directly uploaded image as the authenticated user's profile picture.
+    """
+    class Arguments:
+        upload_id = graphene.String(required=True, description="PROFILE_IMAGE upload id from requestUploadUrl.")
+
+    profile = graphene.Field(UserProfileType, description="The updated profile.")
+    success = graphene.Boolean(description="Whether the upload was attached successfully.")
+    message = graphene.String(description="A message describing the result of the operation.")
+
+    def mutate(root, info, upload_id):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError("Authentication required.")
+
+        profile, created = UserProfile.objects.get_or_create(user=user)
+        try:
+            with transaction.atomic():
+                ticket = claim_upload(upload_id, user, PROFILE_IMAGE)
+                profile.profile_image_status = UserProfile.IMAGE_PENDING
+                profile.save(update_fields=['profile_image_status'])
+                schedule_profile_image(profile, ticket)
+        except UploadError as e:
+            return FinalizeProfileUpload(success=False, message=str(e))
+        return FinalizeProfileUpload(success=True, profile=profile, message="Image is being processed")
+
 class FollowUser(graphene.Mutation):
     """
     Mutation to make one user follow another.
@@ -177,7 +291,15 @@ class FollowUser(graphene.Mutation):
         if user_to_follow == current_user:
             return FollowUser(success=False, message="You cannot folllow yourself!")
 
-        Follow.objects.create(follower=current_user, following=user_to_follow)
+        with transaction.atomic():
+            lock_user_writes(current_user)
+            Follow.objects.create(follower=current_user, following=user_to_follow)
+            UserProfile.objects.filter(user=current_user).update(following_count=F('following_count') + 1)
+            UserProfile.objects.filter(user=user_to_follow).update(followers_count=F('followers_count') + 1)
+            backfill(current_user, user_to_follow)
+            notify(Notification.FOLLOW, current_user.id, user_to_follow.id)
+            publish_on_commit(f'followers:{user_to_follow.id}', {'follower_id': current_user.id})
+            publish_on_commit(f'following:{current_user.id}', {})
         return FollowUser(success=True, message="Followed successfully!")
 
 class UnfollowUser(graphene.Mutation):
@@ -198,19 +320,179 @@ class UnfollowUser(graphene.Mutation):
         except User.DoesNotExist:
             raise GraphQLError("User not found")
         
-        Follow.objects.filter(follower=follower, following=user_to_unfollow).delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(follower=follower, following=user_to_unfollow).delete()
+            if deleted:
+                UserProfile.objects.filter(user=follower).update(following_count=Greatest(F('following_count') - deleted, 0))
+                UserProfile.objects.filter(user=user_to_unfollow).update(followers_count=Greatest(F('followers_count') - deleted, 0))
+                followers_removed(user_to_unfollow)
+            prune(follower, user_to_unfollow)
+            publish_on_commit(f'following:{follower.id}', {})
         return UnfollowUser(success=True, message="Unfollowed successfully.")
+
+class BulkResultType(graphene.ObjectType):
+    """Outcome for one target of a bulk mutation"""
+    target = graphene.String(description="The username or id this result is for")
+    success = graphene.Boolean(description="Whether the operation succeeded for this target")
+    message = graphene.String(description="A message describing the result for this target")
+
+# Most targets a single bulk mutation accepts
+BULK_MAX_TARGETS = 100
+
+def unique_targets(targets):
+    """Drop repeated targets, keeping the order they were given in"""
+    if len(targets) > BULK_MAX_TARGETS:
+        raise GraphQLError(f"At most {BULK_MAX_TARGETS} targets can be given at once")
+    return list(dict.fromkeys(targets))
+
+def lock_user_writes(user):
+    """
+    Lock the user's profile row until the transaction ends, so the user's
+    concurrent follow and like writes run one after another and each sees
+    the rows the others inserted
+    """
+    list(UserProfile.objects.select_for_update().filter(user=user).values_list("id", flat=True))
+
+class FollowUsers(graphene.Mutation):
+    """
+    Mutation to follow several users at once, e.g. from onboarding suggestions.
+    """
+    class Arguments:
+        usernames = graphene.List(graphene.NonNull(graphene.String), required=True, description="Usernames to follow (max 100).")
+
+    results = graphene.List(BulkResultType, description="One result per requested username, in order.")
+    success = graphene.Boolean(description="Indicates whether every follow succeeded.")
+    message = graphene.String(description="A message describing the result of the operation.")
+
+    def mutate(root, info, usernames):
+        current_user = info.context.user
+        if current_user.is_anonymous:
+            raise GraphQLError("Authentication required.")
+
+        usernames = unique_targets(usernames)
+        users = {user.username: user for user in User.objects.filter(username__in=usernames).only("id", "username")}
+        candidates = [user for user in users.values() if user.id != current_user.id]
+
+        with transaction.atomic():
+            lock_user_writes(current_user)
+            already_following = set(
+                Follow.objects.filter(follower=current_user, following__in=candidates).values_list("following_id", flat=True)
+            )
+            to_follow = [user for user in candidates if user.id not in already_following]
+            if to_follow:
+                # No ignore_conflicts: a row inserted despite the lock fails the whole request instead of being counted
+                Follow.objects.bulk_create([Follow(follower=current_user, following=user) for user in to_follow])
+                UserProfile.objects.filter(user=current_user).update(following_count=F('following_count') + len(to_follow))
+                UserProfile.objects.filter(user__in=to_follow).update(followers_count=F('followers_count') + 1)
+                backfill(current_user, *to_follow)
+                # bulk_create sends no post_save, so invalidate the cached profiles here
+                for user in [current_user, *to_follow]:
+                    profile_changed(user.username)
+                for user in to_follow:
+                    notify(Notification.FOLLOW, current_user.id, user.id)
+                    publish_on_commit(f'followers:{user.id}', {'follower_id': current_user.id})
+                publish_on_commit(f'following:{current_user.id}', {})
+
+        results = []
+        for username in usernames:
+            user = users.get(username)
+            if user is None:
+                results.append(BulkResultType(target=username, success=False, message="User not found"))
+            elif user.id == current_user.id:
+                results.append(BulkResultType(target=username, success=False, message="You cannot follow yourself!"))
+            elif user.id in already_following:
+                results.append(BulkResultType(target=username, success=False, message="You already follow this user"))
+            else:
+                results.append(BulkResultType(target=username, success=True, message="Followed successfully!"))
+
+        return FollowUsers(
+            results=results,
+            success=len(to_follow) == len(usernames),
+            message=f"Followed {len(to_follow)} of {len(usernames)} users.",
+        )
+
+class UnfollowUsers(graphene.Mutation):
+    """
+    Mutation to unfollow several users at once.
+    """
+    class Arguments:
+        usernames = graphene.List(graphene.NonNull(graphene.String), required=True, description="Usernames to unfollow (max 100).")
+
+    results = graphene.List(BulkResultType, description="One result per requested username, in order.")
+    success = graphene.Boolean(description="Indicates whether every unfollow succeeded.")
+    message = graphene.String(description="A message describing the result of the operation.")
+
+    def mutate(root, info, usernames):
+        follower = info.context.user
+        if follower.is_anonymous:
+            raise GraphQLError("Authentication required.")
+
+        usernames = unique_targets(usernames)
+        users = {user.username: user for user in User.objects.filter(username__in=usernames).only("id", "username")}
+
+        with transaction.atomic():
+            follows = Follow.objects.select_for_update().filter(follower=follower, following__in=users.values())
+            followed_ids = set(follows.values_list("following_id", flat=True))
+            to_unfollow = [user for user in users.values() if user.id in followed_ids]
+            if to_unfollow:
+                Follow.objects.filter(follower=follower, following__in=to_unfollow).delete()
+                UserProfile.objects.filter(user=follower).update(following_count=Greatest(F('following_count') - len(to_unfollow), 0))
+                UserProfile.objects.filter(user__in=to_unfollow).update(followers_count=Greatest(F('followers_count') - 1, 0))
+                followers_removed(*to_unfollow)
+                prune(follower, *to_unfollow)
+                publish_on_commit(f'following:{follower.id}', {})
+
+        results = []
+        for username in usernames:
+            user = users.get(username)
+            if user is None:
+                results.append(BulkResultType(target=username, success=False, message="User not found"))
+            elif user.id not in followed_ids:
+                results.append(BulkResultType(target=username, success=False, message="You do not follow this user"))
+            else:
+                results.append(BulkResultType(target=username, success=True, message="Unfollowed successfully."))
+
+        return UnfollowUsers(
+            results=results,
+            success=len(to_unfollow) == len(usernames),
+            message=f"Unfollowed {len(to_unfollow)} of {len(usernames)} users.",
+        )
+
 class Query(graphene.ObjectType):
     """
     Root Query type for fetching user data.
     """
-    userProfile = graphene.Field(
+    user_profile = graphene.Field(
         UserProfileType,
         username =graphene.String(),
         description="Returns the user profile by username or current user if no username is provided"
     )
 
-    all_users =  graphene.List(UserType, description="Returns a list of all users in the system.")
+    all_users =  graphene.List(
+        UserType,
+        description="Returns a list of all users in the system.",
+        deprecation_reason="Returns the whole user table, use the paginated users field instead."
+    )
+    users = graphene.Field(
+        UserConnection,
+        first=graphene.Int(description="Number of users to return (max 50)"),
+        after=graphene.String(description="Cursor of the last user of the previous page"),
+        joined_since=graphene.DateTime(description="Only users who signed up at or after this time"),
+        has_posts=graphene.Boolean(description="Only users with (true) or without (false) posts"),
+        description="Page through the user directory, newest members first"
+    )
+    search_users = graphene.Field(
+        UserConnection,
+        query=graphene.String(required=True, description="Text to look for in usernames, names and bios"),
+        first=graphene.Int(description="Number of users to return (max 50)"),
+        after=graphene.String(description="Cursor of the last user of the previous page"),
+        description="Search users, best matches first"
+    )
+    suggested_users = graphene.List(
+        UserType,
+        first=graphene.Int(description="Number of users to return (max 50)"),
+        description="Users the current user may want to follow, best matches first"
+    )
 
     def resolve_all_users(self, info):
         user = info.context.user
@@ -218,7 +500,46 @@ class Query(graphene.ObjectType):
             raise Exception("Authentication required")
         return User.objects.all()
 
-    def resolve_user_profile(root, info, username):
+    def resolve_users(self, info, first=None, after=None, joined_since=None, has_posts=None):
+        user = info.context.user
+        if user.is_anonymous:
+            raise Exception("Authentication required")
+
+        # Only the columns UserType exposes
+        users = User.objects.only(*USER_FIELDS)
+        if joined_since is not None:
+            users = users.filter(created_at__gte=joined_since)
+        if has_posts is not None:
+            posts = Post.objects.filter(user=OuterRef('pk'))
+            users = users.filter(Exists(posts) if has_posts else ~Exists(posts))
+        connection = paginate_queryset(UserConnection, users, first=first, after=after)
+        prime_users(info, [edge.node.id for edge in connection.edges])
+        return connection
+
+    def resolve_search_users(self, info, query, first=None, after=None):
+        user = info.context.user
+        if user.is_anonymous:
+            raise Exception("Authentication required")
+        connection = paginate_queryset(UserConnection, search_users(query), first=first, after=after, ordering=('rank', 'id'))
+        prime_users(info, [edge.node.id for edge in connection.edges])
+        return connection
+
+    def resolve_suggested_users(self, info, first=None):
+        user = info.context.user
+        if user.is_anonymous:
+            raise Exception("Authentication required")
+        limit = max(0, min(DEFAULT_PAGE_SIZE if first is None else first, MAX_PAGE_SIZE))
+
+        # Suggestions are precomputed, so drop anyone followed since they were built
+        suggested_ids = get_suggestions(user.id)
+        loader = follow_state_loader(info)
+        loader.prime(suggested_ids)
+        suggested_ids = [user_id for user_id in suggested_ids if not loader.load(user_id)[0]][:limit]
+
+        users = User.objects.only(*USER_FIELDS).in_bulk(suggested_ids)
+        return [users[user_id] for user_id in suggested_ids if user_id in users]
+
+    def resolve_user_profile(root, info, username=None):
         if username:
             try:
                 return UserProfile.objects.get(user__username = username)
@@ -231,6 +552,22 @@ class Query(graphene.ObjectType):
 
         return UserProfile.objects.get(user=user)
 
+class Subscription(graphene.ObjectType):
+    """
+    Root Subscription type for user-related events
+    """
+    new_follower = graphene.Field(UserType, description="Users who start following the current user.")
+
+    async def subscribe_new_follower(root, info):
+        user = info.context.user
+        if user.is_anonymous:
+            raise GraphQLError("Authentication required.")
+
+        async for _, message in get_pubsub().subscribe(f'followers:{user.id}'):
+            follower = await User.objects.filter(id=message['follower_id']).afirst()
+            if follower is not None:
+                yield follower
+
 class Mutation(graphene.ObjectType):
     """
     Root Mutation type for user-related actions
@@ -239,8 +576,11 @@ class Mutation(graphene.ObjectType):
     register_user = RegisterUser.Field(description="Register a new user and return a token.")
     login_user = LoginUser.Field(description="Login a user and return a token.")
     update_profile = UpdateProfile.Field(description="Update the authenticated user's profile.")
+    finalize_profile_upload = FinalizeProfileUpload.Field(description="Set a directly uploaded image as the authenticated user's profile picture.")
     follow_user = FollowUser.Field(description="Authenticated user follows another user.")
     unfollow_user = UnfollowUser.Field(description="Authenticated user unfollows a user.")
+    follow_users = FollowUsers.Field(description="Authenticated user follows several users at once.")
+    unfollow_users = UnfollowUsers.Field(description="Authenticated user unfollows several users at once.")
 
     token_auth = graphql_jwt.ObtainJSONWebToken.Field(description="Obtain JWT token for authentication.")
     verify_token = graphql_jwt.Verify.Field(description="Verify the validity of a JWT token.")
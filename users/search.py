@@ -0,0 +1,38 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+
+from utils.search import MAX_CANDIDATES, clean_query, uses_postgres
+from .models import User, UserProfile
+
+
+def search_users(query):
+    """
+    Users whose username, names or bio contain query, annotated with a
+    relevance rank for paginate_queryset(ordering=('rank', 'id'))
+    """
+    query = clean_query(query)
+    name_match = Q(username__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query)
+    # Names and bios are matched in separate subqueries, each served by its
+    # table's trigram indexes; OR-ing across the profile join would defeat them
+    by_name = User.objects.filter(name_match).order_by('-id').values('id')[:MAX_CANDIDATES]
+    by_bio = UserProfile.objects.filter(bio__icontains=query).order_by('-user_id').values('user_id')[:MAX_CANDIDATES]
+    users = User.objects.filter(Q(id__in=by_name) | Q(id__in=by_bio))
+
+    if uses_postgres(User):
+        # Similarity orders the matches
+        rank = Greatest(
+            TrigramSimilarity('username', query),
+            TrigramSimilarity('first_name', query),
+            TrigramSimilarity('last_name', query),
+            TrigramSimilarity('userprofile__bio', query) * 0.5,
+        )
+    else:
+        rank = Case(
+            When(username__iexact=query, then=Value(1.0)),
+            When(username__istartswith=query, then=Value(0.8)),
+            When(name_match, then=Value(0.6)),
+            default=Value(0.3),
+        )
+    # Cast to double precision so cursor values compare exactly
+    return users.annotate(rank=Cast(rank, FloatField()))
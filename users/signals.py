@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from utils.auth import get_token_cache
+from utils.response_cache import GLOBAL_TAG, invalidate
+from .models import Follow, User, UserProfile
+
+
+def profile_changed(username):
+    """Drop cached results that include this user's profile"""
+    invalidate(f'user:{username}')
+
+
+# User fields that other users' cached results show, e.g. in follower lists and comments
+SHARED_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+def _shared_values(user):
+    # Read from __dict__ so deferred fields are not loaded
+    return tuple(user.__dict__.get(name) for name in SHARED_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._shared_values = _shared_values(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_saved(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    # Password, is_active and profile changes must reach requests authenticated from the token cache
+    transaction.on_commit(lambda: get_token_cache().forget_user(instance.pk))
+
+    # Logging in only touches last_login, which no cached query shows
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+
+    shared = _shared_values(instance)
+    if signal is post_delete or (not created and shared != instance._shared_values):
+        invalidate(GLOBAL_TAG)
+    else:
+        # Signups and changes only this user's own results show
+        profile_changed(instance.username)
+    instance._shared_values = shared
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def user_profile_saved(sender, instance, **kwargs):
+    profile_changed(instance.user.username)
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def follow_saved(sender, instance, **kwargs):
+    for username in User.objects.filter(id__in=[instance.follower_id, instance.following_id]).values_list('username', flat=True):
+        profile_changed(username)
@@ -0,0 +1,151 @@
+"""
+"Who to follow" suggestions computed from the follow graph.
+
+The build_suggestions command loads every follow edge into a FollowGraph,
+scores candidates for each user and stores the ranked user ids in the
+SUGGESTIONS_CACHE, so serving suggestedUsers is a single cache lookup.
+Users without stored suggestions (e.g. new sign ups, or users who follow no
+one yet) get the most followed users instead.
+
+Candidates are scored by:
+- friends of friends: each account a followed user follows counts 1
+- co-follows: each account followed by someone who shares one of your
+  followees counts COFOLLOW_WEIGHT
+"""
+import heapq
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Follow
+
+COFOLLOW_WEIGHT = 0.25
+# Bounds on the co-follow walk, which otherwise grows with the square of the degree
+COFOLLOW_FOLLOWEES = 100
+COFOLLOW_SAMPLE = 20
+
+CACHE_PREFIX = 'suggestions:'
+POPULAR_KEY = CACHE_PREFIX + 'popular'
+
+
+def _csr(size, sources, targets):
+    """Group targets by source: returns (offsets, neighbours) with the neighbours of i at offsets[i]:offsets[i + 1]"""
+    offsets = array('q', bytes(8 * (size + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    neighbours = array('q', bytes(8 * len(targets)))
+    position = array('q', offsets)
+    for source, target in zip(sources, targets):
+        neighbours[position[source]] = target
+        position[source] += 1
+    return offsets, neighbours
+
+
+class FollowGraph:
+    """
+    Follow graph in compressed sparse row form. Users are numbered 0..n-1 and
+    both directions of every edge are kept as flat integer arrays.
+    """
+
+    def __init__(self, user_ids, sources, targets):
+        self.user_ids = user_ids
+        self.index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.following_offsets, self.following = _csr(len(user_ids), sources, targets)
+        self.follower_offsets, self.followers = _csr(len(user_ids), targets, sources)
+
+    @classmethod
+    def load(cls):
+        """Build the graph from every Follow row"""
+        index = {}
+        user_ids = array('q')
+        sources = array('q')
+        targets = array('q')
+
+        def node(user_id):
+            i = index.get(user_id)
+            if i is None:
+                i = index[user_id] = len(user_ids)
+                user_ids.append(user_id)
+            return i
+
+        edges = Follow.objects.order_by().values_list('follower_id', 'following_id')
+        for follower_id, following_id in edges.iterator(chunk_size=10000):
+            sources.append(node(follower_id))
+            targets.append(node(following_id))
+        return cls(user_ids, sources, targets)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def following_of(self, i):
+        return self.following[self.following_offsets[i]:self.following_offsets[i + 1]]
+
+    def followers_of(self, i):
+        return self.followers[self.follower_offsets[i]:self.follower_offsets[i + 1]]
+
+    def suggest(self, i, limit):
+        """Ids of the best limit users for node i to follow, best first"""
+        followed = self.following_of(i)
+
+        scores = Counter()
+        for followee in followed:
+            scores.update(self.following_of(followee))
+
+        cofollowed = Counter()
+        for followee in followed[:COFOLLOW_FOLLOWEES]:
+            for peer in self.followers_of(followee)[:COFOLLOW_SAMPLE]:
+                if peer != i:
+                    cofollowed.update(self.following_of(peer))
+        for candidate, count in cofollowed.items():
+            scores[candidate] += COFOLLOW_WEIGHT * count
+
+        excluded = set(followed)
+        excluded.add(i)
+        best = heapq.nlargest(
+            limit,
+            (candidate for candidate in scores if candidate not in excluded),
+            key=lambda candidate: (scores[candidate], -candidate),
+        )
+        return [self.user_ids[candidate] for candidate in best]
+
+    def most_followed(self, limit):
+        """Ids of the limit users with the most followers"""
+        offsets = self.follower_offsets
+        best = heapq.nlargest(limit, range(len(self)), key=lambda i: offsets[i + 1] - offsets[i])
+        return [self.user_ids[i] for i in best]
+
+
+def _cache():
+    return caches[settings.SUGGESTIONS_CACHE]
+
+
+def store_suggestions(graph, batch_size=1000):
+    """Compute and cache suggestions for every user in the graph; returns how many were stored"""
+    cache = _cache()
+    limit = settings.SUGGESTIONS_PER_USER
+    timeout = settings.SUGGESTIONS_TTL
+
+    batch = {}
+    for i, user_id in enumerate(graph.user_ids):
+        batch[f'{CACHE_PREFIX}{user_id}'] = graph.suggest(i, limit)
+        if len(batch) >= batch_size:
+            cache.set_many(batch, timeout)
+            batch = {}
+    if batch:
+        cache.set_many(batch, timeout)
+    cache.set(POPULAR_KEY, graph.most_followed(limit), timeout)
+    return len(graph)
+
+
+def get_suggestions(user_id):
+    """Cached suggested user ids for a user, best first"""
+    cache = _cache()
+    suggestions = cache.get(f'{CACHE_PREFIX}{user_id}')
+    if not suggestions:
+        suggestions = [other_id for other_id in cache.get(POPULAR_KEY, []) if other_id != user_id]
+    return suggestions
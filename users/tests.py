@@ -1,3 +1,172 @@
+import json
+from unittest import mock
+
 from django.test import TestCase
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.shortcuts import get_token
+
+from utils.auth import get_token_cache, get_user_for_token
+from utils.pagination import paginate_queryset
+from utils.response_cache import GLOBAL_TAG
+from .images import upload_profile_image
+from .models import Follow, User, UserProfile
+from .schema import UserConnection
+from .search import search_users
+
+
+class UserInvalidationTests(TestCase):
+    """Saving a user drops only the cached results that can show the change"""
+
+    def saved_tags(self, save):
+        with mock.patch('users.signals.invalidate') as invalidate:
+            save()
+        return [tags for call in invalidate.call_args_list for tags in call.args]
+
+    def test_signup_and_password_change_keep_other_results(self):
+        user = None
+
+        def signup():
+            nonlocal user
+            user = User.objects.create_user(username='newcomer', email='new@example.com', password='secret')
+        self.assertEqual(self.saved_tags(signup), ['user:newcomer'])
+
+        user.set_password('changed')
+        self.assertEqual(self.saved_tags(user.save), ['user:newcomer'])
+
+    def test_username_change_drops_every_result(self):
+        user = User.objects.create_user(username='renamed', email='renamed@example.com', password='secret')
+        user = User.objects.get(pk=user.pk)
+        user.username = 'renamed2'
+        self.assertEqual(self.saved_tags(user.save), [GLOBAL_TAG])
+
+
+    def test_failed_profile_image_upload_drops_the_cached_profile(self):
+        user = User.objects.create_user(username='uploader', email='uploader@example.com', password='secret')
+        profile = UserProfile.objects.create(user=user, profile_image_status=UserProfile.IMAGE_PENDING)
+        with mock.patch('users.images.load_image_bytes', side_effect=ValueError), \
+                mock.patch('users.signals.invalidate') as invalidate, self.assertLogs('users.images'):
+            upload_profile_image(profile.id, user.username, 'not an image')
+
+        self.assertEqual(UserProfile.objects.get(id=profile.id).profile_image_status, UserProfile.IMAGE_FAILED)
+        invalidate.assert_called_once_with('user:uploader')
+
+class SearchUsersTests(TestCase):
+    """The substring fallback used when the database is not PostgreSQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        def create(username, bio='', **names):
+            user = User.objects.create_user(
+                username=username, email=f'{username}@example.com', password='secret', **names,
+            )
+            UserProfile.objects.create(user=user, bio=bio)
+            return user
+
+        cls.by_bio = create('walker', bio='Weekend hiker')
+        cls.by_name = create('someone', first_name='Hiker')
+        cls.by_prefix = create('hikers_club')
+        cls.exact = create('hiker')
+        create('unrelated', bio='gardening')
+
+    def page(self, first, after=None):
+        connection = paginate_queryset(
+            UserConnection, search_users('hiker'), first=first, after=after, ordering=('rank', 'id'),
+        )
+        return [edge.node for edge in connection.edges], connection.page_info.end_cursor
+
+    def test_exact_then_prefix_then_name_then_bio(self):
+        users, _ = self.page(10)
+        self.assertEqual(users, [self.exact, self.by_prefix, self.by_name, self.by_bio])
+
+    def test_pages_do_not_repeat_users(self):
+        first, cursor = self.page(2)
+        second, _ = self.page(2, after=cursor)
+        self.assertEqual(first + second, [self.exact, self.by_prefix, self.by_name, self.by_bio])
+
+
+class BulkFollowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me, cls.alice, cls.bob, cls.carol = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='secret')
+            for name in ('me', 'alice', 'bob', 'carol')
+        ]
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in (cls.me, cls.alice, cls.bob, cls.carol)])
+        Follow.objects.create(follower=cls.me, following=cls.carol)
+        UserProfile.objects.filter(user=cls.me).update(following_count=1)
+        UserProfile.objects.filter(user=cls.carol).update(followers_count=1)
+
+    def mutate(self, mutation, usernames):
+        response = self.client.post(
+            '/graphql/', json.dumps({
+                'query': f'mutation($names: [String!]!) {{ {mutation}(usernames: $names) '
+                         f'{{ success results {{ target success message }} }} }}',
+                'variables': {'names': usernames},
+            }),
+            content_type='application/json', HTTP_AUTHORIZATION=f'JWT {get_token(self.me)}',
+        )
+        return response.json()
+
+    def results(self, data, mutation):
+        return [(r['target'], r['success'], r['message']) for r in data['data'][mutation]['results']]
+
+    def counts(self):
+        """Followers of every user, and how many users self.me follows"""
+        followers = dict(UserProfile.objects.values_list('user__username', 'followers_count'))
+        return followers, UserProfile.objects.get(user=self.me).following_count
+
+    def test_follow_users(self):
+        data = self.mutate('followUsers', ['alice', 'me', 'carol', 'nobody', 'bob', 'alice'])
+        self.assertEqual(self.results(data, 'followUsers'), [
+            ('alice', True, 'Followed successfully!'),
+            ('me', False, 'You cannot follow yourself!'),
+            ('carol', False, 'You already follow this user'),
+            ('nobody', False, 'User not found'),
+            ('bob', True, 'Followed successfully!'),
+        ])
+        self.assertEqual(self.counts(), ({'me': 0, 'alice': 1, 'bob': 1, 'carol': 1}, 3))
+
+    def test_unfollow_users(self):
+        self.mutate('followUsers', ['alice'])
+        data = self.mutate('unfollowUsers', ['alice', 'bob', 'carol', 'nobody'])
+        self.assertEqual(self.results(data, 'unfollowUsers'), [
+            ('alice', True, 'Unfollowed successfully.'),
+            ('bob', False, 'You do not follow this user'),
+            ('carol', True, 'Unfollowed successfully.'),
+            ('nobody', False, 'User not found'),
+        ])
+        self.assertEqual(self.counts(), ({'me': 0, 'alice': 0, 'bob': 0, 'carol': 0}, 0))
+
+    def test_at_most_100_usernames(self):
+        for mutation in ('followUsers', 'unfollowUsers'):
+            with self.subTest(mutation):
+                data = self.mutate(mutation, [f'user{i}' for i in range(101)])
+                self.assertEqual(data['errors'][0]['message'], 'At most 100 targets can be given at once')
+
+
+class TokenUserCacheTests(TestCase):
+    """Saving a user drops the snapshots cached for its tokens"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', email='cached@example.com', password='secret')
+        self.addCleanup(get_token_cache().forget_user, self.user.pk)
+        self.token = get_token(self.user)
+        # Cache the snapshot
+        self.assertEqual(get_user_for_token(self.token), self.user)
+
+    def test_deactivated_user_token_stops_working(self):
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        with self.assertRaisesMessage(JSONWebTokenError, 'User is disabled'):
+            get_user_for_token(self.token)
+
+    def test_changed_username_is_picked_up(self):
+        self.user.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
 
-# Create your tests here.
+        # Tokens name their user, so the old one no longer finds anyone
+        self.assertIsNone(get_user_for_token(self.token))
+        self.assertEqual(get_user_for_token(get_token(self.user)).username, 'renamed')
@@ -0,0 +1,109 @@
+"""
+Running the schema's synchronous resolvers under async execution.
+
+The resolvers in posts.schema and users.schema use the ORM synchronously, so
+they can serve both the sync view and the async one. Under async execution
+SyncResolverMiddleware runs them with thread sensitive sync_to_async, the way
+Django's own async ORM methods run queries: off the event loop, in the one
+thread that serves the request's database work.
+
+Each hop to that thread costs far more than a getter, and the hops of one
+request run one after another, so resolvers that only read loaded data stay
+on the event loop: plain attribute resolvers, ids, and resolvers marked with
+inline_resolver (e.g. ones reading a primed DataLoader). They move to the
+thread only when they turn out to query, e.g. to lazily load a relation.
+Resolvers that run in the thread load what they primed before returning, so
+the loaders of a list's rows are filled without another hop.
+"""
+import asyncio
+from functools import partial
+from inspect import isawaitable, iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db.models import QuerySet
+from graphene.types.resolver import dict_or_attr_resolver
+from graphene_django import DjangoObjectType
+from graphql import default_field_resolver
+
+from utils.dataloader import load_queued
+
+
+def inline_resolver(resolver):
+    """
+    Mark a resolver that only reads what its parent or a primed loader already
+    holds, so async execution runs it on the event loop
+    """
+    resolver.runs_inline = True
+    return resolver
+
+
+def _runs_inline(resolver):
+    if resolver is default_field_resolver or resolver is DjangoObjectType.resolve_id:
+        return True
+    if isinstance(resolver, partial) and resolver.func is dict_or_attr_resolver:
+        return True
+    return getattr(resolver, 'runs_inline', False)
+
+
+def _resolve_sync(resolver, root, info, kwargs):
+    result = resolver(root, info, **kwargs)
+    # Querysets would otherwise be evaluated on the event loop when the list is completed
+    if isinstance(result, QuerySet):
+        result = list(result)
+    # While still in the thread, load what the resolver primed for its rows' fields
+    load_queued(info)
+    return result
+
+
+class SyncResolverMiddleware:
+    """
+    Graphene middleware for async execution; must come first in the middleware
+    list so it receives the field's own resolver. Use one instance per request.
+    """
+
+    def __init__(self):
+        # The last thread hop of an inline resolver; see _retry_inline
+        self._hop = None
+
+    def resolve(self, next, root, info, **kwargs):
+        if iscoroutinefunction(next):
+            return next(root, info, **kwargs)
+
+        if _runs_inline(next):
+            try:
+                result = next(root, info, **kwargs)
+            except SynchronousOnlyOperation:
+                return self._retry_inline(next, root, info, kwargs)
+            if isinstance(result, QuerySet):
+                return sync_to_async(list)(result)
+            return result
+
+        return self._resolve_in_thread(next, root, info, kwargs)
+
+    async def _retry_inline(self, next, root, info, kwargs):
+        """
+        Finish an inline resolver that had to query. When the siblings of a
+        list all miss the same loader, the first runs its batch in the thread
+        and the others wait for it, then find their values on the event loop.
+        """
+        if self._hop is not None:
+            await asyncio.wait([self._hop])
+            try:
+                result = next(root, info, **kwargs)
+            except SynchronousOnlyOperation:
+                pass
+            else:
+                if isinstance(result, QuerySet):
+                    result = await sync_to_async(list)(result)
+                return result
+
+        # A relation that was not loaded with the parent, or a loader's first batch
+        hop = self._hop = asyncio.ensure_future(sync_to_async(_resolve_sync)(next, root, info, kwargs))
+        return await hop
+
+    async def _resolve_in_thread(self, next, root, info, kwargs):
+        result = await sync_to_async(_resolve_sync)(next, root, info, kwargs)
+        if isawaitable(result):
+            result = await result
+        return result
@@ -0,0 +1,137 @@
+"""
+JWT authentication done once per request, with a short-lived in-process
+cache of token -> user so repeated requests with the same token skip both
+the signature check and the user query.
+
+Cached users are stored as field values and rebuilt per request, so a
+resolver that modifies request.user never touches the cached copy. Saving
+or deleting a user drops its cached tokens (see users/signals.py); other
+processes see the change once their entries expire.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_http_authorization, get_payload, get_user_by_payload
+
+
+class TokenUserCache:
+    """Bounded LRU of token -> user snapshot with a TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, user_id, model, db, field_names, values = entry
+            if expires < time.monotonic():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+        return model.from_db(db, field_names, values)
+
+    def set(self, token, user, token_expires=None):
+        expires = time.monotonic() + self.ttl
+        if token_expires is not None:
+            expires = min(expires, time.monotonic() + token_expires - time.time())
+        field_names = [field.attname for field in user._meta.concrete_fields]
+        values = [getattr(user, name) for name in field_names]
+
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (expires, user.pk, type(user), user._state.db, field_names, values)
+            self._tokens_by_user.setdefault(user.pk, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def forget_user(self, user_id):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1]
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenUserCache(settings.JWT_USER_CACHE_SIZE, settings.JWT_USER_CACHE_TTL)
+    return _token_cache
+
+
+def get_user_for_token(token, context=None):
+    """
+    Return the user a token belongs to, or None if they no longer exist.
+    Raises JSONWebTokenError for invalid tokens.
+    """
+    cache = get_token_cache()
+    user = cache.get(token)
+    if user is None:
+        payload = get_payload(token, context)
+        user = get_user_by_payload(payload)
+        if user is not None:
+            token_expires = payload.get('exp') if jwt_settings.JWT_VERIFY_EXPIRATION else None
+            cache.set(token, user, token_expires)
+    return user
+
+
+def authenticate_request(request):
+    """
+    Set request.user from the JWT in the request, once. An invalid token
+    leaves the user anonymous and is kept on request.jwt_error.
+    """
+    if getattr(request, '_jwt_authenticated', False):
+        return
+    request._jwt_authenticated = True
+    request.jwt_error = None
+
+    # A signed in session user takes precedence, as with graphql_jwt's middleware
+    if getattr(request, 'user', None) is not None and request.user.is_authenticated:
+        return
+    token = get_http_authorization(request)
+    if token is None:
+        return
+
+    try:
+        user = get_user_for_token(token, request)
+    except JSONWebTokenError as e:
+        request.jwt_error = e
+        return
+    if user is not None:
+        request.user = user
+
+
+class JSONWebTokenMiddleware:
+    """
+    Graphene middleware replacing graphql_jwt's, which re-enters the
+    authentication backends from every resolver until a user is found
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        context = info.context
+        authenticate_request(context)
+        if root is None and context.jwt_error is not None:
+            raise context.jwt_error
+        return next(root, info, **kwargs)
@@ -0,0 +1,58 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundPool:
+    """
+    Bounded pool of threads that run work off the request thread.
+
+    At most max_pending jobs may be queued or running at once, so a burst of
+    work (e.g. uploads holding base64 payloads) cannot pile up unbounded.
+    """
+
+    def __init__(self, name, workers, max_pending):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns False without queueing when the pool is full"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        self._executor.submit(self._run, fn, *args)
+        return True
+
+    def _run(self, fn, *args):
+        close_old_connections()
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("Background task %s failed in pool %s", getattr(fn, '__name__', fn), self.name)
+        finally:
+            close_old_connections()
+            self._slots.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    """
+    Return the process wide pool for one kind of work, created on first use
+    from settings.BACKGROUND_POOLS. Each kind has its own threads and limit,
+    so a burst of one does not hold up the others.
+    """
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = BackgroundPool(name, **settings.BACKGROUND_POOLS[name])
+    return pool
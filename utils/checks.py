@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+def is_shared_cache(alias):
+    """Whether what one process stores in the cache alias is seen by the others"""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+@register(Tags.caches)
+def check_sticky_cache(app_configs, **kwargs):
+    if settings.DATABASE_REPLICA_URLS and not is_shared_cache(settings.DATABASE_STICKY_CACHE):
+        return [Error(
+            f"DATABASE_STICKY_CACHE ({settings.DATABASE_STICKY_CACHE!r}) is local to each process.",
+            hint="Users pinned to the primary after a mutation would read stale replicas from the other "
+                 "processes. Point it at a shared cache (e.g. set CACHE_URL to Redis or Memcached).",
+            id='utils.E001',
+        )]
+    return []
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    if not settings.GRAPHQL_RESPONSE_CACHE_ENABLED:
+        return []
+    backend, alias = settings.GRAPHQL_RESPONSE_CACHE_BACKEND, settings.GRAPHQL_RESPONSE_CACHE_ALIAS
+    if backend == 'utils.response_cache.LocalMemoryBackend':
+        where = 'LocalMemoryBackend'
+    elif backend == 'utils.response_cache.DjangoCacheBackend' and not is_shared_cache(alias):
+        where = f'GRAPHQL_RESPONSE_CACHE_ALIAS ({alias!r})'
+    else:
+        return []
+    return [Error(
+        f"The response cache is enabled but {where} is local to each process.",
+        hint="A write only invalidates the process that handled it; the others keep serving stale results for up "
+             "to GRAPHQL_RESPONSE_CACHE_TTL. Use DjangoCacheBackend with a shared cache (e.g. set CACHE_URL to Redis "
+             "or Memcached), or silence utils.E002 if the site runs as a single process.",
+        id='utils.E002',
+    )]
@@ -0,0 +1,94 @@
+import asyncio
+
+from django.core.exceptions import SynchronousOnlyOperation
+from graphql import FragmentSpreadNode
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class DataLoader:
+    """
+    Request-scoped batching loader for synchronous resolvers.
+
+    List resolvers call ``prime`` with the keys of the rows they return, and the
+    first ``load`` then fetches every queued key with a single batch query.
+    On the event loop a miss raises SynchronousOnlyOperation, as the ORM would.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = set()
+
+    def prime(self, keys):
+        """Queue keys so they are fetched together on the next cache miss"""
+        self._queue.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        """Return the value for key, batch loading all queued keys on a miss"""
+        if key not in self._cache:
+            if _on_event_loop():
+                # As the ORM would, but before building the batch query (see utils/async_execution.py)
+                raise SynchronousOnlyOperation("DataLoader batches cannot run on the event loop")
+            self._queue.add(key)
+            keys = list(self._queue)
+            self._queue.clear()
+            results = self.batch_load_fn(keys)
+            for k in keys:
+                self._cache[k] = results.get(k, self.default)
+        return self._cache[key]
+
+    def load_queued(self):
+        """Fetch every queued key now"""
+        if self._queue:
+            self.load(next(iter(self._queue)))
+
+    def clear(self, key):
+        """Drop a cached value, e.g. after a mutation changed it"""
+        self._cache.pop(key, None)
+
+
+def get_loader(info, name, batch_load_fn, default=None):
+    """
+    Return the loader registered as name on the current request,
+    creating it the first time it is asked for.
+    """
+    loaders = getattr(info.context, 'dataloaders', None)
+    if loaders is None:
+        loaders = {}
+        info.context.dataloaders = loaders
+
+    if name not in loaders:
+        loaders[name] = DataLoader(batch_load_fn, default=default)
+    return loaders[name]
+
+
+def load_queued(info):
+    """Run the pending batch of every loader on the current request"""
+    for loader in getattr(info.context, 'dataloaders', {}).values():
+        loader.load_queued()
+
+
+def selects(info, *names):
+    """Whether the selection of the field being resolved asks for any of names, at any depth"""
+    selection_sets = [node.selection_set for node in info.field_nodes]
+    while selection_sets:
+        selection_set = selection_sets.pop()
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments.get(selection.name.value)
+                selection_sets.append(fragment and fragment.selection_set)
+                continue
+            if getattr(selection, 'name', None) is not None and selection.name.value in names:
+                return True
+            selection_sets.append(selection.selection_set)
+    return False
@@ -0,0 +1,88 @@
+"""
+Routing GraphQL reads to database replicas.
+
+Replicas are configured with DATABASE_REPLICA_URLS and added to DATABASES as
+replica_1, replica_2, ... The GraphQL view picks one replica per query
+operation (see replica_for) and runs it inside reading_from, which points
+ReplicaRouter's reads at that replica. Everything else (mutations,
+subscriptions, the admin, management commands and background tasks) reads
+and writes the primary, as do reads inside a transaction and queries whose
+results go into the response cache.
+
+Replicas lag behind the primary, so after a mutation its user is pinned to
+the primary for DATABASE_STICKY_SECONDS and sees its own writes. The pins
+live in DATABASE_STICKY_CACHE, which must be shared by the web processes
+(utils/checks.py fails `manage.py check` otherwise).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from graphql import OperationType
+
+REPLICA_PREFIX = 'replica_'
+
+# Context variables follow the request into sync_to_async threads and async execution tasks
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def _sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def stick_to_primary(user):
+    """Send the user's reads to the primary for the next DATABASE_STICKY_SECONDS"""
+    if not replica_aliases() or user is None or not user.is_authenticated:
+        return
+    caches[settings.DATABASE_STICKY_CACHE].set(_sticky_key(user.pk), True, settings.DATABASE_STICKY_SECONDS)
+
+
+def is_stuck_to_primary(user):
+    if user is None or not user.is_authenticated:
+        return False
+    return caches[settings.DATABASE_STICKY_CACHE].get(_sticky_key(user.pk)) is not None
+
+
+def replica_for(request, operation_ast):
+    """The replica to read an (authenticated) operation from, or None for the primary"""
+    replicas = replica_aliases()
+    if not replicas or operation_ast is None or operation_ast.operation != OperationType.QUERY:
+        return None
+    if is_stuck_to_primary(getattr(request, 'user', None)):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads to alias (None for the primary) until the block exits"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,141 @@
+"""
+Direct-to-storage uploads.
+
+Instead of sending images as base64 through GraphQL, a client asks for an
+upload target with the requestUploadUrl mutation, PUTs the raw bytes to it
+and then hands the returned upload id to finalizeUpload, finalizeProfileUpload
+or createPost. The upload id is a signed ticket naming who may upload what,
+where and how much. Each upload id can be claimed once; claims are recorded
+as uploads.UploadClaim rows.
+"""
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from uploads.models import UploadClaim
+
+from .images import decode_base64_image
+from .storage_backends import LocalStorageBackend, get_storage_backend
+
+POST_IMAGE = 'post_image'
+PROFILE_IMAGE = 'profile_image'
+PURPOSE_BUCKETS = {POST_IMAGE: 'posts', PROFILE_IMAGE: 'profiles'}
+ALLOWED_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/gif'}
+
+# How long after the upload URL was issued the upload may still be finalized
+FINALIZE_WINDOW = timedelta(days=1)
+SALT = 'utils.direct_uploads'
+
+UploadTicket = namedtuple('UploadTicket', ['user_id', 'purpose', 'bucket', 'path', 'max_bytes', 'content_type'])
+
+
+class UploadError(Exception):
+    """Raised for upload requests or tickets that must be refused"""
+
+
+def issue_upload(user, purpose, content_type, size):
+    """
+    Create a signed upload ticket and a storage target to PUT the file to.
+    Returns (upload_id, target, expires_at).
+    """
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise UploadError(f"Unsupported content type {content_type}")
+    if size <= 0 or size > settings.DIRECT_UPLOAD_MAX_BYTES:
+        raise UploadError(f"File size must be between 1 and {settings.DIRECT_UPLOAD_MAX_BYTES} bytes")
+
+    ticket = UploadTicket(
+        user_id=user.id,
+        purpose=purpose,
+        bucket=PURPOSE_BUCKETS[purpose],
+        path=f"incoming/{user.id}/{uuid.uuid4().hex}",
+        max_bytes=size,
+        content_type=content_type,
+    )
+    upload_id = signing.dumps(ticket._asdict(), salt=SALT, compress=True)
+    target = get_storage_backend().create_upload_target(ticket.bucket, ticket.path, upload_id)
+    expires_at = timezone.now() + timedelta(seconds=settings.DIRECT_UPLOAD_URL_TTL)
+    return upload_id, target, expires_at
+
+
+def load_ticket(upload_id, max_age=FINALIZE_WINDOW):
+    """Verify an upload id and return its ticket"""
+    try:
+        return UploadTicket(**signing.loads(upload_id, salt=SALT, max_age=max_age))
+    except (signing.BadSignature, TypeError):
+        raise UploadError("Upload id is invalid or has expired")
+
+
+def claim_upload(upload_id, user, purpose):
+    """
+    Return the ticket for an upload id if it was issued to this user for this
+    purpose and has not been claimed before. Claim inside the transaction
+    that uses the upload, so the claim is dropped if that fails.
+    """
+    ticket = load_ticket(upload_id)
+    if ticket.user_id != user.id or ticket.purpose != purpose:
+        raise UploadError("Upload id is invalid or has expired")
+
+    # Claims older than the finalize window belong to upload ids that no longer verify
+    UploadClaim.objects.filter(claimed_at__lt=timezone.now() - FINALIZE_WINDOW).delete()
+    try:
+        with transaction.atomic():
+            UploadClaim.objects.create(path=ticket.path)
+    except IntegrityError:
+        raise UploadError("Upload id has already been used")
+    return ticket
+
+
+def read_upload(ticket):
+    """Fetch the uploaded bytes, enforcing the ticket's size limit, and remove the raw object"""
+    backend = get_storage_backend()
+    # Check the stored size first so an oversized object is never downloaded
+    if backend.size(ticket.bucket, ticket.path) > ticket.max_bytes:
+        backend.delete(ticket.bucket, ticket.path)
+        raise UploadError("Uploaded file is larger than requested")
+    data = backend.get(ticket.bucket, ticket.path)
+    backend.delete(ticket.bucket, ticket.path)
+    if len(data) > ticket.max_bytes:
+        raise UploadError("Uploaded file is larger than requested")
+    return data
+
+
+def load_image_bytes(source):
+    """Original image bytes from either a base64 string or an upload ticket"""
+    if isinstance(source, UploadTicket):
+        return read_upload(source)
+    return decode_base64_image(source)
+
+
+@csrf_exempt
+def local_upload(request, upload_id):
+    """Upload endpoint standing in for signed storage URLs when LocalStorageBackend is configured"""
+    backend = get_storage_backend()
+    if not isinstance(backend, LocalStorageBackend):
+        raise Http404()
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['PUT'])
+
+    try:
+        ticket = load_ticket(upload_id, max_age=settings.DIRECT_UPLOAD_URL_TTL)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=403)
+
+    if request.content_type != ticket.content_type:
+        return JsonResponse({'error': f'Content type must be {ticket.content_type}'}, status=400)
+    if int(request.META.get('CONTENT_LENGTH') or 0) > ticket.max_bytes:
+        return JsonResponse({'error': 'File too large'}, status=413)
+
+    # Read from the stream so nothing beyond the limit is buffered
+    data = request.read(ticket.max_bytes + 1)
+    if len(data) > ticket.max_bytes:
+        return JsonResponse({'error': 'File too large'}, status=413)
+
+    backend.put(ticket.bucket, ticket.path, data, ticket.content_type)
+    return JsonResponse({'path': ticket.path}, status=201)
@@ -0,0 +1,95 @@
+import base64
+import binascii
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+# Refuse decompression bombs well before Pillow's own limit
+MAX_PIXELS = 40_000_000
+VARIANT_WIDTHS = (320, 640, 1080)
+PLACEHOLDER_WIDTH = 16
+
+ENCODINGS = [
+    # (format, content type, file extension, save options)
+    ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+Variant = namedtuple('Variant', ['width', 'height', 'format', 'content_type', 'extension', 'data'])
+ProcessedImage = namedtuple('ProcessedImage', ['variants', 'placeholder'])
+
+
+class ImageProcessingError(Exception):
+    """Raised when an uploaded file is not an image we accept"""
+
+
+def decode_base64_image(base64_image: str) -> bytes:
+    """Decode a base64 image, with or without a data: URL prefix"""
+    payload = base64_image.split(',', 1)[1] if ',' in base64_image else base64_image
+    try:
+        return base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise ImageProcessingError("Image is not valid base64")
+
+
+def _open(data: bytes) -> Image.Image:
+    try:
+        image = Image.open(BytesIO(data))
+    except UnidentifiedImageError:
+        raise ImageProcessingError("File is not a supported image")
+
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageProcessingError(f"Unsupported image format {image.format}")
+    if image.width * image.height > MAX_PIXELS:
+        raise ImageProcessingError("Image dimensions are too large")
+
+    # Apply the EXIF rotation before the metadata is dropped by re-encoding
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _encode(image: Image.Image, image_format: str, options: dict) -> bytes:
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    # No exif/icc arguments are passed, so the output carries no metadata
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def _resize(image: Image.Image, width: int) -> Image.Image:
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def process_image(data: bytes) -> ProcessedImage:
+    """
+    Validate an uploaded image and re-encode it into WebP and JPEG variants
+    at each of VARIANT_WIDTHS (never upscaling), plus a tiny blurred
+    placeholder returned as a data: URL that clients can show while loading.
+    """
+    image = _open(data)
+
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    variants = []
+    for width in widths:
+        resized = _resize(image, width)
+        for image_format, content_type, extension, options in ENCODINGS:
+            variants.append(Variant(
+                resized.width, resized.height, image_format, content_type, extension,
+                _encode(resized, image_format, options),
+            ))
+
+    tiny = _resize(image, PLACEHOLDER_WIDTH)
+    placeholder_bytes = _encode(tiny, 'WEBP', {'quality': 30})
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(placeholder_bytes).decode()
+
+    return ProcessedImage(variants, placeholder)
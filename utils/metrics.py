@@ -0,0 +1,166 @@
+"""
+Process-wide aggregate metrics, served in the Prometheus text format at /metrics.
+
+The GraphQL view records every request (by root field) and every detailed
+trace (by schema field, e.g. `PostType.author`), and the database connection
+pools are reported as they stand. Other components expose their own numbers by registering a
+collector, a function returning metric families as
+(name, type, help, [(labels, value), ...]).
+"""
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = defaultdict(float)
+        self.sql_queries = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.phase_seconds = defaultdict(float)
+        self.field_calls = defaultdict(int)
+        self.field_seconds = defaultdict(float)
+        self.field_sql_queries = defaultdict(int)
+        self.n_plus_one = defaultdict(int)
+        self._collectors = []
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def observe(self, tracer, failed=False):
+        """Add one finished request"""
+        duration = tracer.duration
+        fields = tracer.root_fields or ['unknown']
+        with self._lock:
+            for field in fields:
+                self.requests[field] += 1
+                if failed:
+                    self.errors[field] += 1
+                self.duration_sum[field] += duration
+                buckets = self.duration_buckets[field]
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    if duration <= bound:
+                        buckets[i] += 1
+                self.sql_queries[field] += tracer.sql_count
+                self.sql_seconds[field] += tracer.sql_time
+            for phase, elapsed in tracer.phases.items():
+                self.phase_seconds[phase] += elapsed
+
+            if tracer.detailed:
+                for path, stats in tracer.fields.items():
+                    self.field_calls[path] += stats.calls
+                    self.field_seconds[path] += stats.time
+                    self.field_sql_queries[path] += stats.sql_count
+                for path, _, _ in tracer.n_plus_one():
+                    self.n_plus_one[path] += 1
+
+    def families(self):
+        with self._lock:
+            families = [
+                ('graphql_requests_total', 'counter', 'GraphQL requests by root field',
+                 [({'field': field}, count) for field, count in self.requests.items()]),
+                ('graphql_request_errors_total', 'counter', 'GraphQL requests that returned errors, by root field',
+                 [({'field': field}, count) for field, count in self.errors.items()]),
+                ('graphql_request_sql_queries_total', 'counter', 'SQL queries run by GraphQL requests, by root field',
+                 [({'field': field}, count) for field, count in self.sql_queries.items()]),
+                ('graphql_request_sql_seconds_total', 'counter', 'Time spent in SQL by GraphQL requests, by root field',
+                 [({'field': field}, seconds) for field, seconds in self.sql_seconds.items()]),
+                ('graphql_phase_seconds_total', 'counter', 'Time spent in each phase of handling GraphQL requests',
+                 [({'phase': phase}, seconds) for phase, seconds in self.phase_seconds.items()]),
+                ('graphql_field_calls_total', 'counter', 'Resolver calls by schema field (Type.field), from traced requests',
+                 [({'path': path}, count) for path, count in self.field_calls.items()]),
+                ('graphql_field_seconds_total', 'counter', 'Resolver time by schema field (Type.field), from traced requests',
+                 [({'path': path}, seconds) for path, seconds in self.field_seconds.items()]),
+                ('graphql_field_sql_queries_total', 'counter', 'SQL queries by schema field (Type.field), from traced requests',
+                 [({'path': path}, count) for path, count in self.field_sql_queries.items()]),
+                ('graphql_n_plus_one_total', 'counter', 'Traced requests in which a field repeated the same SQL statement',
+                 [({'path': path}, count) for path, count in self.n_plus_one.items()]),
+            ]
+
+            histogram = []
+            for field, buckets in self.duration_buckets.items():
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    histogram.append(({'field': field, 'le': str(bound)}, count, '_bucket'))
+                histogram.append(({'field': field, 'le': '+Inf'}, self.requests[field], '_bucket'))
+                histogram.append(({'field': field}, self.duration_sum[field], '_sum'))
+                histogram.append(({'field': field}, self.requests[field], '_count'))
+            collectors = list(self._collectors)
+
+        families.append(('graphql_request_duration_seconds', 'histogram', 'GraphQL request duration by root field', histogram))
+        for collector in collectors:
+            families.extend(collector())
+        return families
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, samples in self.families():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ''
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text else f'{name}{suffix} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# (metric, type, help, psycopg_pool stat, scale) of the pool metrics
+POOL_METRICS = (
+    ('db_pool_size', 'gauge', 'Connections managed by the pool', 'pool_size', 1),
+    ('db_pool_available', 'gauge', 'Idle connections in the pool', 'pool_available', 1),
+    ('db_pool_waiting', 'gauge', 'Requests waiting for a connection', 'requests_waiting', 1),
+    ('db_pool_checkouts_total', 'counter', 'Connections taken from the pool', 'requests_num', 1),
+    ('db_pool_checkouts_queued_total', 'counter', 'Checkouts that had to wait for a connection', 'requests_queued', 1),
+    ('db_pool_checkout_wait_seconds_total', 'counter', 'Time spent waiting for connections', 'requests_wait_ms', 0.001),
+    ('db_pool_checkout_errors_total', 'counter', 'Checkouts that timed out or failed', 'requests_errors', 1),
+    ('db_pool_connections_lost_total', 'counter', 'Connections found broken by the health check', 'connections_lost', 1),
+    ('db_pool_returns_bad_total', 'counter', 'Connections returned in a bad state', 'returns_bad', 1),
+)
+
+
+def _collect_pool_metrics():
+    pools = []
+    for alias in connections:
+        # Only pools that already exist; connections[alias].pool would create one
+        pool = getattr(type(connections[alias]), '_connection_pools', {}).get(alias)
+        if pool is not None:
+            pools.append((alias, pool.get_stats()))
+    if not pools:
+        return []
+    return [
+        (name, kind, help_text, [({'database': alias}, stats.get(stat, 0) * scale) for alias, stats in pools])
+        for name, kind, help_text, stat, scale in POOL_METRICS
+    ]
+
+
+metrics = Metrics()
+metrics.register_collector(_collect_pool_metrics)
+
+
+def metrics_view(request):
+    """
+    Serve the metrics. With METRICS_TOKEN set, scrapers must send it as a
+    bearer token; without one the endpoint only exists when DEBUG is on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            raise Http404()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,145 @@
+import base64
+import bisect
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from graphene import relay
+from graphql import GraphQLError
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+def _cursor_value(value):
+    # Keep full microsecond precision, DjangoJSONEncoder truncates to milliseconds
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    """Encode the ordering values of a row into an opaque cursor"""
+    raw = json.dumps([_cursor_value(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor from size ordering values"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise GraphQLError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise GraphQLError('Invalid cursor')
+    return values
+
+
+def after_filter(ordering, values):
+    """
+    Build the keyset condition for rows strictly after values in a
+    descending ordering, e.g. (a < x) OR (a = x AND b < y).
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        step = Q(**{f'{field}__lt': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+
+def paginate_queryset(connection_type, queryset, first=None, after=None, ordering=('created_at', 'id'), node=None):
+    """
+    Return one page of queryset as a relay connection, newest first.
+
+    Pages are keyset based on ordering so the cost of a page does not depend
+    on how deep into the result set the cursor points. node maps a row to the
+    edge node when they differ, e.g. a Follow row to the followed user.
+    """
+    queryset = queryset.order_by(*[f'-{field}' for field in ordering])
+
+    def fetch(limit, values):
+        rows = queryset.filter(after_filter(ordering, values)) if values else queryset
+        return list(rows[:limit])
+
+    return paginate_keyset(connection_type, fetch, first=first, after=after, ordering=ordering, node=node)
+
+
+def paginate_keyset(connection_type, fetch, first=None, after=None, ordering=('created_at', 'id'), node=None):
+    """
+    Like paginate_queryset, for rows that do not come from one queryset.
+    fetch(limit, values) returns up to limit rows in descending ordering,
+    starting after the row whose ordering values are values (None for the
+    first page).
+    """
+    if first is None:
+        first = DEFAULT_PAGE_SIZE
+    if first < 0:
+        raise GraphQLError('first must be a positive number')
+    first = min(first, MAX_PAGE_SIZE)
+
+    values = decode_cursor(after, len(ordering)) if after else None
+    try:
+        rows = fetch(first + 1, values)
+    except (ValidationError, ValueError, TypeError):
+        if values is None:
+            raise
+        # Values of the wrong type for their fields
+        raise GraphQLError('Invalid cursor')
+    has_next_page = len(rows) > first
+    rows = rows[:first]
+
+    edges = [
+        connection_type.Edge(node=node(row) if node else row, cursor=encode_cursor([getattr(row, field) for field in ordering]))
+        for row in rows
+    ]
+    page_info = relay.PageInfo(
+        has_next_page=has_next_page,
+        has_previous_page=bool(after),
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    )
+    return connection_type(edges=edges, page_info=page_info)
+
+
+def paginate_ranked(connection_type, ranked, first=None, after=None, load=None):
+    """
+    Return one page of a precomputed ranking as a relay connection.
+
+    ranked is a list of (score, id) pairs sorted best first and load maps a
+    list of ids to their nodes. Cursors hold the (score, id) of the last row,
+    so a page stays in place when the ranking is rebuilt between requests.
+    Ids that load does not return (e.g. deleted rows) are skipped.
+    """
+    if first is None:
+        first = DEFAULT_PAGE_SIZE
+    if first < 0:
+        raise GraphQLError('first must be a positive number')
+    first = min(first, MAX_PAGE_SIZE)
+
+    start = 0
+    if after:
+        score, entry_id = decode_cursor(after, 2)
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (score, entry_id)):
+            raise GraphQLError('Invalid cursor')
+        # ranked is sorted best first, so the entries after the cursor start at the
+        # first one below it
+        position = (score, entry_id)
+        start = bisect.bisect_left(ranked, True, key=lambda entry: tuple(entry) < position)
+
+    window = ranked[start:start + first + 1]
+    nodes = load([entry_id for _, entry_id in window])
+    rows = [(entry, nodes[entry[1]]) for entry in window if entry[1] in nodes]
+    has_next_page = len(rows) > first or len(ranked) - start > len(window)
+    rows = rows[:first]
+
+    edges = [connection_type.Edge(node=node, cursor=encode_cursor(list(entry))) for entry, node in rows]
+    page_info = relay.PageInfo(
+        has_next_page=has_next_page,
+        has_previous_page=bool(after),
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    )
+    return connection_type(edges=edges, page_info=page_info)
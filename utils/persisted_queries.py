@@ -0,0 +1,154 @@
+"""
+Persisted queries and a cache of parsed, validated GraphQL documents.
+
+Clients may send a sha256 hash instead of the query text, following the
+automatic persisted query (APQ) protocol:
+
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "<hash>"}}}
+
+A hash is known when it is listed in settings.GRAPHQL_PERSISTED_QUERIES_FILE
+(a JSON object of hash -> query, generated from the client's operations) or
+when a client has registered it by sending the hash together with the query.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, parse, specified_rules, validate
+from graphene_django.settings import graphene_settings
+
+from .metrics import metrics
+
+APQ_VERSION = 1
+CACHE_PREFIX = 'graphql:apq:'
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache:
+    """Bounded LRU of query hash -> (document, validation errors)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schema, query):
+        key = query_hash(query)
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            # Syntax errors are cheap to find again and are not worth a cache slot
+            return None, [e]
+        errors = validate(schema, document, specified_rules, graphene_settings.MAX_VALIDATION_ERRORS)
+        entry = (document, errors)
+
+        with self._lock:
+            self._documents[key] = entry
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {'size': len(self._documents), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+_document_cache = None
+_manifest = None
+
+
+def get_document_cache(schema):
+    """The process-wide document cache, warmed with the manifest queries on first use"""
+    global _document_cache
+    if _document_cache is None:
+        cache = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+        for query in get_manifest().values():
+            cache.get(schema, query)
+        _document_cache = cache
+    return _document_cache
+
+
+def _collect_metrics():
+    cache = _document_cache
+    if cache is None:
+        return []
+    stats = cache.stats()
+    return [
+        ('graphql_document_cache_size', 'gauge', 'Parsed documents held by the document cache', [({}, stats['size'])]),
+        ('graphql_document_cache_hits_total', 'counter', 'Document cache lookups that skipped parsing', [({}, stats['hits'])]),
+        ('graphql_document_cache_misses_total', 'counter', 'Document cache lookups that parsed the query', [({}, stats['misses'])]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def get_manifest():
+    """Hash -> query for the operations shipped with our clients"""
+    global _manifest
+    if _manifest is None:
+        manifest = {}
+        if settings.GRAPHQL_PERSISTED_QUERIES_FILE:
+            with open(settings.GRAPHQL_PERSISTED_QUERIES_FILE) as f:
+                manifest = json.load(f)
+        _manifest = manifest
+    return _manifest
+
+
+def _persisted_query_extension(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise GraphQLError('Extensions are invalid JSON.')
+    if not isinstance(extensions, dict):
+        return None
+    return extensions.get('persistedQuery')
+
+
+def resolve_query(request, data, query):
+    """
+    Return the query text for a request, looking up or registering
+    persisted query hashes. Raises GraphQLError for unknown hashes.
+    """
+    persisted = _persisted_query_extension(request, data)
+    if not persisted:
+        return query
+
+    if persisted.get('version') != APQ_VERSION:
+        raise GraphQLError('Unsupported persisted query version', extensions={'code': 'PERSISTED_QUERY_NOT_SUPPORTED'})
+    sha256 = persisted.get('sha256Hash')
+    if not isinstance(sha256, str):
+        raise GraphQLError('Missing persisted query hash')
+
+    apq_cache = caches[settings.GRAPHQL_APQ_CACHE]
+    if query:
+        if query_hash(query) != sha256:
+            raise GraphQLError('Provided sha256Hash does not match query', extensions={'code': 'PERSISTED_QUERY_HASH_MISMATCH'})
+        if settings.GRAPHQL_APQ_ENABLED and sha256 not in get_manifest():
+            apq_cache.set(CACHE_PREFIX + sha256, query, settings.GRAPHQL_APQ_TTL)
+        return query
+
+    query = get_manifest().get(sha256)
+    if query is None and settings.GRAPHQL_APQ_ENABLED:
+        query = apq_cache.get(CACHE_PREFIX + sha256)
+    if query is None:
+        raise GraphQLError('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+    return query
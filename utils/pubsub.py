@@ -0,0 +1,71 @@
+"""
+Publish/subscribe used to push GraphQL subscription events.
+
+Mutations publish from synchronous code once their transaction commits, and
+websocket subscriptions consume the events from the event loop. The backend
+is chosen with ``settings.GRAPHQL_PUBSUB_BACKEND`` so the in-process default
+can be replaced by a broker backed implementation with the same interface.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class InProcessPubSub:
+    """Delivers events to subscribers living in the same process"""
+
+    # Events a slow subscriber may fall behind by before the oldest are dropped
+    max_pending = 100
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        """Send message to every subscriber of channel; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, channel, message)
+
+    def _put(self, queue, channel, message):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait((channel, message))
+
+    async def subscribe(self, *channels):
+        """Yield (channel, message) pairs published on any of channels"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_pending))
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self._lock:
+                for channel in channels:
+                    listeners = self._subscribers.get(channel)
+                    if listeners is not None:
+                        listeners.discard(subscriber)
+                        if not listeners:
+                            del self._subscribers[channel]
+
+
+_pubsub = None
+
+
+def get_pubsub():
+    """Return the process wide pub/sub backend"""
+    global _pubsub
+    if _pubsub is None:
+        _pubsub = import_string(settings.GRAPHQL_PUBSUB_BACKEND)()
+    return _pubsub
+
+
+def publish_on_commit(channel, message):
+    """Publish once the current transaction commits, so subscribers never see rolled back writes"""
+    transaction.on_commit(lambda: get_pubsub().publish(channel, message))
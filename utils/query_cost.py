@@ -0,0 +1,174 @@
+"""
+Static cost analysis for GraphQL operations.
+
+Each selected field costs its weight (1 for object fields, 0 for scalars,
+or the override in FIELD_COSTS / settings.GRAPHQL_FIELD_COSTS), and list
+fields multiply the cost of everything below them by the number of items
+they can return: the `first` argument when given, else the size listed in
+LIST_SIZES for lists the schema bounds, else the page size of the enclosing
+connection. Lists with no bound at all (e.g. feed, allUsers) count as
+settings.GRAPHQL_COST_UNBOUNDED_LIST_SIZE items, which steers clients to the
+paginated connections.
+"""
+from django.conf import settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    InlineFragmentNode,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+    is_leaf_type,
+)
+from graphql.execution.values import get_argument_values
+
+from .images import ENCODINGS, VARIANT_WIDTHS
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Fields that cost more to resolve than a plain object lookup
+FIELD_COSTS = {
+    'Query.allUsers': 5,
+    'Query.feed': 5,
+    'Query.feedConnection': 5,
+    'Query.searchPosts': 5,
+    'Query.searchUsers': 5,
+}
+
+# Lists without a `first` argument whose length the schema bounds
+LIST_SIZES = {
+    'PostType.imageVariants': len(VARIANT_WIDTHS) * len(ENCODINGS),
+    'UserProfileType.profileImageVariants': len(VARIANT_WIDTHS) * len(ENCODINGS),
+    # One result per target, at most users.schema.BULK_MAX_TARGETS
+    'FollowUsers.results': 100,
+    'UnfollowUsers.results': 100,
+    'LikePosts.results': 100,
+}
+
+
+class QueryCost:
+    """Cost and nesting depth of one operation"""
+
+    def __init__(self, cost=0, depth=0):
+        self.cost = cost
+        self.depth = depth
+
+    def as_dict(self):
+        return {
+            'requested': self.cost,
+            'maximum': settings.GRAPHQL_MAX_QUERY_COST,
+            'depth': self.depth,
+            'maximumDepth': settings.GRAPHQL_MAX_QUERY_DEPTH,
+        }
+
+
+def _list_size(coordinate, args, page_size):
+    first = args.get('first')
+    if isinstance(first, int):
+        return max(0, min(first, MAX_PAGE_SIZE))
+    if coordinate in LIST_SIZES:
+        return LIST_SIZES[coordinate]
+    return page_size or settings.GRAPHQL_COST_UNBOUNDED_LIST_SIZE
+
+
+def _field_args(field_def, node, variables):
+    try:
+        return get_argument_values(field_def, node, variables)
+    except GraphQLError:
+        # Invalid arguments are reported by the standard rules
+        return {}
+
+
+def _selection_cost(context, parent_type, selection_set, variables, page_size=None, visited=()):
+    """Return (cost, depth) of a selection set on parent_type"""
+    weights = {**FIELD_COSTS, **settings.GRAPHQL_FIELD_COSTS}
+    cost = depth = 0
+
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            field_def = getattr(parent_type, 'fields', {}).get(name)
+            if name.startswith('__') or field_def is None:
+                continue
+
+            field_type = get_nullable_type(field_def.type)
+            named_type = get_named_type(field_type)
+            coordinate = f'{parent_type.name}.{name}'
+            weight = weights.get(coordinate, 0 if is_leaf_type(named_type) else 1)
+            args = _field_args(field_def, selection, variables)
+
+            multiplier = 1
+            child_page_size = None
+            if isinstance(field_type, GraphQLList):
+                multiplier = _list_size(coordinate, args, page_size)
+            elif named_type.name.endswith('Connection'):
+                # edges below a connection are as many as the page asked for
+                child_page_size = _list_size(coordinate, args, DEFAULT_PAGE_SIZE)
+
+            child_cost = child_depth = 0
+            if selection.selection_set:
+                child_cost, child_depth = _selection_cost(
+                    context, named_type, selection.selection_set, variables, child_page_size, visited
+                )
+            cost += multiplier * (weight + child_cost)
+            depth = max(depth, child_depth + 1)
+
+        elif isinstance(selection, InlineFragmentNode):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = context.schema.get_type(selection.type_condition.name.value) or parent_type
+            child_cost, child_depth = _selection_cost(
+                context, fragment_type, selection.selection_set, variables, page_size, visited
+            )
+            cost += child_cost
+            depth = max(depth, child_depth)
+
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            fragment = context.get_fragment(name)
+            # Unknown and cyclic fragments are reported by the standard rules
+            if fragment is None or name in visited:
+                continue
+            fragment_type = context.schema.get_type(fragment.type_condition.name.value) or parent_type
+            child_cost, child_depth = _selection_cost(
+                context, fragment_type, fragment.selection_set, variables, page_size, visited + (name,)
+            )
+            cost += child_cost
+            depth = max(depth, child_depth)
+
+    return cost, depth
+
+
+def query_cost_rule(variables=None, operation_name=None, on_cost=None):
+    """
+    Build a validation rule that rejects the operation when its estimated cost
+    or depth is over the configured limits. on_cost receives the QueryCost.
+    """
+    class QueryCostRule(ValidationRule):
+        def leave_document(self, document, *args):
+            operation = get_operation_ast(document, operation_name)
+            if operation is None:
+                return
+            root_type = self.context.schema.get_root_type(operation.operation)
+            if root_type is None:
+                return
+
+            cost, depth = _selection_cost(self.context, root_type, operation.selection_set, variables or {})
+            result = QueryCost(cost, depth)
+            if on_cost:
+                on_cost(result)
+
+            if cost > settings.GRAPHQL_MAX_QUERY_COST:
+                self.report_error(GraphQLError(
+                    f"Query cost {cost} exceeds the maximum allowed cost of {settings.GRAPHQL_MAX_QUERY_COST}",
+                    operation,
+                ))
+            if depth > settings.GRAPHQL_MAX_QUERY_DEPTH:
+                self.report_error(GraphQLError(
+                    f"Query depth {depth} exceeds the maximum allowed depth of {settings.GRAPHQL_MAX_QUERY_DEPTH}",
+                    operation,
+                ))
+
+    return QueryCostRule
@@ -0,0 +1,249 @@
+"""
+Result cache for public read queries.
+
+Only queries whose root fields are all listed in CACHEABLE_FIELDS are
+cached. Each cached result is tagged with what it was built from, e.g.
+`posts:<username>` for userPosts, and the cache key includes the current
+version of every tag. Model signals (see posts/signals.py and
+users/signals.py) give a tag a new version when its data changes, which
+retires every result built from the old data at once.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from graphql import FieldNode, GraphQLError, OperationType, Visitor, print_ast, visit
+from graphql.execution.values import get_argument_values
+
+from .metrics import metrics
+
+# Root field -> (argument naming the data, tag prefix)
+CACHEABLE_FIELDS = {
+    'userProfile': ('username', 'user'),
+    'userPosts': ('username', 'posts'),
+    'userPostsConnection': ('username', 'posts'),
+    'postComments': ('postId', 'comments'),
+    'postCommentsConnection': ('postId', 'comments'),
+}
+# Fields whose value depends on who is asking
+VIEWER_FIELDS = {'isLiked', 'isFollowing', 'followsYou'}
+# Carried by every entry, for changes that can show up anywhere (e.g. usernames)
+GLOBAL_TAG = 'users'
+
+
+class LocalMemoryBackend:
+    """Per-process LRU with expiry. Invalidations only reach the process that made them"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or settings.GRAPHQL_RESPONSE_CACHE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, timeout=None):
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if key in self._entries:
+                return False
+        self.set(key, value, timeout)
+        return True
+
+
+class DjangoCacheBackend:
+    """Stores entries in one of the CACHES configured for Django, shared by all processes"""
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.GRAPHQL_RESPONSE_CACHE_ALIAS]
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.cache.add(key, value, timeout)
+
+
+def _root_fields(operation):
+    """Root field nodes, or None when the selection uses fragments at the root"""
+    fields = []
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            return None
+        if selection.name.value != '__typename':
+            fields.append(selection)
+    return fields
+
+
+class _FieldNames(Visitor):
+    def __init__(self):
+        super().__init__()
+        self.names = set()
+
+    def enter_field(self, node, *args):
+        self.names.add(node.name.value)
+
+
+class ResponseCache:
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _viewer(self, request, document):
+        names = _FieldNames()
+        visit(document, names)
+        if not names.names & VIEWER_FIELDS:
+            return 'public'
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return 'anonymous'
+
+    def _tag_versions(self, tags):
+        keys = [f'tag:{tag}' for tag in tags]
+        versions = self.backend.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Unknown (or evicted) tags start at a fresh random version, so
+                # results stored under an older version can never match again
+                self.backend.add(key, uuid.uuid4().hex)
+                versions[key] = self.backend.get(key)
+        return [versions[key] for key in keys]
+
+    def key_for(self, request, schema, document, operation, variables):
+        """Cache key for this request, or None when its result must not be cached"""
+        if operation is None or operation.operation != OperationType.QUERY:
+            return None
+        root_fields = _root_fields(operation)
+        if not root_fields:
+            return None
+
+        tags = {GLOBAL_TAG}
+        for node in root_fields:
+            if node.name.value not in CACHEABLE_FIELDS:
+                return None
+            arg_name, prefix = CACHEABLE_FIELDS[node.name.value]
+            field_def = schema.query_type.fields[node.name.value]
+            try:
+                value = get_argument_values(field_def, node, variables).get(arg_name)
+            except GraphQLError:
+                return None
+            if value is None:
+                return None
+            tags.add(f'{prefix}:{value}')
+
+        viewer = self._viewer(request, document)
+        if viewer is None:
+            return None
+
+        tags = sorted(tags)
+        raw = json.dumps(
+            [print_ast(document), operation.name and operation.name.value, variables or {}, viewer, tags, self._tag_versions(tags)],
+            sort_keys=True,
+            default=str,
+        )
+        return 'graphql:response:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data, self.timeout)
+
+    def invalidate(self, *tags):
+        """Retire every result built from these tags, once the current transaction commits"""
+        def bump():
+            for tag in tags:
+                self.backend.set(f'tag:{tag}', uuid.uuid4().hex, None)
+            self.invalidations += len(tags)
+
+        transaction.on_commit(bump)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """The configured response cache, or None when caching is disabled"""
+    global _response_cache
+    if not settings.GRAPHQL_RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        backend = import_string(settings.GRAPHQL_RESPONSE_CACHE_BACKEND)()
+        _response_cache = ResponseCache(backend, settings.GRAPHQL_RESPONSE_CACHE_TTL)
+    return _response_cache
+
+
+def invalidate(*tags):
+    cache = get_response_cache()
+    if cache is not None:
+        cache.invalidate(*tags)
+
+
+def _collect_metrics():
+    cache = _response_cache
+    if cache is None:
+        return []
+    stats = cache.stats()
+    return [
+        ('graphql_response_cache_hits_total', 'counter', 'Response cache lookups that found a result', [({}, stats['hits'])]),
+        ('graphql_response_cache_misses_total', 'counter', 'Response cache lookups that found nothing', [({}, stats['misses'])]),
+        ('graphql_response_cache_invalidations_total', 'counter', 'Response cache tags invalidated', [({}, stats['invalidations'])]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,32 @@
+"""
+Helpers shared by the user and post search.
+
+On PostgreSQL searches are served by pg_trgm and full-text GIN indexes
+(see the search index migrations). Other databases, e.g. SQLite in tests,
+fall back to plain substring matching with a coarse rank. Either way the
+indexed lookups pick at most MAX_CANDIDATES rows each, and only those are
+ranked.
+"""
+from django.db import connections, router
+from graphql import GraphQLError
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 100
+# Only the newest matches of each indexed lookup are ranked, so a query
+# matching much of a table does not compute a rank for every row
+MAX_CANDIDATES = 500
+# Language neutral text search configuration; posts are not all in English
+SEARCH_CONFIG = 'simple'
+
+
+def clean_query(query):
+    """Collapse whitespace and check the length of a search query"""
+    query = ' '.join((query or '').split())[:MAX_QUERY_LENGTH]
+    if len(query) < MIN_QUERY_LENGTH:
+        raise GraphQLError(f'Search query must be at least {MIN_QUERY_LENGTH} characters')
+    return query
+
+
+def uses_postgres(model):
+    """Whether reads of model go to a PostgreSQL database"""
+    return connections[router.db_for_read(model)].vendor == 'postgresql'
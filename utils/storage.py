@@ -1,79 +1,82 @@
-from .supabase_client import supabase
+from .images import process_image
+from .storage_backends import get_storage_backend
+from collections import namedtuple
 from datetime import datetime
 import uuid
-import base64
+
+StoredImage = namedtuple('StoredImage', ['url', 'variants', 'placeholder'])
 
 class StorageManager:
-    """Handles file uploads to Supabase Storage"""
+    """Handles file uploads to the configured storage backend (Supabase Storage in production)"""
 
     @staticmethod
-    def upload_profile_image(base64_image: str, username:str) -> str:
+    def public_url(bucket: str, path: str) -> str:
         """
-        Upload profile image to Supabase Storage
-        Returns the public URL of the uploaded image
+        Build the public URL of a stored object locally,
+        without asking the storage API for it
         """
-        try:
-            # Decode base64 image
-            image_data = base64.b64decode(base64_image.split(',')[1])
+        return get_storage_backend().public_url(bucket, path)
 
-            # Generate unique filename
-            file_ext = "jpg"
-            timestamp = datetime.now().strftime('%Y%m/%d_/%H%M:%S')
-            filename = f"profile_{username}_{timestamp}.{file_ext}"
+    @staticmethod
+    def upload_processed_image(bucket: str, prefix: str, image_data: bytes) -> StoredImage:
+        """
+        Validate and re-encode an image, upload every size/format variant
+        and return their public URLs with the inline placeholder
+        """
+        processed = process_image(image_data)
+        backend = get_storage_backend()
+
+        variants = []
+        for variant in processed.variants:
+            filename = f"{prefix}_{variant.width}w.{variant.extension}"
+            backend.put(bucket, filename, variant.data, variant.content_type)
+            variants.append({
+                "width": variant.width,
+                "height": variant.height,
+                "format": variant.format.lower(),
+                "url": backend.public_url(bucket, filename),
+            })
+
+        # The largest JPEG stays the main URL for clients that ignore variants
+        url = [v["url"] for v in variants if v["format"] == "jpeg"][-1]
+        return StoredImage(url, variants, processed.placeholder)
+
+    @staticmethod
+    def upload_profile_image(image_data: bytes, username:str) -> StoredImage:
+        """
+        Upload profile image variants to storage
+        Returns the public URLs of the uploaded images
+        """
+        try:
+            # Generate unique filename prefix
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            prefix = f"profile_{username}_{timestamp}"
+            return StorageManager.upload_processed_image('profiles', prefix, image_data)
 
-            # Upload to Supabase storage
-            result = supabase.storage \
-                .from_('profiles') \
-                .upload(filename, image_data)
-            
-            # Get public URL
-            public_url = supabase.storage \
-                .from_('profiles') \
-                .get_public_url(filename)
-            
-            return public_url
-        
         except Exception as e:
             raise Exception(f"Failed to upload profile image: {str(e)}")
-        
+
     @staticmethod
-    def upload_post_image(base64_image:str, user_id: str) -> str:
+    def upload_post_image(image_data: bytes, user_id: str) -> StoredImage:
         """
-        Upload post image to Supabase Storage
-        Returns the public URL of the uploaded image
+        Upload post image variants to storage
+        Returns the public URLs of the uploaded images
         """
         try:
-            # Decode base64 image
-            image_data = base64.b64decode(base64_image.split(',')[1])
-
-            # Generate unique filename
-            file_ext = "jpg"
-            timestamp = datetime.now().strftime('%Y%m/%d_/%H%M:%S')
+            # Generate unique filename prefix
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             unique_id = str(uuid.uuid4())[:8]
-            filename = f"post_{user_id}_{timestamp}_{unique_id}.{file_ext}"
+            prefix = f"post_{user_id}_{timestamp}_{unique_id}"
+            return StorageManager.upload_processed_image('posts', prefix, image_data)
 
-             # Upload to Supabase storage
-            result = supabase.storage \
-                .from_('posts') \
-                .upload(filename, image_data)
-            
-            # Get public URL
-            public_url = supabase.storage \
-                .from_('posts') \
-                .get_public_url(filename)
-            
-            return public_url
-        
         except Exception as e:
-            raise Exception(f"Failed to upload profile image: {str(e)}")
+            raise Exception(f"Failed to upload post image: {str(e)}")
 
-@staticmethod
-def delete_image(bucket: str, path: str) -> bool:
-    """Delete image from storage"""
-    try:
-        supabase.storage \
-            .from_(bucket) \
-            .remove([path])
-        return True
-    except Exception as e:
-        raise Exception(f"Failed to delete image: {str(e)}")
+    @staticmethod
+    def delete_image(bucket: str, path: str) -> bool:
+        """Delete image from storage"""
+        try:
+            get_storage_backend().delete(bucket, path)
+            return True
+        except Exception as e:
+            raise Exception(f"Failed to delete image: {str(e)}")
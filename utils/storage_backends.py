@@ -0,0 +1,93 @@
+"""
+Object storage backends used by StorageManager.
+
+SupabaseStorageBackend is used in production. LocalStorageBackend keeps
+objects on disk and accepts direct uploads through the /uploads/ view so
+the whole upload flow can run offline.
+"""
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+
+class SupabaseStorageBackend:
+    """Stores objects in Supabase Storage buckets"""
+
+    @property
+    def client(self):
+        from .supabase_client import supabase
+        return supabase
+
+    def put(self, bucket, path, data, content_type):
+        self.client.storage \
+            .from_(bucket) \
+            .upload(path, data, {"content-type": content_type, "cache-control": "31536000"})
+
+    def get(self, bucket, path):
+        return self.client.storage.from_(bucket).download(path)
+
+    def size(self, bucket, path):
+        """Stored size in bytes, from the object's metadata"""
+        info = self.client.storage.from_(bucket).info(path)
+        size = info.get('size')
+        if size is None:
+            size = info.get('metadata', {}).get('size', 0)
+        return int(size)
+
+    def delete(self, bucket, path):
+        self.client.storage.from_(bucket).remove([path])
+
+    def public_url(self, bucket, path):
+        return f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{bucket}/{path}"
+
+    def create_upload_target(self, bucket, path, upload_id):
+        """
+        Signed URL the client can PUT the file to. Supabase does not limit the
+        size per URL, so the size is enforced again when the upload is finalized.
+        """
+        signed = self.client.storage.from_(bucket).create_signed_upload_url(path)
+        return {"url": signed["signed_url"], "method": "PUT"}
+
+
+class LocalStorageBackend:
+    """Stores objects under settings.LOCAL_STORAGE_ROOT, for development and tests"""
+
+    def _file(self, bucket, path):
+        root = Path(settings.LOCAL_STORAGE_ROOT).resolve()
+        target = (root / bucket / path).resolve()
+        if root not in target.parents:
+            raise ValueError("Invalid storage path")
+        return target
+
+    def put(self, bucket, path, data, content_type):
+        target = self._file(bucket, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+    def get(self, bucket, path):
+        return self._file(bucket, path).read_bytes()
+
+    def size(self, bucket, path):
+        return self._file(bucket, path).stat().st_size
+
+    def delete(self, bucket, path):
+        self._file(bucket, path).unlink(missing_ok=True)
+
+    def public_url(self, bucket, path):
+        return f"{settings.LOCAL_STORAGE_URL}{bucket}/{path}"
+
+    def create_upload_target(self, bucket, path, upload_id):
+        return {"url": reverse('local-upload', args=[upload_id]), "method": "PUT"}
+
+
+_backend = None
+
+
+def get_storage_backend():
+    """Return the configured storage backend"""
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.STORAGE_BACKEND)()
+    return _backend
@@ -0,0 +1,164 @@
+"""
+Per-request tracing of GraphQL operations.
+
+Every request gets a Tracer that counts the SQL it runs and times the view's
+phases (authentication, parsing, validation, execution, serialization).
+Detailed tracing additionally times each resolver and attributes SQL to the
+field being resolved. Fields are grouped by schema coordinate, their parent
+type and name (e.g. `PostType.author`), never by the response path, which
+holds client chosen aliases and would give the metrics unbounded labels. A
+field that runs the same SQL statement at least GRAPHQL_N_PLUS_ONE_THRESHOLD
+times is reported as an N+1.
+
+A request is traced in detail when it sends the GRAPHQL_TRACING_HEADER and
+tracing is allowed for it (settings.GRAPHQL_TRACING_ALLOWED or a staff
+user), in which case the trace is returned in `extensions.tracing`, or when
+it is picked for the GRAPHQL_TRACING_SAMPLE_RATE, which only feeds the
+aggregate metrics.
+"""
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class FieldStats:
+    __slots__ = ('calls', 'time', 'max_time', 'sql_count', 'sql_time')
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'durationMs': _ms(self.time),
+            'maxMs': _ms(self.max_time),
+            'sqlCount': self.sql_count,
+            'sqlMs': _ms(self.sql_time),
+        }
+
+
+class Tracer:
+    def __init__(self):
+        self.detailed = False
+        # Whether the trace goes into the response extensions
+        self.report = False
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.root_fields = []
+        self.failed = False
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.fields = {}
+        self._statements = {}
+        self._current = None
+
+    def configure(self, request):
+        """Decide how much of an (authenticated) request to trace"""
+        requested = settings.GRAPHQL_TRACING_HEADER in request.headers
+        user = getattr(request, 'user', None)
+        allowed = settings.GRAPHQL_TRACING_ALLOWED or (user is not None and user.is_staff)
+        if requested and allowed:
+            self.detailed = self.report = True
+        elif settings.GRAPHQL_TRACING_SAMPLE_RATE > 0:
+            self.detailed = random.random() < settings.GRAPHQL_TRACING_SAMPLE_RATE
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    @contextmanager
+    def capture_sql(self):
+        """Count the SQL run on every database connection of this thread"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self._execute))
+            yield
+
+    def _execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_time += elapsed
+            if self.detailed and self._current is not None:
+                stats = self.fields[self._current]
+                stats.sql_count += 1
+                stats.sql_time += elapsed
+                key = (self._current, sql)
+                self._statements[key] = self._statements.get(key, 0) + 1
+
+    def resolve(self, next, root, info, kwargs):
+        """Run a resolver, timing it and attributing its SQL to its field"""
+        path = f'{info.parent_type.name}.{info.field_name}'
+        stats = self.fields.get(path)
+        if stats is None:
+            stats = self.fields[path] = FieldStats()
+
+        parent = self._current
+        self._current = path
+        started = time.perf_counter()
+        try:
+            result = next(root, info, **kwargs)
+            # Querysets run when the list is completed; run them here so the SQL counts for this field
+            if isinstance(result, QuerySet):
+                result = list(result)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            self._current = parent
+            stats.calls += 1
+            stats.time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+    def n_plus_one(self):
+        """(field, sql, count) for statements a field repeated at least the threshold"""
+        threshold = settings.GRAPHQL_N_PLUS_ONE_THRESHOLD
+        return [
+            (path, sql, count)
+            for (path, sql), count in self._statements.items()
+            if count >= threshold
+        ]
+
+    def as_dict(self):
+        return {
+            'durationMs': _ms(self.duration),
+            'phases': {name: _ms(elapsed) for name, elapsed in self.phases.items()},
+            'sql': {'count': self.sql_count, 'durationMs': _ms(self.sql_time)},
+            'fields': {
+                path: stats.as_dict()
+                for path, stats in sorted(self.fields.items(), key=lambda item: item[1].time, reverse=True)
+            },
+            'nPlusOne': [{'field': path, 'sql': sql, 'count': count} for path, sql, count in self.n_plus_one()],
+        }
+
+
+class TracingMiddleware:
+    """Graphene middleware timing resolvers of requests traced in detail"""
+
+    def resolve(self, next, root, info, **kwargs):
+        tracer = getattr(info.context, 'graphql_tracer', None)
+        if tracer is None or not tracer.detailed:
+            return next(root, info, **kwargs)
+        return tracer.resolve(next, root, info, kwargs)